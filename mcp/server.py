@@ -57,10 +57,11 @@ from tools.kanban import (
     _board_path,
     KANBANIA_PATH,
 )
-from tools.aws_inventory import run_inventory
+from tools.aws_inventory import run_inventory, run_inventory_fanout
 from tools.cloudwatch import run_cloudwatch
-from tools.ssm import run_ssm_diagnose
+from tools.ssm import run_ssm_diagnose, run_ssm_fleet_diagnose
 from tools.analyzer import run_analysis
+from tools.thresholds import load_thresholds
 from tools.report_builder import list_generated_files, get_phase_labels
 from tools.pdf_generator import generate_infra_pdf
 
@@ -247,9 +248,13 @@ def aws_inventory(
     docs_dir: str,
     task_id: str,
     repo_path: str = "",
+    aws_profiles: list[str] | None = None,
+    regions: list[str] | None = None,
+    filter_by_tag: bool = True,
 ) -> dict:
     """
     Executa inventario de recursos AWS (EC2, ALB/NLB, EBS, RDS).
+    Com aws_profiles e/ou regions, coleta todas as combinacoes em paralelo (fan-out).
 
     Args:
         project:      Slug do projeto kanbania
@@ -259,21 +264,37 @@ def aws_inventory(
         docs_dir:     Diretorio de saida dos .md
         task_id:      ID da task de inventario (TASK-NNNN)
         repo_path:    Caminho do repositorio Terraform (opcional, para comparativo)
+        aws_profiles: Lista de profiles para fan-out (opcional, padrao [aws_profile])
+        regions:      Lista de regioes para fan-out (opcional, padrao [region])
+        filter_by_tag: Aplica o filtro de tag de ambiente, se habilitado no config/inventory.yaml
 
     Returns:
-        dict com resource_ids e caminho do arquivo gerado
+        dict com resource_ids, caminho do arquivo gerado e tempo (s) de cada coletor em timings.
+        No fan-out: IDs combinados e targets com os IDs de cada profile/regiao.
     """
     claim_task(task_id, project)
 
     try:
-        result = run_inventory(
-            project=project,
-            aws_profile=aws_profile,
-            region=region,
-            environment=environment,
-            docs_dir=docs_dir,
-            repo_path=repo_path,
-        )
+        if aws_profiles or regions:
+            result = run_inventory_fanout(
+                project=project,
+                aws_profiles=aws_profiles or [aws_profile],
+                regions=regions or [region],
+                environment=environment,
+                docs_dir=docs_dir,
+                repo_path=repo_path,
+                filter_by_tag=filter_by_tag,
+            )
+        else:
+            result = run_inventory(
+                project=project,
+                aws_profile=aws_profile,
+                region=region,
+                environment=environment,
+                docs_dir=docs_dir,
+                repo_path=repo_path,
+                filter_by_tag=filter_by_tag,
+            )
         complete_task(task_id, project, f"Inventario concluido: {result['output_path']}")
         result["task_id"] = task_id
         result["next_step"] = (
@@ -304,6 +325,10 @@ def cloudwatch_metrics(
     ebs_ids: list[str],
     rds_ids: list[str],
     period_days: int = 14,
+    max_concurrency: int = 8,
+    use_cache: bool = True,
+    discover: bool = True,
+    stream: bool = False,
 ) -> dict:
     """
     Coleta metricas CloudWatch dos ultimos N dias.
@@ -319,7 +344,12 @@ def cloudwatch_metrics(
         alb_arns:     Lista de ARNs de load balancers
         ebs_ids:      Lista de IDs de volumes EBS
         rds_ids:      Lista de IDs de instancias RDS
-        period_days:  Numero de dias para coleta (default: 14)
+        period_days:  Numero de dias para coleta (default: 14; resolucao ajustada ao tamanho da janela)
+        max_concurrency: Chamadas CloudWatch simultaneas (default: 8)
+        use_cache:    Reaproveita datapoints ja coletados (cache em <docs>/.cache/)
+        discover:     Consulta apenas metricas existentes por recurso (ListMetrics; ignorado acima de 14 dias)
+        stream:       Grava relatorio e registros incrementalmente (frotas grandes);
+                      retorna records_path em vez das listas de metricas
 
     Returns:
         dict com metricas e caminho do arquivo gerado
@@ -338,6 +368,10 @@ def cloudwatch_metrics(
             ebs_ids=ebs_ids,
             rds_ids=rds_ids,
             period_days=period_days,
+            max_concurrency=max_concurrency,
+            use_cache=use_cache,
+            discover=discover,
+            stream=stream,
         )
         complete_task(task_id, project, f"Metricas CloudWatch coletadas: {result['output_path']}")
         result["task_id"] = task_id
@@ -363,11 +397,18 @@ def ssm_diagnose(
     environment: str,
     docs_dir: str,
     task_id: str,
-    instance_id: str,
+    instance_id: str = "",
     checks: list[str] | None = None,
+    instance_ids: list[str] | None = None,
+    target_tags: dict[str, list[str]] | None = None,
+    max_concurrency: str = "10",
+    max_errors: str = "25%",
+    compress_output: bool = True,
+    sample_seconds: int = 0,
 ) -> dict:
     """
     Executa diagnostico remoto via SSM Session Manager.
+    Com instance_ids ou target_tags, diagnostica a frota numa unica chamada.
 
     Args:
         project:      Slug do projeto kanbania
@@ -379,22 +420,48 @@ def ssm_diagnose(
         instance_id:  ID da instancia EC2 alvo (ex: 'i-0abc1234')
         checks:       Categorias de diagnostico: ['sistema', 'mongodb', 'docker']
                       Default: todas as categorias
+        instance_ids: Lista de instancias para o modo frota (opcional)
+        target_tags:  Seletor por tags para o modo frota, ex: {'Role': ['api']} (opcional)
+        max_concurrency: MaxConcurrency do SendCommand no modo frota (ex: '10' ou '20%')
+        max_errors:   MaxErrors do SendCommand no modo frota (ex: '25%')
+        compress_output: Saida em gzip+base64 (sem o limite de 24KB do SSM)
+        sample_seconds: Janela (s) de amostragem do host com vmstat/iostat a cada segundo
+                      (0 = desligado; max 600). Percentis vao para o analyze_and_report
 
     Returns:
-        dict com resultados SSM e caminho do arquivo gerado
+        dict com resultados SSM e caminho do arquivo gerado.
+        No modo frota: resultados por instancia e comparativo (summary).
     """
     claim_task(task_id, project)
 
     try:
-        result = run_ssm_diagnose(
-            project=project,
-            aws_profile=aws_profile,
-            region=region,
-            environment=environment,
-            instance_id=instance_id,
-            docs_dir=docs_dir,
-            checks=checks,
-        )
+        if instance_ids or target_tags:
+            result = run_ssm_fleet_diagnose(
+                project=project,
+                aws_profile=aws_profile,
+                region=region,
+                environment=environment,
+                docs_dir=docs_dir,
+                instance_ids=instance_ids,
+                target_tags=target_tags,
+                checks=checks,
+                max_concurrency=max_concurrency,
+                max_errors=max_errors,
+                compress=compress_output,
+                sample_seconds=sample_seconds,
+            )
+        else:
+            result = run_ssm_diagnose(
+                project=project,
+                aws_profile=aws_profile,
+                region=region,
+                environment=environment,
+                instance_id=instance_id,
+                docs_dir=docs_dir,
+                checks=checks,
+                compress=compress_output,
+                sample_seconds=sample_seconds,
+            )
         complete_task(task_id, project, f"Diagnostico SSM concluido: {result['output_path']}")
         result["task_id"] = task_id
         result["next_step"] = (
@@ -422,6 +489,10 @@ def analyze_and_report(
     ebs_metrics: list | None = None,
     rds_metrics: list | None = None,
     ssm_results: dict | None = None,
+    metrics_path: str = "",
+    nlb_metrics: list | None = None,
+    series_path: str = "",
+    load_balancers: list | None = None,
 ) -> dict:
     """
     Analisa os dados coletados, detecta anomalias e gera relatorio consolidado.
@@ -436,10 +507,22 @@ def analyze_and_report(
         ebs_metrics:  Metricas EBS
         rds_metrics:  Metricas RDS
         ssm_results:  Resultados SSM (output de ssm_diagnose)
+        metrics_path: records_path de cloudwatch_metrics(stream=True), no lugar das listas
+        nlb_metrics:  Metricas NLB
+        series_path:  series_path de cloudwatch_metrics para os baselines
+                      (default: series-cloudwatch.jsonl do docs_dir, se existir)
+        load_balancers: load_balancers de aws_inventory; traz os targets nao
+                      saudaveis dos NLBs (regra nlb.unhealthy_targets_critical)
 
     Returns:
         dict com anomalias, contagens e caminho do relatorio
     """
+    # Thresholds invalidos falham antes de a task ser movida
+    try:
+        load_thresholds(project, environment)
+    except (OSError, ValueError) as e:
+        return {"error": f"Configuracao de thresholds invalida: {e}", "task_id": task_id}
+
     claim_task(task_id, project)
 
     try:
@@ -451,6 +534,11 @@ def analyze_and_report(
             ebs_metrics=ebs_metrics,
             rds_metrics=rds_metrics,
             ssm_results=ssm_results,
+            metrics_path=metrics_path,
+            nlb_metrics=nlb_metrics,
+            project=project,
+            series_path=series_path,
+            load_balancers=load_balancers,
         )
         complete_task(task_id, project, f"Analise concluida: {result['output_path']}")
         result["task_id"] = task_id
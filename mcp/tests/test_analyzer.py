@@ -0,0 +1,37 @@
+import pytest
+
+from tools.analyzer import _is_fleet_results, analyze_nlb, analyze_ssm_output
+
+MONGO_FULL_CACHE = {"mongodb": {"mongo_wiredtiger": "cache bytes: 99 / 100"}}
+
+
+def test_single_host_results_are_not_fleet():
+    assert not _is_fleet_results({"sistema": {"uptime": "up 3 days"}})
+    assert not _is_fleet_results({})
+
+
+@pytest.mark.parametrize("iid", ["i-0abc", "mi-0abc"])
+def test_fleet_results_detected_by_structure(iid):
+    results = {iid: MONGO_FULL_CACHE, "i-0def": {"sistema": {"uptime": "up"}}}
+    assert _is_fleet_results(results)
+    anomalies = analyze_ssm_output(results, {})
+    assert [(a["resource"], a["severity"]) for a in anomalies] == [(iid, "critical")]
+
+
+def test_nlb_target_health_merged_from_inventory():
+    from tools.analyzer import _with_target_health
+
+    arn = "arn:aws:elasticloadbalancing:us-east-1:1:loadbalancer/net/api/abc"
+    lbs = [
+        {"name": "api", "type": "network", "arn": arn, "targets_unhealthy": 2},
+        {"name": "solo", "type": "network", "arn": arn + "2", "targets_unhealthy": 0},
+        {"name": "web", "type": "application", "arn": "alb-arn", "targets_unhealthy": 5},
+    ]
+    records = _with_target_health([{"lb_name": "api", "lb_arn": arn, "active_flows": {"avg": 10}}], lbs)
+    assert [(r["lb_name"], r["targets_unhealthy"]) for r in records] == [("api", 2), ("solo", 0)]
+    assert records[0]["active_flows"] == {"avg": 10}
+
+    anomalies = analyze_nlb(records, {"nlb": {"unhealthy_targets_critical": 1}})
+    assert [(a["resource"], a["metric"], a["severity"]) for a in anomalies] == [
+        ("api", "UnHealthyHostCount", "critical"),
+    ]
@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("boto3")
+
+from tools import aws_inventory
+
+
+class _Client:
+    def __init__(self, **responses):
+        self.responses = responses
+
+    def __getattr__(self, name):
+        return lambda **kwargs: self.responses[name]
+
+
+class _Session:
+    def __init__(self, **clients):
+        self.clients = clients
+
+    def client(self, service):
+        return self.clients[service]
+
+
+TAG_FILTER = {"key": "Environment", "values": ["prd"]}
+
+
+def test_tag_filter_is_opt_in():
+    assert aws_inventory.load_tag_filter("projeto-qualquer", "prd") is None
+
+
+def test_filter_warning_when_filter_drops_everything():
+    session = _Session(
+        ec2=_Client(
+            describe_instances={"Reservations": [{"Instances": [{"InstanceId": "i-1"}]}]},
+            describe_volumes={"Volumes": []},
+        ),
+        elbv2=_Client(describe_load_balancers={"LoadBalancers": []}),
+        rds=_Client(describe_db_instances={"DBInstances": []}),
+    )
+    collected = {"ec2": [], "alb": [], "ebs": [], "rds": []}
+    warnings = aws_inventory._filter_warnings(session, collected, TAG_FILTER)
+    assert len(warnings) == 1 and warnings[0].startswith("Instancias EC2")
+
+
+def test_no_warning_without_filter_or_with_results():
+    collected = {"ec2": ["x"], "alb": ["x"], "ebs": ["x"], "rds": ["x"]}
+    assert aws_inventory._filter_warnings(None, collected, None) == []
+    assert aws_inventory._filter_warnings(_Session(), collected, TAG_FILTER) == []
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+import pytest
+
+from tools.baselines import (
+    BASELINE_LABELS,
+    BASELINE_METRICS,
+    DEFAULTS,
+    TZ_BR,
+    _seasonal_baseline,
+    _slot_columns,
+    _step_change,
+    detect_baseline_anomalies,
+)
+from tools.metric_series import SeriesTable
+
+# Segunda-feira 00h BRT
+MONDAY = int(datetime(2026, 1, 5, tzinfo=TZ_BR).timestamp())
+CPU = ("ec2", "i-0abc", "cpu")
+CPU_SPEC = BASELINE_METRICS[("ec2", "cpu")]
+
+
+def _table(values: list[float]) -> SeriesTable:
+    table = SeriesTable(3600)
+    table.append(CPU, [MONDAY + 3600 * i for i in range(len(values))], values)
+    return table
+
+
+def _cpu(hours: int) -> list[float]:
+    """CPU com ciclo diario (20% de madrugada, 30% no horario comercial) e ruido pequeno."""
+    return [(30.0 if 9 <= i % 24 < 18 else 20.0) + i % 3 for i in range(hours)]
+
+
+def _step(values: list[float], direction: str = "up"):
+    table = _table(values)
+    _, day_col = _slot_columns(table)
+    spec = CPU_SPEC[:2] + (direction,) + CPU_SPEC[3:]
+    return _step_change(table, 0, table.offsets[1], day_col, 24, DEFAULTS, spec)
+
+
+def test_step_change_found_at_level_shift():
+    values = _cpu(10 * 24)
+    shift = 6 * 24 + 5
+    values[shift:] = [v + 30 for v in values[shift:]]
+    ts, before, after = _step(values)
+    assert ts == MONDAY + 3600 * shift
+    assert before == pytest.approx(21, abs=2)
+    assert after == pytest.approx(51, abs=2)
+
+
+def test_step_change_ignores_stable_series_and_good_direction():
+    assert _step(_cpu(10 * 24)) is None
+    values = _cpu(10 * 24)
+    values[5 * 24:] = [v / 4 for v in values[5 * 24:]]
+    # CPU caindo nao e ruim para a metrica ("up")
+    assert _step(values) is None
+    assert _step(values, direction="both") is not None
+
+
+def test_step_change_needs_min_segment_on_both_sides():
+    values = _cpu(10 * 24)
+    values[-10:] = [90.0] * 10
+    assert _step(values) is None
+
+
+def test_seasonal_baseline_falls_back_from_week_to_day_to_overall():
+    values = [10.0, 12.0, 50.0, 30.0]
+    lookup = _seasonal_baseline(values, [0, 0, 24, 1], [0, 0, 0, 1], min_points=2)
+    assert lookup(0, 0) == (11.0, 1.0, "week")
+    # Slot 24 (terca 00h) tem 1 ponto: vale a hora do dia 0
+    assert lookup(24, 0) == (12.0, 2.0, "day")
+    assert lookup(100, 7)[2] == "overall"
+
+
+def test_single_point_week_slot_borrows_hour_of_day_spread():
+    # Slot 1 (segunda 01h) com um ponto; a hora do dia 1 tem mais dois, de outros dias
+    lookup = _seasonal_baseline([40.0, 10.0, 16.0], [1, 25, 49], [1, 1, 1], min_points=1)
+    assert lookup(1, 1) == (40.0, 6.0, "week")
+
+
+@pytest.mark.parametrize("days, baseline", [(21, "week"), (15, "week"), (14, "week"), (6, "day")])
+def test_deviation_records_baseline_used(days, baseline):
+    values = _cpu(days * 24)
+    for i in range(len(values) - 20, len(values) - 15):
+        values[i] = 95.0
+    anomalies = detect_baseline_anomalies(_table(values), {"baseline": {"min_slot_points": 2}})
+    assert [(a["metric"], a["baseline"]) for a in anomalies] == [
+        ("CPUUtilization (desvio do baseline)", baseline),
+    ]
+    assert f"mediana da {BASELINE_LABELS[baseline]}" in anomalies[0]["description"]
+
+
+def test_step_change_anomaly_uses_hour_of_day_baseline():
+    values = _cpu(10 * 24)
+    values[6 * 24:] = [v + 30 for v in values[6 * 24:]]
+    anomalies = detect_baseline_anomalies(_table(values), {})
+    assert [(a["metric"], a["baseline"]) for a in anomalies] == [("CPUUtilization (mudanca de nivel)", "day")]
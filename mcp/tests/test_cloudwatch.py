@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("boto3")
+
+from tools import cloudwatch
+
+
+class _Cw:
+    """Cliente falso: ListMetrics devolve so CPUUtilization de i-1; GetMetricData vem vazio."""
+
+    def __init__(self):
+        self.listed: list[dict] = []
+        self.queried: list[str] = []
+
+    def list_metrics(self, **kwargs):
+        self.listed.append(kwargs)
+        if kwargs["MetricName"] != "CPUUtilization":
+            return {"Metrics": []}
+        return {"Metrics": [{"Dimensions": [{"Name": "InstanceId", "Value": "i-1"}]}]}
+
+    def get_metric_data(self, **kwargs):
+        self.queried += [q["MetricStat"]["Metric"]["MetricName"] for q in kwargs["MetricDataQueries"]]
+        return {"MetricDataResults": []}
+
+
+def _collect(cw, period_days):
+    index = cloudwatch.MetricIndex(cw, cloudwatch.TokenBucket(1000))
+    return list(cloudwatch.iter_metrics(cw, {"ec2": ["i-1"]}, period_days, index=index))
+
+
+def test_discovery_filters_list_metrics_by_id_dimension():
+    cw = _Cw()
+    (_, _, record), = _collect(cw, 14)
+    assert cw.listed and all(call["Dimensions"] == [{"Name": "InstanceId"}] for call in cw.listed)
+    assert set(cw.queried) == {"CPUUtilization"}
+    assert record["credit_balance"]["skipped"]
+
+
+def test_windows_longer_than_list_metrics_retention_skip_discovery():
+    cw = _Cw()
+    (_, _, record), = _collect(cw, cloudwatch.LIST_METRICS_MAX_DAYS + 1)
+    assert cw.listed == []
+    assert set(cw.queried) == {name for _, name, _ in cloudwatch.METRIC_SPECS["ec2"]["metrics"]}
+    assert not any(isinstance(v, dict) and v.get("skipped") for v in record.values())
@@ -0,0 +1,18 @@
+from tools.host_sampling import parse_host_samples, sample_percentiles
+
+OUTPUT = "\n".join(["N 2", "V 4 50 5", "V 2 90 1", "lixo", "V x 1 1", "D 30.5", "D 80"])
+
+
+def test_parse_host_samples_skips_malformed_lines():
+    samples = parse_host_samples(OUTPUT)
+    assert samples["vcpus"] == 2
+    assert samples["cpu_busy"] == [50.0, 90.0]
+    assert samples["run_queue"] == [4.0, 2.0]
+    assert samples["disk_util"] == [30.5, 80.0]
+
+
+def test_sample_percentiles_nearest_rank_and_run_queue_per_cpu():
+    stats = sample_percentiles(parse_host_samples(OUTPUT))
+    assert stats["cpu_busy"] == {"p50": 50.0, "p90": 90.0, "p99": 90.0, "max": 90.0, "samples": 2}
+    assert stats["run_queue_per_cpu"]["max"] == 2.0
+    assert set(stats) == {"cpu_busy", "iowait", "run_queue", "disk_util", "run_queue_per_cpu"}
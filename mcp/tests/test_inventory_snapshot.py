@@ -0,0 +1,24 @@
+from tools.inventory_snapshot import SectionCache, code_digest
+
+
+def test_section_cache_reused_only_by_same_renderer(tmp_path):
+    path = str(tmp_path / "sections.json")
+    cache = SectionCache(path, "v1")
+    assert cache.render("d1", lambda: ["## EC2 (formato antigo)"]) == ["## EC2 (formato antigo)"]
+    cache.save()
+
+    same = SectionCache(path, "v1")
+    assert same.render("d1", lambda: ["nao usado"]) == ["## EC2 (formato antigo)"]
+    assert same.hits == 1
+
+    changed = SectionCache(path, "v2")
+    assert changed.render("d1", lambda: ["## EC2", "Total: 1"]) == ["## EC2", "Total: 1"]
+    assert changed.hits == 0
+
+
+def test_code_digest_follows_source(tmp_path):
+    source = tmp_path / "builder.py"
+    source.write_text("def section(): return ['a']\n")
+    before = code_digest(str(source))
+    source.write_text("def section(): return ['b']\n")
+    assert code_digest(str(source)) != before
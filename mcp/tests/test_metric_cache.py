@@ -0,0 +1,31 @@
+import sqlite3
+
+from tools import metric_cache
+from tools.metric_cache import MetricCache
+
+
+def _last_access(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT last_access FROM series").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_read_persists_last_access(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    monkeypatch.setattr(metric_cache.time, "time", lambda: 1000)
+    cache = MetricCache(path, scope="p/r")
+    cache.store("k", [0, 3600], [1.0, 2.0], 0, 7200)
+
+    monkeypatch.setattr(metric_cache.time, "time", lambda: 5000)
+    assert cache.read("k", 0, 7200) == ([0, 3600], [1.0, 2.0])
+    cache.close()
+
+    assert _last_access(path) == 5000
+
+
+def test_read_missing_series(tmp_path):
+    cache = MetricCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.read("nada", 0, 3600) == ([], [])
+    cache.close()
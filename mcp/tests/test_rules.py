@@ -0,0 +1,110 @@
+import pytest
+
+from tools import rules
+
+CONFIG = {
+    "ec2": {
+        "label": "EC2",
+        "id": ["name", "instance_id"],
+        "rules": [
+            {"metric": "CPU", "path": "cpu.avg", "threshold": "cpu_critical", "severity": "critical",
+             "unit": "%", "group": "cpu", "description": "CPU critica em {resource}: {value}"},
+            {"metric": "CPU", "path": "cpu.avg", "threshold": "cpu_warning", "severity": "medium",
+             "unit": "%", "group": "cpu"},
+            {"metric": "Credits", "path": "credits.avg", "op": "<", "threshold": "credits_min",
+             "default": 50, "severity": "high", "decimals": 0},
+            {"metric": "NetworkIn", "path": "net.avg", "threshold": "net_mb", "severity": "low",
+             "scale": 0.5, "unit": " MB", "decimals": 0, "suffix": " avg"},
+        ],
+    },
+}
+THRESHOLDS = {"ec2": {"cpu_critical": 80, "cpu_warning": 50, "net_mb": 100}}
+
+
+def _plan():
+    return rules.compile_rules(CONFIG, THRESHOLDS)["ec2"]
+
+
+def test_group_keeps_only_first_rule_per_resource():
+    records = [
+        {"instance_id": "i-1", "cpu": {"avg": 90}},
+        {"instance_id": "i-2", "cpu": {"avg": 60}},
+        {"instance_id": "i-3", "cpu": {"avg": 10}},
+    ]
+    found = [(a["resource"], a["severity"]) for a in rules.evaluate_plan(_plan(), records)]
+    assert found == [("i-1", "critical"), ("i-2", "medium")]
+
+
+def test_missing_and_non_numeric_values_never_fire():
+    records = [
+        {"instance_id": "i-1"},
+        {"instance_id": "i-2", "cpu": {"avg": None}, "credits": {"avg": True}},
+        {"instance_id": "i-3", "cpu": "90", "credits": {}},
+    ]
+    assert rules.evaluate_plan(_plan(), records) == []
+
+
+def test_anomalies_ordered_by_resource_then_rule():
+    records = [
+        {"instance_id": "i-1", "net": {"avg": 300}},
+        {"instance_id": "i-2", "cpu": {"avg": 95}, "credits": {"avg": 3}, "net": {"avg": 400}},
+    ]
+    found = [(a["resource"], a["metric"]) for a in rules.evaluate_plan(_plan(), records)]
+    assert found == [("i-1", "NetworkIn"), ("i-2", "CPU"), ("i-2", "Credits"), ("i-2", "NetworkIn")]
+
+
+def test_scale_format_and_resource_name():
+    records = [{"name": "web", "instance_id": "i-1", "cpu": {"avg": 81.26}, "net": {"avg": 300}}]
+    cpu, net = rules.evaluate_plan(_plan(), records)
+    assert cpu["resource"] == "web"
+    assert cpu["value"] == "81.3%"
+    assert cpu["threshold"] == ">= 80%"
+    assert cpu["description"] == "CPU critica em web: 81.3%"
+    # 300 * 0.5 = 150 MB contra o limite de 100
+    assert net["value"] == "150 MB avg"
+    assert net["description"] == "NetworkIn em web: 150 MB"
+
+
+def test_default_limit_used_when_threshold_missing():
+    credits = _plan().rules[2]
+    assert (credits.op, credits.limit) == ("<", 50)
+
+
+@pytest.mark.parametrize("change, error", [
+    ({"op": "=="}, "comparador invalido"),
+    ({"severity": "urgent"}, "severidade invalida"),
+    ({"threshold": "nao_existe"}, "ausente ou nao numerico"),
+])
+def test_compile_errors_point_to_rule(change, error):
+    config = {"ec2": {**CONFIG["ec2"], "rules": [{**CONFIG["ec2"]["rules"][0], **change}]}}
+    with pytest.raises(ValueError, match=rf"ec2\.rules\[0\] \(CPU\): .*{error}"):
+        rules.compile_rules(config, THRESHOLDS)
+
+
+def test_shipped_rules_compile_against_shipped_thresholds():
+    import yaml
+
+    with open(rules.RULES_PATH, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    with open(rules.RULES_PATH.replace("rules.yaml", "thresholds.yaml"), encoding="utf-8") as f:
+        thresholds = yaml.safe_load(f)
+    plans = rules.compile_rules(config, thresholds)
+    nlb = {rule.metric: rule.limit for rule in plans["nlb"].rules}
+    assert nlb["UnHealthyHostCount"] == thresholds["nlb"]["unhealthy_targets_critical"]
+
+
+def test_concurrent_plan_loads_share_one_bounded_cache(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    import yaml
+
+    path = tmp_path / "rules.yaml"
+    path.write_text(yaml.safe_dump(CONFIG), encoding="utf-8")
+    monkeypatch.setattr(rules, "_plan_cache", {})
+    monkeypatch.setattr(rules, "PLAN_CACHE_SIZE", 3)
+    layers = [(("thresholds.yaml", n),) for n in range(8)]
+    calls = [(dict(THRESHOLDS), layers[i % 8]) for i in range(200)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        plans = list(pool.map(lambda c: rules.load_rule_plans(c[0], str(path), c[1]), calls))
+    assert all(p["ec2"].rules for p in plans)
+    assert len(rules._plan_cache) == 3
@@ -0,0 +1,195 @@
+import base64
+import gzip
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from tools import ssm
+
+
+class _Engine:
+    """Engine falso: le os blocos de um base64 em memoria pelo comando tail | head."""
+
+    def __init__(self, encoded: str, fail_offset: int | None = None):
+        self.encoded = encoded
+        self.fail_offset = fail_offset
+        self.commands: list[str] = []
+
+    def submit(self, instance_id, commands, timeout_seconds=60):
+        self.commands += commands
+        future = Future()
+        found = re.match(r"tail -c \+(\d+) .* \| head -c (\d+)", commands[0])
+        if not found:
+            future.set_result({"status": "Success", "stdout": "", "stderr": ""})
+            return future
+        start, size = int(found.group(1)) - 1, int(found.group(2))
+        status = "Failed" if start == self.fail_offset else "Success"
+        future.set_result({"status": status, "stdout": self.encoded[start:start + size] + "\n", "stderr": ""})
+        return future
+
+
+def _encoded(size: int) -> str:
+    return base64.b64encode(gzip.compress(os.urandom(size))).decode()
+
+
+def test_fetch_transport_chunks_reassembles_in_order():
+    encoded = _encoded(60000)
+    first = encoded[:ssm.TRANSPORT_CHUNK_CHARS]
+    engine = _Engine(encoded)
+    result = ssm.fetch_transport_chunks(engine, "i-0abc", "/tmp/kanbania-ssm-x-sistema", first, len(encoded))
+    assert result == encoded
+    assert engine.commands[-1] == "rm -f '/tmp/kanbania-ssm-x-sistema.b64'"
+
+
+def test_fetch_transport_chunks_failed_chunk_still_cleans_up():
+    encoded = _encoded(60000)
+    engine = _Engine(encoded, fail_offset=ssm.TRANSPORT_CHUNK_CHARS)
+    with pytest.raises(RuntimeError, match="falharam"):
+        ssm.fetch_transport_chunks(engine, "i-0abc", "/tmp/p", encoded[:ssm.TRANSPORT_CHUNK_CHARS], len(encoded))
+    assert engine.commands[-1] == "rm -f '/tmp/p.b64'"
+
+
+def test_fetch_transport_chunks_detects_short_output():
+    encoded = _encoded(60000)
+    engine = _Engine(encoded[:-10])
+    with pytest.raises(RuntimeError, match="incompleta"):
+        ssm.fetch_transport_chunks(engine, "i-0abc", "/tmp/p", encoded[:ssm.TRANSPORT_CHUNK_CHARS], len(encoded))
+
+
+def test_check_script_restricts_and_traps_temp_files():
+    lines = ssm.build_check_script([("sistema", "uptime", "uptime")], "n1", "/tmp/kanbania-ssm-n1-sistema")
+    assert lines[0] == "umask 077"
+    assert any(line.startswith("trap ") and "EXIT" in line and "$KB_OUT" in line for line in lines)
+    assert "trap 'exit 143' HUP INT TERM" in lines
+    assert lines.index("trap 'exit 143' HUP INT TERM") < lines.index('exec 3>&1 1>"$KB_OUT"')
+
+
+@pytest.mark.skipif(not shutil.which("bash"), reason="bash indisponivel")
+@pytest.mark.parametrize("size, kept", [(10, False), (200000, True)])
+def test_check_script_keeps_b64_only_when_chunked(tmp_path, size, kept):
+    path = str(tmp_path / "kanbania-ssm-n1-sistema")
+    checks = [("sistema", "dados", f"head -c {size} /dev/urandom | base64")]
+    script = "\n".join(ssm.build_check_script(checks, "n1", path))
+    output = subprocess.run(["bash", "-c", script], capture_output=True, text=True, check=True).stdout
+
+    total, first = ssm.parse_transport_header(output, "n1")
+    assert (total > len(first)) == kept
+    assert sorted(os.listdir(tmp_path)) == (["kanbania-ssm-n1-sistema.b64"] if kept else [])
+    if kept:
+        assert os.stat(path + ".b64").st_mode & 0o777 == 0o600
+        with open(path + ".b64") as f:
+            assert f.read().startswith(first)
+    else:
+        text = ssm.decode_transport(first)
+        assert "n1:RC:0:" in text
+
+
+def _section(nonce, category, label, rc, stdout="", stderr="", ms=12):
+    marker = f"{ssm.CHECK_MARKER}:{nonce}"
+    lines = [f"{marker}:BEGIN:{category}:{label}", stdout, f"{marker}:RC:{rc}:{ms}"]
+    if stderr:
+        lines.append(stderr)
+    return lines + [f"{marker}:END"]
+
+
+def test_split_check_output_by_status():
+    checks = [
+        ("sistema", "uptime", "uptime"),
+        ("sistema", "df", "df -h"),
+        ("mongodb", "mongo_status", "mongosh", 45),
+        ("mongodb", "mongo_repl", "mongosh"),
+    ]
+    output = "\n".join(
+        _section("n1", "sistema", "uptime", 0, "up 3 days", ms=7)
+        + _section("n1", "sistema", "df", 2, "", "df: /mnt: No such file")
+        + _section("n1", "mongodb", "mongo_status", 124, "parcial")
+    )
+    results, durations = ssm.split_check_output(output, checks, "n1")
+    assert results["sistema"] == {"uptime": "up 3 days", "df": "[ERRO: exit 2] df: /mnt: No such file"}
+    assert results["mongodb"]["mongo_status"] == "[TIMEOUT] checagem excedeu 45s\nparcial"
+    assert results["mongodb"]["mongo_repl"].startswith("[INCOMPLETO]")
+    assert durations == {"sistema": {"uptime": 7, "df": 12}, "mongodb": {"mongo_status": 12}}
+
+
+def test_split_check_output_ignores_other_nonces_and_truncated_sections():
+    checks = [("sistema", "uptime", "uptime"), ("sistema", "free", "free -m")]
+    output = "\n".join(
+        _section("outro", "sistema", "uptime", 0, "forjado")
+        + _section("n1", "sistema", "uptime", 0, "up 1 day")
+        # Cortada pelo SSM antes do END
+        + _section("n1", "sistema", "free", 0, "Mem: 1024")[:-1]
+    )
+    results, _ = ssm.split_check_output(output, checks, "n1")
+    assert results["sistema"]["uptime"] == "up 1 day"
+    assert results["sistema"]["free"].startswith("[INCOMPLETO]")
+
+
+def test_script_timeout_covers_kill_grace_of_every_check():
+    checks = [("sistema", "cpu_top", "top"), ("mongodb", "mongo_diagnostics", "mongosh"), ("x", "y", "z", 7)]
+    worst = sum(ssm._check_timeout(c) + ssm.CHECK_KILL_GRACE_S for c in checks)
+    assert ssm._script_timeout(checks) == worst + ssm.SCRIPT_TIMEOUT_MARGIN_S
+    assert f"timeout -k {ssm.CHECK_KILL_GRACE_S} 7 " in "\n".join(ssm.build_check_script(checks, "n1"))
+
+
+class _BashEngine:
+    """Engine falso que roda o script no bash local; estoura em timeout_s como o TimeoutSeconds do SSM."""
+
+    def __init__(self, timeout_s: float):
+        self.timeout_s = timeout_s
+        self.scripts: list[str] = []
+
+    def submit(self, instance_id, commands, timeout_seconds=60):
+        import signal
+
+        script = "\n".join(commands)
+        self.scripts.append(script)
+        # Saida em arquivo: o timeout do coreutils fica em outro grupo de processos e nao
+        # morre com o killpg; num pipe, a leitura esperaria a checagem travada terminar
+        with tempfile.TemporaryFile("w+") as out:
+            proc = subprocess.Popen(["bash", "-c", script], stdout=out, text=True, start_new_session=True)
+            try:
+                proc.wait(timeout=self.timeout_s)
+                status = "Success"
+            except subprocess.TimeoutExpired:
+                os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait()
+                status = "TimedOut"
+            out.seek(0)
+            stdout = out.read()
+        future = Future()
+        future.set_result({"instance_id": instance_id, "status": status, "stdout": stdout, "stderr": "", "latency_s": 1.0})
+        return future
+
+
+@pytest.mark.skipif(not shutil.which("bash"), reason="bash indisponivel")
+def test_compressed_timeout_reruns_uncompressed_and_keeps_finished_checks(tmp_path, monkeypatch):
+    monkeypatch.setattr(ssm, "TRANSPORT_DIR", str(tmp_path))
+    checks = [("sistema", "rapida", "echo pronto"), ("sistema", "travada", "sleep 5", 60)]
+    engine = _BashEngine(timeout_s=1.5)
+    result = engine.submit("i-0abc", ssm.build_check_script(checks, "n1", ssm._transport_path("n1", "sistema"))).result()
+    assert result["status"] == "TimedOut"
+    assert ssm.parse_transport_header(result["stdout"], "n1") is None
+
+    transport = {}
+    ssm._receive_output(engine, result, "n1", "sistema", transport, checks)
+    assert transport == {"sistema": {"retried_uncompressed": True}}
+    assert "KB_OUT" not in engine.scripts[-1]
+    assert result["latency_s"] == 2.0
+
+    outputs, _ = ssm._category_results(checks, result, "n1")
+    assert outputs["sistema"]["rapida"] == "pronto"
+    assert not outputs["sistema"]["travada"].startswith("[INCOMPLETO]")
+
+
+def test_uncompressed_timeout_is_not_rerun():
+    engine = _Engine("")
+    result = {"instance_id": "i-0abc", "status": "TimedOut", "stdout": "", "stderr": "", "latency_s": 1.0}
+    ssm._receive_output(engine, result, "n1", "sistema", {}, None)
+    assert engine.commands == []
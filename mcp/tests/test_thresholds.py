@@ -0,0 +1,103 @@
+import os
+import shutil
+
+import pytest
+import yaml
+
+from tools import rules, thresholds
+
+BASE = {
+    "ec2": {"cpu_avg_warning": 50, "cpu_avg_critical": 70, "network_in_mb_warning": 500},
+    "host": {"percentile": "p90"},
+}
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """config/ temporario com o thresholds.yaml BASE e sem rules.yaml."""
+    monkeypatch.setattr(thresholds, "CONFIG_DIR", str(tmp_path))
+    monkeypatch.setattr(thresholds, "DEFAULTS_PATH", str(tmp_path / "thresholds.yaml"))
+    monkeypatch.setattr(thresholds, "OVERRIDES_DIR", str(tmp_path / "thresholds.d"))
+    monkeypatch.setattr(thresholds, "_cache", {})
+    _write(tmp_path / "thresholds.yaml", BASE)
+    return tmp_path
+
+
+def _write(path, data):
+    os.makedirs(path.parent, exist_ok=True)
+    path.write_text(yaml.safe_dump(data), encoding="utf-8")
+
+
+def _bump(path, step=1):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + step * 1_000_000_000))
+
+
+def test_layers_applied_in_precedence_order(config):
+    overrides = config / "thresholds.d"
+    _write(overrides / "environments" / "prod.yaml", {"ec2": {"cpu_avg_warning": 40, "cpu_avg_critical": 60}})
+    _write(overrides / "projects" / "loja.yaml", {"ec2": {"cpu_avg_critical": 65, "network_in_mb_warning": 900}})
+    _write(overrides / "projects" / "loja.prod.yaml", {"ec2": {"cpu_avg_critical": 90}, "host": {"percentile": "p99"}})
+
+    merged = thresholds.load_thresholds("loja", "prod")
+    assert merged["ec2"] == {"cpu_avg_warning": 40, "cpu_avg_critical": 90, "network_in_mb_warning": 900}
+    assert merged["host"] == {"percentile": "p99"}
+    assert [os.path.relpath(p, config) for p in thresholds.threshold_sources("loja", "prod")] == [
+        "thresholds.yaml",
+        os.path.join("thresholds.d", "environments", "prod.yaml"),
+        os.path.join("thresholds.d", "projects", "loja.yaml"),
+        os.path.join("thresholds.d", "projects", "loja.prod.yaml"),
+    ]
+    # Outro ambiente do mesmo projeto nao recebe as camadas de prod
+    assert thresholds.load_thresholds("loja", "hml")["ec2"]["cpu_avg_critical"] == 65
+    assert thresholds.load_thresholds()["ec2"] == BASE["ec2"]
+
+
+def test_cache_reloads_when_a_layer_changes(config):
+    path = config / "thresholds.d" / "projects" / "loja.yaml"
+    _write(path, {"ec2": {"cpu_avg_critical": 65}})
+    first = thresholds.load_thresholds("loja")
+    assert thresholds.load_thresholds("loja") is first
+
+    _write(path, {"ec2": {"cpu_avg_critical": 75}})
+    _bump(path)
+    assert thresholds.load_thresholds("loja")["ec2"]["cpu_avg_critical"] == 75
+
+
+@pytest.mark.parametrize("override, error", [
+    ({"ec2": {"cpu_max": 1}}, "chave desconhecida"),
+    ({"s3": {"x": 1}}, "secao desconhecida"),
+    ({"ec2": {"cpu_avg_critical": "alto"}}, "valor numerico esperado"),
+    ({"ec2": {"cpu_avg_critical": -1}}, "valor negativo"),
+    ({"host": {"percentile": "p95"}}, "invalido"),
+    ({"ec2": {"cpu_avg_critical": 45}}, "maior que ec2.cpu_avg_critical"),
+])
+def test_invalid_overrides_raise(config, override, error):
+    _write(config / "thresholds.d" / "projects" / "loja.yaml", override)
+    with pytest.raises(ValueError, match=error):
+        thresholds.load_thresholds("loja")
+
+
+def test_rule_plans_cached_by_layer_key_and_bounded(config, monkeypatch):
+    # rules.yaml e thresholds.yaml reais: as regras precisam compilar contra a base
+    shipped = os.path.dirname(rules.RULES_PATH)
+    for name in ("rules.yaml", "thresholds.yaml"):
+        shutil.copy(os.path.join(shipped, name), config / name)
+    rules_path = str(config / "rules.yaml")
+    monkeypatch.setattr(rules, "_plan_cache", {})
+    monkeypatch.setattr(rules, "PLAN_CACHE_SIZE", 2)
+
+    merged = thresholds.load_thresholds("loja", "prod")
+    layers_key = tuple((p, None if i else os.stat(p).st_mtime_ns)
+                       for i, p in enumerate(thresholds.threshold_layers("loja", "prod")))
+    assert list(rules._plan_cache) == [(rules_path, layers_key)]
+    # Sem key: reaproveita a entrada compilada para o mesmo dict
+    plans = rules.load_rule_plans(merged, rules_path)
+    assert rules._plan_cache[(rules_path, layers_key)][2] is plans
+
+    thresholds.load_thresholds("loja", "hml")
+    thresholds.load_thresholds("loja", "dev")
+    assert len(rules._plan_cache) == 2
+    # Thresholds montados a mao: compilados sem entrar no cache
+    rules.load_rule_plans({**merged}, rules_path)
+    assert len(rules._plan_cache) == 2
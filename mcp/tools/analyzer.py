@@ -9,17 +9,30 @@ Severidades: critical > high > medium > low
 
 import os
 import re
-import yaml
+import json
 from pathlib import Path
 from typing import Optional
 
+from tools.baselines import run_baselines
+from tools.docker_diagnostics import ContainerStats, parse_docker_stats
+from tools.mongo_diagnostics import MongoMetrics, parse_mongo_diagnostics
+from tools.rules import evaluate_rules
+from tools.thresholds import load_thresholds, threshold_sources
+from tools.metric_series import SERIES_FILENAME
+from tools.host_sampling import SAMPLING_CATEGORY, SAMPLING_LABEL, parse_host_samples, sample_percentiles
+
 CONFIG_DIR = os.path.join(os.path.dirname(__file__), "..", "config")
 
 
-def _load_thresholds() -> dict:
-    path = os.path.join(CONFIG_DIR, "thresholds.yaml")
+def _load_metric_records(path: str) -> dict[str, list[dict]]:
+    """Le o metricas-cloudwatch.jsonl gravado pelo modo stream do cloudwatch."""
+    metrics: dict[str, list[dict]] = {}
     with open(path, encoding="utf-8") as f:
-        return yaml.safe_load(f)
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                metrics.setdefault(row["kind"], []).append(row["record"])
+    return metrics
 
 
 def _severity_order(s: str) -> int:
@@ -27,223 +40,296 @@ def _severity_order(s: str) -> int:
 
 
 def analyze_ec2(metrics: list[dict], thresholds: dict) -> list[dict]:
-    """Analisa metricas EC2 e retorna lista de anomalias."""
-    anomalies = []
-    t = thresholds.get("ec2", {})
+    """Analisa metricas EC2 contra as regras de ec2 (config/rules.yaml)."""
+    return evaluate_rules("ec2", metrics, thresholds)
 
-    for m in metrics:
-        iid = m["instance_id"]
-        cpu = m.get("cpu", {})
-        credit = m.get("credit_balance", {})
 
-        cpu_avg = cpu.get("avg")
-        cpu_max = cpu.get("max")
-        credit_avg = credit.get("avg")
+def analyze_alb(metrics: list[dict], thresholds: dict) -> list[dict]:
+    """Analisa metricas ALB contra as regras de alb (config/rules.yaml)."""
+    return evaluate_rules("alb", metrics, thresholds)
 
-        if cpu_avg is not None:
-            if cpu_avg >= t.get("cpu_avg_critical", 70):
-                anomalies.append({
-                    "resource": iid,
-                    "resource_type": "EC2",
-                    "metric": "CPUUtilization (avg)",
-                    "value": f"{cpu_avg:.1f}%",
-                    "threshold": f">= {t.get('cpu_avg_critical', 70)}%",
-                    "severity": "critical",
-                    "description": f"CPU media critica em {iid}: {cpu_avg:.1f}%",
-                })
-            elif cpu_avg >= t.get("cpu_avg_warning", 50):
-                anomalies.append({
-                    "resource": iid,
-                    "resource_type": "EC2",
-                    "metric": "CPUUtilization (avg)",
-                    "value": f"{cpu_avg:.1f}%",
-                    "threshold": f">= {t.get('cpu_avg_warning', 50)}%",
-                    "severity": "medium",
-                    "description": f"CPU media elevada em {iid}: {cpu_avg:.1f}%",
-                })
 
-        if cpu_max is not None and cpu_max >= t.get("cpu_max_critical", 80):
-            anomalies.append({
-                "resource": iid,
-                "resource_type": "EC2",
-                "metric": "CPUUtilization (max)",
-                "value": f"{cpu_max:.1f}%",
-                "threshold": f">= {t.get('cpu_max_critical', 80)}%",
-                "severity": "high",
-                "description": f"Pico de CPU em {iid}: {cpu_max:.1f}%",
-            })
+def analyze_nlb(metrics: list[dict], thresholds: dict) -> list[dict]:
+    """Analisa metricas NLB contra as regras de nlb (config/rules.yaml)."""
+    return evaluate_rules("nlb", metrics, thresholds)
 
-        if credit_avg is not None and credit_avg < t.get("credit_balance_min", 50):
-            anomalies.append({
-                "resource": iid,
-                "resource_type": "EC2",
-                "metric": "CPUCreditBalance",
-                "value": f"{credit_avg:.0f}",
-                "threshold": f"< {t.get('credit_balance_min', 50)}",
-                "severity": "high",
-                "description": f"CPU credit balance baixo em {iid}: {credit_avg:.0f} creditos",
-            })
 
-    return anomalies
+def _with_target_health(nlb_metrics: list[dict], load_balancers: list[dict]) -> list[dict]:
+    """
+    Registros NLB com targets_unhealthy do inventario (o CloudWatch so publica
+    UnHealthyHostCount por target group). NLB sem metricas ganha registro proprio.
+    """
+    nlbs = {lb["arn"]: lb for lb in load_balancers if lb.get("type") == "network"}
+    merged = []
+    for record in nlb_metrics:
+        lb = nlbs.pop(record.get("lb_arn"), None)
+        merged.append({**record, "targets_unhealthy": lb.get("targets_unhealthy", 0)} if lb else record)
+    for arn, lb in nlbs.items():
+        merged.append({"lb_name": lb["name"], "lb_arn": arn, "targets_unhealthy": lb.get("targets_unhealthy", 0)})
+    return merged
 
 
-def analyze_alb(metrics: list[dict], thresholds: dict) -> list[dict]:
-    """Analisa metricas ALB e retorna lista de anomalias."""
+def analyze_ebs(metrics: list[dict], thresholds: dict) -> list[dict]:
+    """Analisa metricas EBS contra as regras de ebs (config/rules.yaml)."""
+    return evaluate_rules("ebs", metrics, thresholds)
+
+
+def analyze_rds(metrics: list[dict], thresholds: dict) -> list[dict]:
+    """Analisa metricas RDS contra as regras de rds (config/rules.yaml)."""
+    return evaluate_rules("rds", metrics, thresholds)
+
+
+# Series da amostragem SSM avaliadas: (serie, metrica, unidade)
+HOST_SAMPLE_CHECKS = [
+    ("cpu_busy", "CPU (amostragem)", "%"),
+    ("iowait", "iowait (amostragem)", "%"),
+    ("run_queue_per_cpu", "Fila de execucao por vCPU", ""),
+    ("disk_util", "Disco %util (amostragem)", "%"),
+]
+
+
+def analyze_host_samples(samples_output: str, thresholds: dict, resource: str = "Host") -> list[dict]:
+    """
+    Compara o percentil configurado (host.percentile, default p90) das series
+    por segundo da amostragem SSM com os limites de host.
+    """
     anomalies = []
-    t = thresholds.get("alb", {})
+    t = thresholds.get("host", {})
+    percentile = t.get("percentile", "p90")
+    stats = sample_percentiles(parse_host_samples(samples_output))
 
-    for m in metrics:
-        name = m.get("lb_name", m.get("lb_arn", "unknown"))
-        rt = m.get("response_time_s", {})
-        err5xx = m.get("error_5xx", {})
-        err4xx = m.get("error_4xx", {})
+    for series, metric, unit in HOST_SAMPLE_CHECKS:
+        st = stats.get(series)
+        if not st or percentile not in st:
+            continue
+        value = st[percentile]
+        critical = t.get(f"{series}_critical")
+        warning = t.get(f"{series}_warning")
+        if critical is not None and value >= critical:
+            severity, limit, label = "critical", critical, "critico"
+        elif warning is not None and value >= warning:
+            severity, limit, label = "medium", warning, "elevado"
+        else:
+            continue
+        anomalies.append({
+            "resource": resource,
+            "resource_type": "Host",
+            "metric": f"{metric} ({percentile})",
+            "value": f"{value:g}{unit} (max {st['max']:g}{unit}, {st['samples']} amostras)",
+            "threshold": f">= {limit:g}{unit}",
+            "severity": severity,
+            "description": f"{metric} {label} em {resource}: {percentile} de {value:g}{unit}",
+        })
 
-        rt_avg = rt.get("avg")
-        err5xx_avg = err5xx.get("avg")
+    return anomalies
 
-        if rt_avg is not None:
-            if rt_avg >= t.get("response_time_critical_s", 5.0):
-                anomalies.append({
-                    "resource": name,
-                    "resource_type": "ALB",
-                    "metric": "TargetResponseTime",
-                    "value": f"{rt_avg:.3f}s",
-                    "threshold": f">= {t.get('response_time_critical_s', 5.0)}s",
-                    "severity": "critical",
-                    "description": f"Latencia critica no ALB {name}: {rt_avg:.3f}s",
-                })
-            elif rt_avg >= t.get("response_time_warning_s", 1.0):
-                anomalies.append({
-                    "resource": name,
-                    "resource_type": "ALB",
-                    "metric": "TargetResponseTime",
-                    "value": f"{rt_avg:.3f}s",
-                    "threshold": f">= {t.get('response_time_warning_s', 1.0)}s",
-                    "severity": "medium",
-                    "description": f"Latencia elevada no ALB {name}: {rt_avg:.3f}s",
-                })
 
-        if err5xx_avg is not None and err5xx_avg >= t.get("error_5xx_critical", 100):
-            anomalies.append({
-                "resource": name,
-                "resource_type": "ALB",
-                "metric": "HTTPCode_ELB_5XX_Count",
-                "value": f"{err5xx_avg:.0f}/h avg",
-                "threshold": f">= {t.get('error_5xx_critical', 100)}/h",
-                "severity": "critical",
-                "description": f"Erros 5XX criticos no ALB {name}: {err5xx_avg:.0f}/h",
-            })
+def _is_fleet_results(ssm_results: dict) -> bool:
+    """
+    Modo frota pela estrutura, nao pelo prefixo do ID (instancias hibridas sao mi-...):
+    {instancia: {categoria: {label: saida}}} tem dicts no segundo nivel, o resultado
+    de uma instancia tem as saidas (str).
+    """
+    inner = [v for per in ssm_results.values() if isinstance(per, dict) for v in per.values()]
+    return bool(inner) and all(isinstance(v, dict) for v in inner)
+
+
+def analyze_ssm_output(ssm_results: dict, thresholds: dict, resource: str = "") -> list[dict]:
+    """
+    Analisa saida bruta do SSM buscando padroes de problema.
+    Heuristicas simples para MongoDB e sistema.
+    Aceita tambem o resultado do modo frota: {instance_id: {categoria: {label: saida}}}.
+    """
+    if _is_fleet_results(ssm_results):
+        return [
+            a for iid, results in ssm_results.items()
+            for a in analyze_ssm_output(results, thresholds, resource=iid)
+        ]
+
+    anomalies = []
+    samples_output = ssm_results.get(SAMPLING_CATEGORY, {}).get(SAMPLING_LABEL, "")
+    if samples_output and not samples_output.startswith("["):
+        anomalies += analyze_host_samples(samples_output, thresholds, resource or "Host")
+
+    mongo = _mongo_metrics(ssm_results.get("mongodb", {}))
+    if mongo is not None:
+        anomalies += analyze_mongodb(mongo, thresholds, resource or "MongoDB")
+
+    containers = parse_docker_stats(ssm_results.get("docker", {}).get("docker_stats", ""))
+    if containers:
+        anomalies += analyze_docker(containers, thresholds, resource)
 
     return anomalies
 
 
-def analyze_ebs(metrics: list[dict], thresholds: dict) -> list[dict]:
-    """Analisa metricas EBS e retorna lista de anomalias."""
+def _mongo_metrics(mongo_results: dict) -> MongoMetrics | None:
+    """Metricas da checagem estruturada; resultados antigos so trazem o cache (mongo_wiredtiger)."""
+    metrics = parse_mongo_diagnostics(mongo_results.get("mongo_diagnostics", ""))
+    if metrics is not None:
+        return metrics
+    wt_output = mongo_results.get("mongo_wiredtiger", "")
+    if wt_output and "cache bytes:" in wt_output:
+        try:
+            parts = wt_output.split("cache bytes:")[1].strip().split("/")
+            return MongoMetrics(cache_bytes=int(parts[0].strip()), cache_max_bytes=int(parts[1].strip()))
+        except (IndexError, ValueError):
+            pass
+    return None
+
+
+# Metricas MongoDB comparadas com <chave>_warning / <chave>_critical: (atributo, metrica, chave, unidade)
+MONGO_CHECKS = [
+    ("connections_current", "Conexoes", "connections", ""),
+    ("page_faults_per_min", "Page faults/min", "page_faults_per_min", ""),
+    ("replication_lag_s", "Replication lag", "replication_lag_s", "s"),
+]
+
+
+def analyze_mongodb(m: MongoMetrics, thresholds: dict, resource: str = "MongoDB") -> list[dict]:
+    """Analisa as metricas MongoDB contra todos os thresholds de mongodb."""
     anomalies = []
-    t = thresholds.get("ebs", {})
-
-    for m in metrics:
-        vid = m["volume_id"]
-        ql = m.get("queue_length", {})
-        rl = m.get("read_latency_s", {})
-        wl = m.get("write_latency_s", {})
-        burst = m.get("burst_balance", {})
-
-        ql_avg = ql.get("avg")
-        rl_avg = rl.get("avg")
-        wl_avg = wl.get("avg")
-        burst_avg = burst.get("avg")
-
-        if ql_avg is not None:
-            if ql_avg >= t.get("queue_length_critical", 1.0):
-                anomalies.append({
-                    "resource": vid,
-                    "resource_type": "EBS",
-                    "metric": "VolumeQueueLength",
-                    "value": f"{ql_avg:.3f}",
-                    "threshold": f">= {t.get('queue_length_critical', 1.0)}",
-                    "severity": "critical",
-                    "description": f"Queue length critica no volume {vid}: {ql_avg:.3f}",
-                })
-            elif ql_avg >= t.get("queue_length_warning", 0.5):
-                anomalies.append({
-                    "resource": vid,
-                    "resource_type": "EBS",
-                    "metric": "VolumeQueueLength",
-                    "value": f"{ql_avg:.3f}",
-                    "threshold": f">= {t.get('queue_length_warning', 0.5)}",
-                    "severity": "medium",
-                    "description": f"Queue length elevada no volume {vid}: {ql_avg:.3f}",
-                })
+    t = thresholds.get("mongodb", {})
+
+    ratio = m.cache_ratio
+    if ratio is not None:
+        critical_ratio = t.get("working_set_cache_ratio_critical", 0.95)
+        warning_ratio = t.get("working_set_cache_ratio_warning", 0.80)
 
-        if rl_avg is not None and rl_avg >= t.get("read_latency_critical_s", 30.0):
+        if ratio >= critical_ratio:
             anomalies.append({
-                "resource": vid,
-                "resource_type": "EBS",
-                "metric": "VolumeReadLatency",
-                "value": f"{rl_avg:.4f}s",
-                "threshold": f">= {t.get('read_latency_critical_s', 30.0)}s",
+                "resource": resource,
+                "resource_type": "MongoDB",
+                "metric": "WiredTiger Cache Usage",
+                "value": f"{ratio:.1%} ({m.cache_bytes/1024/1024/1024:.2f}GB / {m.cache_max_bytes/1024/1024/1024:.2f}GB)",
+                "threshold": f">= {critical_ratio:.0%}",
                 "severity": "critical",
-                "description": f"Read latency critica no volume {vid}: {rl_avg:.4f}s",
+                "description": f"Working set excede cache WiredTiger: {ratio:.1%} utilizado",
             })
-
-        if burst_avg is not None and burst_avg < t.get("burst_balance_min", 30):
+        elif ratio >= warning_ratio:
             anomalies.append({
-                "resource": vid,
-                "resource_type": "EBS",
-                "metric": "BurstBalance",
-                "value": f"{burst_avg:.1f}%",
-                "threshold": f"< {t.get('burst_balance_min', 30)}%",
+                "resource": resource,
+                "resource_type": "MongoDB",
+                "metric": "WiredTiger Cache Usage",
+                "value": f"{ratio:.1%}",
+                "threshold": f">= {warning_ratio:.0%}",
                 "severity": "high",
-                "description": f"Burst balance baixo no volume {vid}: {burst_avg:.1f}%",
+                "description": f"Cache WiredTiger com utilizacao elevada: {ratio:.1%}",
+            })
+
+    for attr, metric, key, unit in MONGO_CHECKS:
+        value = getattr(m, attr)
+        if value is None:
+            continue
+        critical = t.get(f"{key}_critical")
+        warning = t.get(f"{key}_warning")
+        if critical is not None and value >= critical:
+            severity, limit, label = "critical", critical, "critico"
+        elif warning is not None and value >= warning:
+            severity, limit, label = "high", warning, "elevado"
+        else:
+            continue
+        anomalies.append({
+            "resource": resource,
+            "resource_type": "MongoDB",
+            "metric": metric,
+            "value": f"{value:g}{unit}",
+            "threshold": f">= {limit:g}{unit}",
+            "severity": severity,
+            "description": f"{metric} {label} no MongoDB: {value:g}{unit}",
+        })
+
+    if m.slow_ops:
+        slowest = m.slow_ops[0]
+        critical = t.get("slow_op_s_critical")
+        warning = t.get("slow_op_s_warning")
+        if critical is not None and slowest.secs_running >= critical:
+            severity, limit = "critical", critical
+        elif warning is not None and slowest.secs_running >= warning:
+            severity, limit = "high", warning
+        else:
+            severity = None
+        if severity:
+            plan = f", plano {slowest.plan}" if slowest.plan else ""
+            anomalies.append({
+                "resource": resource,
+                "resource_type": "MongoDB",
+                "metric": "Operacao lenta",
+                "value": f"{slowest.secs_running:g}s ({slowest.op} em {slowest.ns})",
+                "threshold": f">= {limit:g}s",
+                "severity": severity,
+                "description": f"Operacao {slowest.op} em {slowest.ns} rodando ha {slowest.secs_running:g}s{plan}",
             })
 
     return anomalies
 
 
-def analyze_ssm_output(ssm_results: dict, thresholds: dict) -> list[dict]:
+# Metricas por container comparadas com <chave>_warning / <chave>_critical: (atributo, metrica, chave, unidade)
+DOCKER_CHECKS = [
+    ("throttled_pct", "CPU throttling", "cpu_throttled_pct", "%"),
+    ("block_io_mb_s", "Block I/O", "block_io_mb_s", " MB/s"),
+    ("net_io_mb_s", "Network I/O", "net_io_mb_s", " MB/s"),
+]
+
+
+def analyze_docker(containers: list[ContainerStats], thresholds: dict, resource: str = "") -> list[dict]:
     """
-    Analisa saida bruta do SSM buscando padroes de problema.
-    Heuristicas simples para MongoDB e sistema.
+    Containers limitados por memoria (uso proximo do limite ou OOMKilled), com
+    throttling de CPU pelo cgroup ou com I/O de disco/rede elevado.
     """
     anomalies = []
-    t = thresholds.get("mongodb", {})
-    mongo_results = ssm_results.get("mongodb", {})
+    t = thresholds.get("docker", {})
 
-    # Analisa wiredtiger cache
-    wt_output = mongo_results.get("mongo_wiredtiger", "")
-    if wt_output and "cache bytes:" in wt_output:
-        try:
-            parts = wt_output.split("cache bytes:")[1].strip().split("/")
-            current = int(parts[0].strip())
-            maximum = int(parts[1].strip())
-            ratio = current / maximum if maximum > 0 else 0
+    for c in containers:
+        name = f"{resource}/{c.name}" if resource else c.name
 
-            critical_ratio = t.get("working_set_cache_ratio_critical", 0.95)
-            warning_ratio = t.get("working_set_cache_ratio_warning", 0.80)
+        if c.oom_killed:
+            anomalies.append({
+                "resource": name,
+                "resource_type": "Docker",
+                "metric": "OOMKilled",
+                "value": "sim",
+                "threshold": "nao",
+                "severity": "critical",
+                "description": f"Container {c.name} foi encerrado por falta de memoria (OOMKilled)",
+            })
 
-            if ratio >= critical_ratio:
+        # MemPerc so e relativo ao limite do container quando ha limite configurado
+        if c.mem_limit_set:
+            critical = t.get("mem_limit_pct_critical", 95)
+            warning = t.get("mem_limit_pct_warning", 80)
+            if c.mem_pct_max >= warning:
+                severity, limit = ("critical", critical) if c.mem_pct_max >= critical else ("high", warning)
                 anomalies.append({
-                    "resource": "MongoDB",
-                    "resource_type": "MongoDB",
-                    "metric": "WiredTiger Cache Usage",
-                    "value": f"{ratio:.1%} ({current/1024/1024/1024:.2f}GB / {maximum/1024/1024/1024:.2f}GB)",
-                    "threshold": f">= {critical_ratio:.0%}",
-                    "severity": "critical",
-                    "description": f"Working set excede cache WiredTiger: {ratio:.1%} utilizado",
-                })
-            elif ratio >= warning_ratio:
-                anomalies.append({
-                    "resource": "MongoDB",
-                    "resource_type": "MongoDB",
-                    "metric": "WiredTiger Cache Usage",
-                    "value": f"{ratio:.1%}",
-                    "threshold": f">= {warning_ratio:.0%}",
-                    "severity": "high",
-                    "description": f"Cache WiredTiger com utilizacao elevada: {ratio:.1%}",
+                    "resource": name,
+                    "resource_type": "Docker",
+                    "metric": "Memoria / limite",
+                    "value": f"{c.mem_pct_max:g}% ({c.mem_used_bytes/1024/1024:.0f}MiB / {c.mem_limit_bytes/1024/1024:.0f}MiB)",
+                    "threshold": f">= {limit:g}%",
+                    "severity": severity,
+                    "description": f"Container {c.name} proximo do limite de memoria: {c.mem_pct_max:g}%",
                 })
-        except (IndexError, ValueError):
-            pass
+
+        for attr, metric, key, unit in DOCKER_CHECKS:
+            value = getattr(c, attr)
+            if value is None:
+                continue
+            critical = t.get(f"{key}_critical")
+            warning = t.get(f"{key}_warning")
+            if critical is not None and value >= critical:
+                severity, limit = "critical", critical
+            elif warning is not None and value >= warning:
+                severity, limit = "medium", warning
+            else:
+                continue
+            anomalies.append({
+                "resource": name,
+                "resource_type": "Docker",
+                "metric": metric,
+                "value": f"{value:.1f}{unit}",
+                "threshold": f">= {limit:g}{unit}",
+                "severity": severity,
+                "description": f"{metric} elevado no container {c.name}: {value:.1f}{unit}",
+            })
 
     return anomalies
 
@@ -262,7 +348,9 @@ def generate_recommendations(anomalies: list[dict]) -> list[str]:
         rtype = a["resource_type"]
         metric = a["metric"]
 
-        if rtype == "EC2" and "CPU" in metric and "Credit" not in metric:
+        if metric.endswith(("(desvio do baseline)", "(mudanca de nivel)")):
+            recs.append("Correlacionar desvios do baseline com deploys, mudancas de configuracao e variacoes de carga no periodo")
+        elif rtype == "EC2" and "CPU" in metric and "Credit" not in metric:
             recs.append("Avaliar upgrade de tipo de instancia EC2 ou otimizacao da carga de trabalho")
         elif rtype == "EC2" and "Credit" in metric:
             recs.append("Considerar migrar instancias T-series para instancias de performance fixas (M ou C series)")
@@ -274,13 +362,28 @@ def generate_recommendations(anomalies: list[dict]) -> list[str]:
             recs.append("EBS saturado — considerar upgrade para gp3/io2 com IOPS provisionados")
         elif rtype == "EBS" and "BurstBalance" in metric:
             recs.append("Volume gp2 esgotando burst IOPS — migrar para gp3 para IOPS consistentes")
+        elif rtype == "NLB" and "Flow" in metric:
+            recs.append("NLB com muitos fluxos ativos — revisar conexoes ociosas (keep-alive) e capacidade dos targets")
+        elif rtype == "RDS" and "CPU" in metric:
+            recs.append("RDS com CPU elevada — revisar queries lentas (Performance Insights) ou aumentar a classe da instancia")
+        elif rtype == "RDS" and "Memory" in metric:
+            recs.append("RDS com pouca memoria livre — revisar buffers e numero de conexoes ou aumentar a classe da instancia")
+        elif rtype == "RDS" and "Latency" in metric:
+            recs.append("Latencia de I/O no RDS — avaliar IOPS provisionados (gp3/io2) e queries sem indice")
         elif rtype == "MongoDB" and "Cache" in metric:
             recs.append("Working set MongoDB excede cache — considerar upgrade de instancia ou sharding")
+        elif rtype == "Docker" and metric in ("OOMKilled", "Memoria / limite"):
+            recs.append("Containers no limite de memoria — revisar limites (--memory) e consumo da aplicacao")
+        elif rtype == "Docker" and "throttling" in metric:
+            recs.append("Containers com throttling de CPU — aumentar --cpus ou redistribuir containers entre hosts")
+        elif rtype == "Docker" and "I/O" in metric:
+            recs.append("Containers com I/O elevado — verificar logs verbosos, volumes e cache da aplicacao")
 
     if not recs:
         recs.append("Nenhuma anomalia critica detectada. Monitoramento preventivo recomendado.")
 
-    return recs
+    # Metricas diferentes podem levar a mesma recomendacao
+    return list(dict.fromkeys(recs))
 
 
 def run_analysis(
@@ -291,23 +394,51 @@ def run_analysis(
     ebs_metrics: list | None = None,
     rds_metrics: list | None = None,
     ssm_results: dict | None = None,
+    metrics_path: str = "",
+    nlb_metrics: list | None = None,
+    project: str = "",
+    series_path: str = "",
+    load_balancers: list | None = None,
 ) -> dict:
     """
     Executa analise completa, gera analise-consolidada.md.
+    metrics_path: registros do cloudwatch em modo stream (somados as listas)
+    project: aplica as sobrescritas de thresholds do projeto (e do ambiente)
+    series_path: series do cloudwatch para os baselines (default: series-cloudwatch.jsonl do docs_dir, se existir)
+    load_balancers: load_balancers do aws_inventory (targets nao saudaveis dos NLBs)
     Retorna dict com anomalias e caminho do arquivo.
     """
-    thresholds = _load_thresholds()
+    thresholds = load_thresholds(project, environment)
+
+    if metrics_path:
+        streamed = _load_metric_records(metrics_path)
+        ec2_metrics = (ec2_metrics or []) + streamed.get("ec2", [])
+        alb_metrics = (alb_metrics or []) + streamed.get("alb", [])
+        nlb_metrics = (nlb_metrics or []) + streamed.get("nlb", [])
+        ebs_metrics = (ebs_metrics or []) + streamed.get("ebs", [])
+        rds_metrics = (rds_metrics or []) + streamed.get("rds", [])
+    if load_balancers:
+        nlb_metrics = _with_target_health(nlb_metrics or [], load_balancers)
 
     anomalies = []
     if ec2_metrics:
         anomalies += analyze_ec2(ec2_metrics, thresholds)
     if alb_metrics:
         anomalies += analyze_alb(alb_metrics, thresholds)
+    if nlb_metrics:
+        anomalies += analyze_nlb(nlb_metrics, thresholds)
     if ebs_metrics:
         anomalies += analyze_ebs(ebs_metrics, thresholds)
+    if rds_metrics:
+        anomalies += analyze_rds(rds_metrics, thresholds)
     if ssm_results:
         anomalies += analyze_ssm_output(ssm_results, thresholds)
 
+    # Baselines sazonais: desvios e mudancas de nivel que os limites estaticos nao pegam
+    series_path = series_path or os.path.join(docs_dir, SERIES_FILENAME)
+    if os.path.exists(series_path):
+        anomalies += run_baselines(series_path, thresholds)
+
     # Ordenar por severidade
     anomalies.sort(key=lambda a: _severity_order(a["severity"]))
 
@@ -328,6 +459,12 @@ def run_analysis(
         f"",
         f"**Data:** {now.strftime('%Y-%m-%d %H:%M')} (BRT)  ",
         f"**Ambiente:** {environment.upper()}  ",
+    ]
+    overrides = threshold_sources(project, environment)[1:]
+    if overrides:
+        names = ", ".join(f"`config/{os.path.relpath(path, CONFIG_DIR)}`" for path in overrides)
+        lines.append(f"**Sobrescritas de thresholds:** {names}  ")
+    lines += [
         f"",
         f"---",
         f"",
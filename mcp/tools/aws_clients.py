@@ -0,0 +1,151 @@
+"""
+aws_clients.py — Registro de sessoes e clientes boto3 compartilhado pelo processo
+
+O servidor MCP e um processo de longa duracao: criar Session e clientes a cada
+chamada de tool recarrega os modelos de servico (centenas de ms) e descarta os
+pools de conexao. Aqui os clientes ficam em cache por (profile, regiao, servico),
+com pool de conexoes dimensionado, retries adaptativos e remocao dos clientes
+sem uso ha mais de IDLE_TTL_S.
+
+Clientes boto3 sao thread-safe apos criados; a criacao (Session.client) nao e,
+por isso e serializada por sessao.
+"""
+
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+
+DEFAULT_MAX_POOL_CONNECTIONS = 16
+
+# Clientes sem uso por mais tempo que isso sao descartados
+IDLE_TTL_S = 15 * 60
+
+DEFAULT_RETRIES = {"mode": "adaptive", "max_attempts": 8}
+
+# CloudWatch tem limitador e backoff proprios (cloudwatch.TokenBucket): poucos
+# retries no botocore para o throttling chegar ao limitador compartilhado
+SERVICE_RETRIES = {
+    "cloudwatch": {"mode": "standard", "max_attempts": 3},
+}
+
+
+class ClientRegistry:
+    """Sessoes por (profile, regiao) e clientes por (profile, regiao, servico)."""
+
+    def __init__(self, idle_ttl_s: float = IDLE_TTL_S):
+        self.idle_ttl_s = idle_ttl_s
+        self._lock = threading.Lock()
+        self._sessions: dict[tuple[str, str], tuple[boto3.Session, threading.Lock]] = {}
+        # chave -> [cliente, max_pool_connections, ultimo uso]
+        self._clients: dict[tuple[str, str, str], list] = {}
+
+    def session(self, profile: str, region: str) -> boto3.Session:
+        return self._session_entry(profile, region)[0]
+
+    def _session_entry(self, profile: str, region: str) -> tuple[boto3.Session, threading.Lock]:
+        key = (profile or "", region or "")
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                session = boto3.Session(profile_name=profile or None, region_name=region or None)
+                entry = self._sessions[key] = (session, threading.Lock())
+            return entry
+
+    def client(
+        self,
+        profile: str,
+        region: str,
+        service: str,
+        max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+    ):
+        """
+        Cliente em cache para (profile, regiao, servico). Se o pedido exigir
+        um pool maior que o do cliente existente, o cliente e recriado.
+        """
+        self.evict_idle()
+        key = (profile or "", region or "", service)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and entry[1] >= max_pool_connections:
+                entry[2] = now
+                return entry[0]
+
+        session, session_lock = self._session_entry(profile, region)
+        with session_lock:
+            with self._lock:
+                entry = self._clients.get(key)
+                if entry is not None and entry[1] >= max_pool_connections:
+                    entry[2] = now
+                    return entry[0]
+            pool = max(max_pool_connections, entry[1] if entry else 0)
+            config = Config(
+                max_pool_connections=pool,
+                retries=SERVICE_RETRIES.get(service, DEFAULT_RETRIES),
+            )
+            client = session.client(service, config=config)
+        with self._lock:
+            self._clients[key] = [client, pool, now]
+        return client
+
+    def scoped(self, profile: str, region: str, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS):
+        """Objeto com .client(servico) para um profile/regiao (mesma interface de Session)."""
+        return ScopedClients(self, profile, region, max_pool_connections)
+
+    def evict_idle(self, now: float | None = None) -> int:
+        """
+        Descarta clientes (e sessoes sem clientes) ociosos ha mais de idle_ttl_s.
+        So remove a referencia do registro: uma coleta longa que ainda segura o
+        cliente continua usando-o, e o pool e liberado quando ele sai de uso.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [k for k, entry in self._clients.items() if now - entry[2] > self.idle_ttl_s]
+            for key in idle:
+                del self._clients[key]
+            if idle:
+                in_use = {(k[0], k[1]) for k in self._clients}
+                for key in [k for k in self._sessions if k not in in_use]:
+                    del self._sessions[key]
+        return len(idle)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+            self._sessions.clear()
+
+
+class ScopedClients:
+    """Clientes de um profile/regiao via registro; substitui a Session nos coletores."""
+
+    def __init__(self, registry: ClientRegistry, profile: str, region: str, max_pool_connections: int):
+        self._registry = registry
+        self.profile = profile
+        self.region = region
+        self.max_pool_connections = max_pool_connections
+
+    def client(self, service: str):
+        return self._registry.client(self.profile, self.region, service, self.max_pool_connections)
+
+
+_registry = ClientRegistry()
+
+
+def get_registry() -> ClientRegistry:
+    return _registry
+
+
+def get_client(
+    profile: str,
+    region: str,
+    service: str,
+    max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+):
+    """Cliente compartilhado do registro do processo."""
+    return _registry.client(profile, region, service, max_pool_connections)
+
+
+def scoped_clients(profile: str, region: str, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS) -> ScopedClients:
+    return _registry.scoped(profile, region, max_pool_connections)
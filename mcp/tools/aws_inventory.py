@@ -3,20 +3,143 @@ aws_inventory.py — Inventario de recursos AWS via boto3
 
 Coleta: EC2, ALB, NLB, EBS, RDS
 Compara com Terraform se repo_path fornecido.
+Modo fan-out: varios profiles x regioes coletados em paralelo num inventario unico.
+Cada execucao grava um snapshot e reporta o diff contra a anterior.
 Salva resultado em docs/analise-{env}-{date}/inventario.md
 """
 
 import os
-import boto3
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from typing import Optional
 
+from tools.aws_clients import scoped_clients
+from tools.inventory_records import (
+    UNATTACHED,
+    EbsVolume,
+    Ec2Instance,
+    LoadBalancer,
+    RdsInstance,
+    ResourceIndex,
+    as_dicts,
+    build_indexes,
+)
+from tools.inventory_snapshot import (
+    SectionCache,
+    build_diff_section,
+    build_snapshot,
+    code_digest,
+    diff_snapshots,
+    load_snapshot,
+    save_snapshot,
+    section_digests,
+    snapshot_paths,
+)
+from tools.terraform_state import scan_terraform_ids
+
 TZ_BR = timezone(timedelta(hours=-3))
 
+# Chamadas describe_target_health simultaneas
+TARGET_HEALTH_WORKERS = 8
+
+# Coletores executados em paralelo no run_inventory
+COLLECTORS = ("ec2", "alb", "ebs", "rds")
+
+# IDs extraidos dos states Terraform, ao lado do snapshot do inventario
+TF_CACHE_FILENAME = "terraform-state-ids.json"
+
+# Combinacoes profile x regiao coletadas em paralelo no modo fan-out
+FANOUT_WORKERS = 6
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), "..", "config")
+
+# ELBv2 describe_tags aceita ate 20 ARNs por chamada
+ELB_TAGS_BATCH = 20
+
+# Versao do renderizador das secoes (codigo dos builders e dos registros): chave do SectionCache
+SECTION_RENDERER = code_digest(__file__, os.path.join(os.path.dirname(__file__), "inventory_records.py"))
+
+
+def load_tag_filter(project: str, environment: str) -> Optional[dict]:
+    """
+    Filtro de ambiente do config/inventory.yaml, com sobrescritas do projeto.
+    Retorna {'key': tag, 'values': [...]} ou None se desabilitado.
+    """
+    path = os.path.join(CONFIG_DIR, "inventory.yaml")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    base = config.get("environment_filter") or {}
+    override = (config.get("projects") or {}).get(project) or {}
+    if not override.get("enabled", base.get("enabled", False)):
+        return None
+    values = {**(base.get("values") or {}), **(override.get("values") or {})}
+    accepted = [environment] + [v for v in values.get(environment, []) if v != environment]
+    return {"key": override.get("tag_key", base.get("tag_key", "Environment")), "values": accepted}
+
+
+def _api_filters(tag_filter: Optional[dict]) -> list[dict]:
+    """Filters do EC2 (instancias e volumes) para o filtro de tag."""
+    if not tag_filter:
+        return []
+    return [{"Name": f"tag:{tag_filter['key']}", "Values": tag_filter["values"]}]
+
+
+def _filter_header(tag_filter: Optional[dict]) -> list[str]:
+    if not tag_filter:
+        return []
+    return [f"**Filtro:** tag `{tag_filter['key']}` = {', '.join(tag_filter['values'])}  "]
+
+
+def _has_unfiltered(session, kind: str) -> bool:
+    """Uma chamada curta, sem filtro: a conta/regiao tem algum recurso do tipo?"""
+    if kind == "ec2":
+        page = session.client("ec2").describe_instances(MaxResults=5)
+        return any(res["Instances"] for res in page["Reservations"])
+    if kind == "ebs":
+        return bool(session.client("ec2").describe_volumes(MaxResults=5)["Volumes"])
+    if kind == "alb":
+        return bool(session.client("elbv2").describe_load_balancers(PageSize=1)["LoadBalancers"])
+    return bool(session.client("rds").describe_db_instances(MaxRecords=20)["DBInstances"])
+
+
+def _filter_warnings(session, collected: dict, tag_filter: Optional[dict]) -> list[str]:
+    """
+    Tipos que o filtro de tag zerou mas que existem na conta/regiao: a tag falta
+    ou tem valor fora da lista (no EC2/EBS a comparacao diferencia maiusculas).
+    """
+    if not tag_filter:
+        return []
+    warnings = []
+    for kind, label in _TERRAFORM_LABELS.items():
+        if collected[kind]:
+            continue
+        try:
+            dropped = _has_unfiltered(session, kind)
+        except Exception:
+            continue
+        if dropped:
+            warnings.append(
+                f"{label}: nenhum recurso com a tag `{tag_filter['key']}` = {', '.join(tag_filter['values'])}, "
+                f"mas existem {label} sem essa tag/valor"
+            )
+    return warnings
+
+
+def _warning_lines(warnings: list[str]) -> list[str]:
+    if not warnings:
+        return []
+    return ["", *(f"> **Aviso (filtro de tag):** {w}  " for w in warnings)]
 
-def _boto_session(aws_profile: str, region: str):
-    return boto3.Session(profile_name=aws_profile, region_name=region)
+
+def _tags_match(tags: list, tag_filter: Optional[dict]) -> bool:
+    if not tag_filter:
+        return True
+    return any(t["Key"] == tag_filter["key"] and t["Value"] in tag_filter["values"] for t in tags or [])
 
 
 def _fmt_tags(tags: list) -> str:
@@ -26,107 +149,154 @@ def _fmt_tags(tags: list) -> str:
     return d.get("Name", "")
 
 
-def collect_ec2(session) -> list[dict]:
+def collect_ec2(session, tag_filter: Optional[dict] = None) -> list[Ec2Instance]:
     ec2 = session.client("ec2")
     instances = []
     paginator = ec2.get_paginator("describe_instances")
-    for page in paginator.paginate():
+    for page in paginator.paginate(Filters=_api_filters(tag_filter)):
         for res in page["Reservations"]:
             for inst in res["Instances"]:
-                instances.append({
-                    "id": inst["InstanceId"],
-                    "name": _fmt_tags(inst.get("Tags", [])),
-                    "type": inst["InstanceType"],
-                    "state": inst["State"]["Name"],
-                    "az": inst["Placement"]["AvailabilityZone"],
-                    "private_ip": inst.get("PrivateIpAddress", ""),
-                    "public_ip": inst.get("PublicIpAddress", ""),
-                    "launch_time": inst["LaunchTime"].strftime("%Y-%m-%d"),
-                })
+                instances.append(Ec2Instance(
+                    id=inst["InstanceId"],
+                    name=_fmt_tags(inst.get("Tags", [])),
+                    type=inst["InstanceType"],
+                    state=inst["State"]["Name"],
+                    az=inst["Placement"]["AvailabilityZone"],
+                    private_ip=inst.get("PrivateIpAddress", ""),
+                    public_ip=inst.get("PublicIpAddress", ""),
+                    launch_time=inst["LaunchTime"].strftime("%Y-%m-%d"),
+                ))
     return instances
 
 
-def collect_alb(session) -> list[dict]:
+def _target_health_counts(elbv2, tg_arn: str) -> dict:
+    """Conta targets por estado de um target group."""
+    counts = {"healthy": 0, "unhealthy": 0, "total": 0}
+    try:
+        resp = elbv2.describe_target_health(TargetGroupArn=tg_arn)
+    except Exception:
+        return counts
+    for desc in resp.get("TargetHealthDescriptions", []):
+        state = desc.get("TargetHealth", {}).get("State", "")
+        counts["total"] += 1
+        if state == "healthy":
+            counts["healthy"] += 1
+        elif state in ("unhealthy", "unavailable"):
+            counts["unhealthy"] += 1
+    return counts
+
+
+def _elb_arns_matching(elbv2, arns: list[str], tag_filter: dict, pool: ThreadPoolExecutor) -> set[str]:
+    """ARNs de LBs cujas tags casam com o filtro (describe_tags em lotes de 20)."""
+    batches = [arns[i:i + ELB_TAGS_BATCH] for i in range(0, len(arns), ELB_TAGS_BATCH)]
+    matching = set()
+    for resp in pool.map(lambda batch: elbv2.describe_tags(ResourceArns=batch), batches):
+        for desc in resp.get("TagDescriptions", []):
+            if _tags_match(desc.get("Tags", []), tag_filter):
+                matching.add(desc["ResourceArn"])
+    return matching
+
+
+def collect_alb(session, tag_filter: Optional[dict] = None) -> list[LoadBalancer]:
+    """
+    Coleta load balancers com target groups e saude dos targets.
+    LBs fora do filtro de tag sao descartados antes de qualquer outra chamada.
+    Target groups vem de uma unica listagem paginada, unida localmente pelo
+    ARN do LB. A API de saude so aceita um target group por chamada, entao
+    essas chamadas rodam em paralelo (uma por TG, nunca por LB).
+    """
     elbv2 = session.client("elbv2")
-    lbs = []
+
+    raw_lbs = []
     paginator = elbv2.get_paginator("describe_load_balancers")
     for page in paginator.paginate():
-        for lb in page["LoadBalancers"]:
-            # Target groups
-            tgs_resp = elbv2.describe_target_groups(LoadBalancerArn=lb["LoadBalancerArn"])
-            tg_names = [tg["TargetGroupName"] for tg in tgs_resp.get("TargetGroups", [])]
-            lbs.append({
-                "name": lb["LoadBalancerName"],
-                "type": lb["Type"],
-                "scheme": lb["Scheme"],
-                "state": lb["State"]["Code"],
-                "arn": lb["LoadBalancerArn"],
-                "dns": lb["DNSName"],
-                "target_groups": tg_names,
-            })
+        raw_lbs.extend(page["LoadBalancers"])
+
+    with ThreadPoolExecutor(max_workers=TARGET_HEALTH_WORKERS) as pool:
+        if tag_filter and raw_lbs:
+            keep = _elb_arns_matching(elbv2, [lb["LoadBalancerArn"] for lb in raw_lbs], tag_filter, pool)
+            raw_lbs = [lb for lb in raw_lbs if lb["LoadBalancerArn"] in keep]
+        if not raw_lbs:
+            return []
+
+        lb_arns = {lb["LoadBalancerArn"] for lb in raw_lbs}
+        tgs_by_lb: dict[str, list[dict]] = {}
+        paginator = elbv2.get_paginator("describe_target_groups")
+        for page in paginator.paginate():
+            for tg in page["TargetGroups"]:
+                for lb_arn in tg.get("LoadBalancerArns", []):
+                    if lb_arn in lb_arns:
+                        tgs_by_lb.setdefault(lb_arn, []).append(tg)
+
+        arns = sorted({tg["TargetGroupArn"] for tgs in tgs_by_lb.values() for tg in tgs})
+        health = dict(zip(arns, pool.map(lambda arn: _target_health_counts(elbv2, arn), arns)))
+
+    lbs = []
+    for lb in raw_lbs:
+        tgs = tgs_by_lb.get(lb["LoadBalancerArn"], [])
+        counts = [health.get(tg["TargetGroupArn"], {}) for tg in tgs]
+        lbs.append(LoadBalancer(
+            name=lb["LoadBalancerName"],
+            type=lb["Type"],
+            scheme=lb["Scheme"],
+            state=lb["State"]["Code"],
+            arn=lb["LoadBalancerArn"],
+            dns=lb["DNSName"],
+            target_groups=tuple(tg["TargetGroupName"] for tg in tgs),
+            targets_total=sum(c.get("total", 0) for c in counts),
+            targets_healthy=sum(c.get("healthy", 0) for c in counts),
+            targets_unhealthy=sum(c.get("unhealthy", 0) for c in counts),
+        ))
     return lbs
 
 
-def collect_ebs(session) -> list[dict]:
+def collect_ebs(session, tag_filter: Optional[dict] = None) -> list[EbsVolume]:
     ec2 = session.client("ec2")
     volumes = []
     paginator = ec2.get_paginator("describe_volumes")
-    for page in paginator.paginate():
+    for page in paginator.paginate(Filters=_api_filters(tag_filter)):
         for vol in page["Volumes"]:
             attachments = vol.get("Attachments", [])
-            attached_to = attachments[0]["InstanceId"] if attachments else "unattached"
-            volumes.append({
-                "id": vol["VolumeId"],
-                "name": _fmt_tags(vol.get("Tags", [])),
-                "type": vol["VolumeType"],
-                "size_gb": vol["Size"],
-                "state": vol["State"],
-                "iops": vol.get("Iops", ""),
-                "throughput": vol.get("Throughput", ""),
-                "attached_to": attached_to,
-                "az": vol["AvailabilityZone"],
-            })
+            attached_to = attachments[0]["InstanceId"] if attachments else UNATTACHED
+            volumes.append(EbsVolume(
+                id=vol["VolumeId"],
+                name=_fmt_tags(vol.get("Tags", [])),
+                type=vol["VolumeType"],
+                size_gb=vol["Size"],
+                state=vol["State"],
+                iops=vol.get("Iops", ""),
+                throughput=vol.get("Throughput", ""),
+                attached_to=attached_to,
+                az=vol["AvailabilityZone"],
+            ))
     return volumes
 
 
-def collect_rds(session) -> list[dict]:
+def collect_rds(session, tag_filter: Optional[dict] = None) -> list[RdsInstance]:
     rds = session.client("rds")
     dbs = []
+    # describe_db_instances nao filtra por tag na API; TagList vem na resposta
     paginator = rds.get_paginator("describe_db_instances")
     for page in paginator.paginate():
         for db in page["DBInstances"]:
-            dbs.append({
-                "id": db["DBInstanceIdentifier"],
-                "engine": f"{db['Engine']} {db['EngineVersion']}",
-                "class": db["DBInstanceClass"],
-                "status": db["DBInstanceStatus"],
-                "storage_gb": db["AllocatedStorage"],
-                "storage_type": db["StorageType"],
-                "multi_az": db["MultiAZ"],
-                "endpoint": db.get("Endpoint", {}).get("Address", ""),
-            })
+            if not _tags_match(db.get("TagList", []), tag_filter):
+                continue
+            dbs.append(RdsInstance(
+                id=db["DBInstanceIdentifier"],
+                engine=f"{db['Engine']} {db['EngineVersion']}",
+                db_class=db["DBInstanceClass"],
+                status=db["DBInstanceStatus"],
+                storage_gb=db["AllocatedStorage"],
+                storage_type=db["StorageType"],
+                multi_az=db["MultiAZ"],
+                endpoint=db.get("Endpoint", {}).get("Address", ""),
+            ))
     return dbs
 
 
 def _terraform_ec2_ids(repo_path: str) -> set[str]:
-    """Extrai IDs de instancias EC2 do state Terraform (busca simples em .tfstate)."""
-    ids = set()
-    if not repo_path:
-        return ids
-    for tfstate in Path(repo_path).rglob("*.tfstate"):
-        try:
-            import json
-            data = json.loads(tfstate.read_text())
-            resources = data.get("resources", [])
-            for res in resources:
-                if res.get("type") == "aws_instance":
-                    for inst in res.get("instances", []):
-                        iid = inst.get("attributes", {}).get("id")
-                        if iid:
-                            ids.add(iid)
-        except Exception:
-            pass
-    return ids
+    """Extrai IDs de instancias EC2 dos states Terraform do repositorio."""
+    return scan_terraform_ids(repo_path)["ec2"]
 
 
 def build_inventory_report(
@@ -137,115 +307,274 @@ def build_inventory_report(
     environment: str,
     region: str,
     repo_path: str = "",
+    sections: Optional[SectionCache] = None,
+    digests: Optional[dict] = None,
+    changes: Optional[list[str]] = None,
+    tf_cache_path: str = "",
+    tag_filter: Optional[dict] = None,
+    indexes: Optional[dict[str, ResourceIndex]] = None,
+    filter_warnings: Optional[list[str]] = None,
 ) -> str:
-    """Constroi o markdown do inventario."""
+    """
+    Constroi o markdown do inventario.
+    sections/digests reaproveitam secoes inalteradas; changes e a secao de diff;
+    tf_cache_path guarda os IDs ja extraidos dos states Terraform.
+    indexes (de collect_all) evita reindexar as listas.
+    filter_warnings: tipos zerados pelo filtro de tag (ver _filter_warnings)
+    """
+    if indexes is None:
+        indexes = build_indexes({
+            "ec2": ec2_instances, "alb": load_balancers, "ebs": ebs_volumes, "rds": rds_instances,
+        })
     lines = [
         f"# Inventario de Recursos AWS",
         f"",
         f"**Ambiente:** {environment.upper()}  ",
         f"**Regiao:** {region}  ",
+        *_filter_header(tag_filter),
         f"**Data:** {datetime.now(TZ_BR).strftime('%Y-%m-%d %H:%M')} (BRT)  ",
+        *_warning_lines(filter_warnings or []),
         f"",
         f"---",
         f"",
-        f"## Instancias EC2",
+    ]
+    lines += _inventory_sections(indexes, sections=sections, digests=digests)
+    lines += changes or []
+    if repo_path:
+        aws_ids = {kind: index.ids for kind, index in indexes.items()}
+        lines += _terraform_section(repo_path, aws_ids, tf_cache_path)
+    return "\n".join(lines)
+
+
+def _ec2_section(index: ResourceIndex, h: str) -> list[str]:
+    lines = [
+        f"{h} Instancias EC2",
         f"",
         f"| ID | Nome | Tipo | Estado | AZ | IP Privado |",
         f"|---|---|---|---|---|---|",
     ]
-    for i in ec2_instances:
-        lines.append(f"| {i['id']} | {i['name']} | {i['type']} | {i['state']} | {i['az']} | {i['private_ip']} |")
+    for i in index.records:
+        lines.append(f"| {i.id} | {i.name} | {i.type} | {i.state} | {i.az} | {i.private_ip} |")
 
-    if not ec2_instances:
+    if not index:
         lines.append("| — | Nenhuma instancia encontrada | | | | |")
 
+    by_state = f" ({index.state_summary()})" if index else ""
     lines += [
         f"",
-        f"**Total:** {len(ec2_instances)} instancia(s)",
+        f"**Total:** {len(index)} instancia(s){by_state}",
         f"",
         f"---",
         f"",
-        f"## Load Balancers (ALB/NLB)",
+    ]
+    return lines
+
+
+def _alb_section(index: ResourceIndex, h: str) -> list[str]:
+    lines = [
+        f"{h} Load Balancers (ALB/NLB)",
         f"",
-        f"| Nome | Tipo | Scheme | Estado | Target Groups |",
-        f"|---|---|---|---|---|",
+        f"| Nome | Tipo | Scheme | Estado | Target Groups | Targets (saudaveis/total) | Nao saudaveis |",
+        f"|---|---|---|---|---|---|---|",
     ]
-    for lb in load_balancers:
-        tgs = ", ".join(lb["target_groups"]) or "—"
-        lines.append(f"| {lb['name']} | {lb['type']} | {lb['scheme']} | {lb['state']} | {tgs} |")
+    for lb in index.records:
+        tgs = ", ".join(lb.target_groups) or "—"
+        unhealthy = lb.targets_unhealthy
+        lines.append(
+            f"| {lb.name} | {lb.type} | {lb.scheme} | {lb.state} | {tgs} | {lb.targets_healthy}/{lb.targets_total} "
+            f"| {f'**{unhealthy}**' if unhealthy else 0} |"
+        )
 
-    if not load_balancers:
-        lines.append("| — | Nenhum LB encontrado | | | |")
+    if not index:
+        lines.append("| — | Nenhum LB encontrado | | | | | |")
 
     lines += [
         f"",
-        f"**Total:** {len(load_balancers)} load balancer(s)",
+        f"**Total:** {len(index)} load balancer(s)  ",
+        f"**Targets nao saudaveis:** {index.unhealthy_targets}",
         f"",
         f"---",
         f"",
-        f"## Volumes EBS",
+    ]
+    return lines
+
+
+def _ebs_section(index: ResourceIndex, h: str) -> list[str]:
+    lines = [
+        f"{h} Volumes EBS",
         f"",
         f"| ID | Nome | Tipo | Tamanho | Estado | Anexado a |",
         f"|---|---|---|---|---|---|",
     ]
-    for v in ebs_volumes:
-        size = f"{v['size_gb']} GB"
-        lines.append(f"| {v['id']} | {v['name']} | {v['type']} | {size} | {v['state']} | {v['attached_to']} |")
+    for v in index.records:
+        lines.append(f"| {v.id} | {v.name} | {v.type} | {v.size_gb} GB | {v.state} | {v.attached_to} |")
 
-    unattached = [v for v in ebs_volumes if v["attached_to"] == "unattached"]
-    if not ebs_volumes:
+    if not index:
         lines.append("| — | Nenhum volume encontrado | | | | |")
 
     lines += [
         f"",
-        f"**Total:** {len(ebs_volumes)} volume(s)  ",
-        f"**Orfaos (unattached):** {len(unattached)}",
+        f"**Total:** {len(index)} volume(s)  ",
+        f"**Orfaos (unattached):** {len(index.unattached)}",
         f"",
         f"---",
         f"",
-        f"## Bancos de Dados RDS",
+    ]
+    return lines
+
+
+def _rds_section(index: ResourceIndex, h: str) -> list[str]:
+    lines = [
+        f"{h} Bancos de Dados RDS",
         f"",
         f"| ID | Engine | Classe | Estado | Storage | Multi-AZ |",
         f"|---|---|---|---|---|---|",
     ]
-    for db in rds_instances:
-        lines.append(f"| {db['id']} | {db['engine']} | {db['class']} | {db['status']} | {db['storage_gb']} GB | {db['multi_az']} |")
+    for db in index.records:
+        lines.append(f"| {db.id} | {db.engine} | {db.db_class} | {db.status} | {db.storage_gb} GB | {db.multi_az} |")
 
-    if not rds_instances:
+    if not index:
         lines.append("| — | Nenhuma instancia RDS encontrada | | | | |")
 
     lines += [
         f"",
-        f"**Total:** {len(rds_instances)} instancia(s) RDS",
+        f"**Total:** {len(index)} instancia(s) RDS",
         f"",
     ]
+    return lines
 
-    # Comparativo Terraform
-    if repo_path:
-        tf_ids = _terraform_ec2_ids(repo_path)
-        aws_ids = {i["id"] for i in ec2_instances}
-        only_aws = aws_ids - tf_ids
-        only_tf = tf_ids - aws_ids
 
-        lines += [
-            f"---",
-            f"",
-            f"## Comparativo Terraform vs AWS",
-            f"",
-            f"| Situacao | Instancias |",
-            f"|---|---|",
-            f"| Gerenciadas pelo Terraform | {len(tf_ids & aws_ids)} |",
-            f"| Somente na AWS (orfas) | {len(only_aws)} |",
-            f"| Somente no Terraform (inexistentes) | {len(only_tf)} |",
-            f"",
-        ]
-        if only_aws:
-            lines.append("**Instancias orfas (nao gerenciadas pelo Terraform):**")
-            for iid in only_aws:
-                lines.append(f"- `{iid}`")
+_SECTION_BUILDERS = {"ec2": _ec2_section, "alb": _alb_section, "ebs": _ebs_section, "rds": _rds_section}
+
+
+def _inventory_sections(
+    indexes: dict[str, ResourceIndex],
+    h: str = "##",
+    sections: Optional[SectionCache] = None,
+    digests: Optional[dict] = None,
+) -> list[str]:
+    """
+    Secoes EC2/LB/EBS/RDS do inventario; h define o nivel dos titulos.
+    Com sections + digests, secoes cujo conteudo nao mudou vem do cache.
+    """
+    lines = []
+    for kind, build in _SECTION_BUILDERS.items():
+        if sections is not None and digests:
+            lines += sections.render(digests[kind], lambda: build(indexes[kind], h))
+        else:
+            lines += build(indexes[kind], h)
+    return lines
+
+
+_TERRAFORM_LABELS = {
+    "ec2": "Instancias EC2",
+    "alb": "Load Balancers",
+    "ebs": "Volumes EBS",
+    "rds": "Instancias RDS",
+}
+
+
+def _terraform_section(repo_path: str, aws_ids: dict, cache_path: str = "") -> list[str]:
+    """
+    Comparativo Terraform vs AWS por tipo de recurso.
+    aws_ids: {'ec2': ids, 'alb': arns, ...} (ResourceIndex.ids ou sets).
+    """
+    tf_ids = scan_terraform_ids(repo_path, cache_path)
+
+    lines = [
+        f"---",
+        f"",
+        f"## Comparativo Terraform vs AWS",
+        f"",
+        f"| Recurso | Gerenciados pelo Terraform | Somente na AWS (orfaos) | Somente no Terraform (inexistentes) |",
+        f"|---|---|---|---|",
+    ]
+    orphans = {}
+    for kind, label in _TERRAFORM_LABELS.items():
+        ids = aws_ids.get(kind, set())
+        orphans[kind] = sorted(ids - tf_ids[kind])
+        only_tf = tf_ids[kind] - ids
+        lines.append(f"| {label} | {len(ids & tf_ids[kind])} | {len(orphans[kind])} | {len(only_tf)} |")
+    lines.append("")
+
+    for kind, label in _TERRAFORM_LABELS.items():
+        if orphans[kind]:
+            lines.append(f"**Orfaos — {label} (nao gerenciados pelo Terraform):**")
+            for rid in orphans[kind]:
+                lines.append(f"- `{rid}`")
             lines.append("")
+    return lines
 
-    return "\n".join(lines)
+
+def collect_all(aws_profile: str, region: str, tag_filter: Optional[dict] = None) -> dict:
+    """
+    Executa os coletores EC2/ALB/EBS/RDS em paralelo com os clientes compartilhados
+    do processo (tools.aws_clients), aplicando o filtro de tag de ambiente.
+    Retorna {'ec2': [...], 'alb': [...], 'ebs': [...], 'rds': [...], 'timings': {...},
+    'index': {tipo: ResourceIndex}, 'filter_warnings': [...]}; os indices servem
+    relatorio, comparativo e IDs.
+    """
+    clients = scoped_clients(aws_profile, region, max_pool_connections=len(COLLECTORS) + TARGET_HEALTH_WORKERS)
+    collectors = {"ec2": collect_ec2, "alb": collect_alb, "ebs": collect_ebs, "rds": collect_rds}
+
+    def _timed(kind: str):
+        t0 = time.perf_counter()
+        result = collectors[kind](clients, tag_filter)
+        return result, round(time.perf_counter() - t0, 3)
+
+    # Coletores independentes: rodam em paralelo; tempo medido por coletor
+    with ThreadPoolExecutor(max_workers=len(COLLECTORS)) as pool:
+        futures = {kind: pool.submit(_timed, kind) for kind in COLLECTORS}
+        results = {kind: f.result() for kind, f in futures.items()}
+
+    collected = {kind: results[kind][0] for kind in COLLECTORS}
+    collected["timings"] = {kind: results[kind][1] for kind in COLLECTORS}
+    collected["index"] = build_indexes(collected)
+    collected["filter_warnings"] = _filter_warnings(clients, collected, tag_filter)
+    return collected
+
+
+def _snapshot_stage(docs_dir: str, environment: str, collected_by_scope: dict[str, dict]) -> dict:
+    """Carrega o snapshot anterior, monta o atual e calcula o diff dos escopos coletados."""
+    snapshot_path, sections_path = snapshot_paths(docs_dir, environment)
+    previous_at, previous = load_snapshot(snapshot_path)
+    current = {}
+    for scope, collected in collected_by_scope.items():
+        current.update(build_snapshot(scope, collected))
+    scopes = set(collected_by_scope)
+    # Escopos sem snapshot anterior ficam fora do diff (tudo seria "adicionado")
+    compared = scopes & {key[0] for key in previous}
+    compared_current = {k: v for k, v in current.items() if k[0] in compared}
+    return {
+        "snapshot_path": snapshot_path,
+        "previous_at": previous_at,
+        "previous": previous,
+        "current": current,
+        "scopes": scopes,
+        "diff": diff_snapshots(previous, compared_current, compared) if compared else None,
+        "sections": SectionCache(sections_path, SECTION_RENDERER),
+        "tf_cache_path": os.path.join(os.path.dirname(snapshot_path), TF_CACHE_FILENAME),
+    }
+
+
+def _changes_section(snap: dict, show_scope: bool) -> list[str]:
+    if snap["diff"] is None:
+        return []
+    return build_diff_section(snap["diff"], snap["previous_at"], show_scope=show_scope)
+
+
+def _changes_summary(snap: dict) -> dict:
+    if snap["diff"] is None:
+        return {"previous": None}
+    return {"previous": snap["previous_at"], **{k: len(v) for k, v in snap["diff"].items()}}
+
+
+def _save_snapshot_stage(snap: dict) -> None:
+    save_snapshot(
+        snap["snapshot_path"], snap["current"], snap["previous"], snap["scopes"],
+        taken_at=datetime.now(TZ_BR).strftime("%Y-%m-%d %H:%M"),
+    )
+    snap["sections"].save()
 
 
 def run_inventory(
@@ -255,35 +584,199 @@ def run_inventory(
     environment: str,
     docs_dir: str,
     repo_path: str = "",
+    filter_by_tag: bool = True,
 ) -> dict:
     """
     Executa inventario completo e salva inventario.md.
-    Retorna dict com resource_ids e caminho do arquivo gerado.
+    Os coletores EC2/ALB/EBS/RDS rodam em paralelo com clientes compartilhados do processo.
+    filter_by_tag: aplica o filtro de tag de ambiente, se habilitado no config/inventory.yaml
+    Retorna dict com resource_ids, caminho do arquivo gerado e timings por coletor.
+    filter_warnings lista os tipos que o filtro zerou mas existem na conta/regiao.
     """
-    session = _boto_session(aws_profile, region)
-
-    ec2_instances = collect_ec2(session)
-    load_balancers = collect_alb(session)
-    ebs_volumes = collect_ebs(session)
-    rds_instances = collect_rds(session)
+    tag_filter = load_tag_filter(project, environment) if filter_by_tag else None
+    collected = collect_all(aws_profile, region, tag_filter)
+    ec2_instances, load_balancers, ebs_volumes, rds_instances = (collected[k] for k in COLLECTORS)
 
+    scope = f"{aws_profile}/{region}"
+    snap = _snapshot_stage(docs_dir, environment, {scope: collected})
     report_md = build_inventory_report(
         ec2_instances, load_balancers, ebs_volumes, rds_instances,
         environment, region, repo_path,
+        sections=snap["sections"],
+        digests=section_digests(snap["current"], scope, "##"),
+        changes=_changes_section(snap, show_scope=False),
+        tf_cache_path=snap["tf_cache_path"],
+        tag_filter=tag_filter,
+        indexes=collected["index"],
+        filter_warnings=collected["filter_warnings"],
     )
 
     os.makedirs(docs_dir, exist_ok=True)
     output_path = os.path.join(docs_dir, "inventario.md")
     Path(output_path).write_text(report_md, encoding="utf-8")
+    _save_snapshot_stage(snap)
+
+    return {
+        "output_path": output_path,
+        **_resource_ids(collected["index"]),
+        "ec2_instances": as_dicts(ec2_instances),
+        "load_balancers": as_dicts(load_balancers),
+        "ebs_volumes": as_dicts(ebs_volumes),
+        "rds_instances": as_dicts(rds_instances),
+        "timings": collected["timings"],
+        "tag_filter": tag_filter,
+        "filter_warnings": collected["filter_warnings"],
+        "snapshot_path": snap["snapshot_path"],
+        "changes": _changes_summary(snap),
+    }
+
+
+def _resource_ids(indexes: dict[str, ResourceIndex]) -> dict[str, list[str]]:
+    return {
+        "ec2_ids": list(indexes["ec2"].ids),
+        "alb_arns": list(indexes["alb"].ids),
+        "ebs_ids": list(indexes["ebs"].ids),
+        "rds_ids": list(indexes["rds"].ids),
+    }
+
+
+def _fanout_target(aws_profile: str, region: str, tag_filter: Optional[dict] = None) -> dict:
+    """Coleta uma combinacao conta x regiao; erros ficam no proprio resultado."""
+    t0 = time.perf_counter()
+    try:
+        collected = collect_all(aws_profile, region, tag_filter)
+        error = ""
+    except Exception as e:
+        collected = {kind: [] for kind in COLLECTORS}
+        collected["timings"] = {}
+        collected["index"] = build_indexes(collected)
+        collected["filter_warnings"] = []
+        error = str(e)
+    collected.update({
+        "profile": aws_profile,
+        "region": region,
+        "error": error,
+        "elapsed": round(time.perf_counter() - t0, 3),
+    })
+    return collected
+
+
+def _fanout_warnings(targets: list[dict]) -> list[str]:
+    return [f"{t['profile']}/{t['region']} — {w}" for t in targets for w in t.get("filter_warnings", [])]
+
+
+def build_fanout_report(
+    targets: list[dict],
+    environment: str,
+    repo_path: str = "",
+    snap: Optional[dict] = None,
+    tf_cache_path: str = "",
+    tag_filter: Optional[dict] = None,
+) -> str:
+    """Markdown do inventario consolidado de varias contas/regioes (snap: estagio de snapshot/diff)."""
+    profiles = sorted({t["profile"] for t in targets})
+    regions = sorted({t["region"] for t in targets})
+    lines = [
+        f"# Inventario de Recursos AWS",
+        f"",
+        f"**Ambiente:** {environment.upper()}  ",
+        f"**Contas (profiles):** {', '.join(profiles)}  ",
+        f"**Regioes:** {', '.join(regions)}  ",
+        *_filter_header(tag_filter),
+        f"**Data:** {datetime.now(TZ_BR).strftime('%Y-%m-%d %H:%M')} (BRT)  ",
+        *_warning_lines(_fanout_warnings(targets)),
+        f"",
+        f"---",
+        f"",
+        f"## Resumo por Conta e Regiao",
+        f"",
+        f"| Profile | Regiao | EC2 | LBs | EBS | RDS | Tempo (s) | Erro |",
+        f"|---|---|---|---|---|---|---|---|",
+    ]
+    for t in targets:
+        lines.append(
+            f"| {t['profile']} | {t['region']} | {len(t['ec2'])} | {len(t['alb'])} | {len(t['ebs'])} "
+            f"| {len(t['rds'])} | {t['elapsed']} | {t['error'] or '—'} |"
+        )
+    lines += [
+        f"| **Total** | | {sum(len(t['ec2']) for t in targets)} | {sum(len(t['alb']) for t in targets)} "
+        f"| {sum(len(t['ebs']) for t in targets)} | {sum(len(t['rds']) for t in targets)} | | |",
+        f"",
+    ]
+
+    for t in targets:
+        if t["error"]:
+            continue
+        lines += [
+            f"---",
+            f"",
+            f"## Conta {t['profile']} — {t['region']}",
+            f"",
+        ]
+        scope = f"{t['profile']}/{t['region']}"
+        lines += _inventory_sections(
+            t["index"], h="###",
+            sections=snap["sections"] if snap else None,
+            digests=section_digests(snap["current"], scope, "###") if snap else None,
+        )
+
+    if snap:
+        lines += _changes_section(snap, show_scope=True)
+    if repo_path:
+        aws_ids = {kind: set().union(*(t["index"][kind].ids for t in targets)) for kind in COLLECTORS}
+        lines += _terraform_section(repo_path, aws_ids, tf_cache_path)
+    return "\n".join(lines)
+
+
+def run_inventory_fanout(
+    project: str,
+    aws_profiles: list[str],
+    regions: list[str],
+    environment: str,
+    docs_dir: str,
+    repo_path: str = "",
+    max_workers: int = FANOUT_WORKERS,
+    filter_by_tag: bool = True,
+) -> dict:
+    """
+    Inventario de todas as combinacoes profile x regiao em paralelo.
+    Salva um unico inventario.md com resumo e secoes por conta/regiao.
+    Retorna os IDs combinados e, em targets, os IDs de cada combinacao
+    (CloudWatch e regional: as fases seguintes consultam por profile/regiao).
+    """
+    tag_filter = load_tag_filter(project, environment) if filter_by_tag else None
+    combos = [(p, r) for p in aws_profiles for r in regions]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(combos)))) as pool:
+        targets = list(pool.map(lambda c: _fanout_target(*c, tag_filter), combos))
+
+    # Combinacoes com erro ficam fora do snapshot: seus recursos nao contam como removidos
+    snap = _snapshot_stage(docs_dir, environment, {
+        f"{t['profile']}/{t['region']}": t for t in targets if not t["error"]
+    })
+    report_md = build_fanout_report(targets, environment, repo_path, snap, snap["tf_cache_path"], tag_filter)
+    os.makedirs(docs_dir, exist_ok=True)
+    output_path = os.path.join(docs_dir, "inventario.md")
+    Path(output_path).write_text(report_md, encoding="utf-8")
+    _save_snapshot_stage(snap)
+
+    per_target = [
+        {"profile": t["profile"], "region": t["region"], "error": t["error"],
+         "timings": t["timings"], **_resource_ids(t["index"])}
+        for t in targets
+    ]
+    combined = {key: [] for key in ("ec2_ids", "alb_arns", "ebs_ids", "rds_ids")}
+    for t in per_target:
+        for key in combined:
+            combined[key].extend(t[key])
 
     return {
         "output_path": output_path,
-        "ec2_ids": [i["id"] for i in ec2_instances],
-        "alb_arns": [lb["arn"] for lb in load_balancers],
-        "ebs_ids": [v["id"] for v in ebs_volumes],
-        "rds_ids": [db["id"] for db in rds_instances],
-        "ec2_instances": ec2_instances,
-        "load_balancers": load_balancers,
-        "ebs_volumes": ebs_volumes,
-        "rds_instances": rds_instances,
+        **{key: sorted(set(ids)) for key, ids in combined.items()},
+        "targets": per_target,
+        "load_balancers": [lb for t in targets for lb in as_dicts(t["alb"])],
+        "errors": [f"{t['profile']}/{t['region']}: {t['error']}" for t in targets if t["error"]],
+        "snapshot_path": snap["snapshot_path"],
+        "changes": _changes_summary(snap),
+        "tag_filter": tag_filter,
+        "filter_warnings": _fanout_warnings(targets),
     }
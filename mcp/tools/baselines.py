@@ -0,0 +1,261 @@
+"""
+baselines.py — Baselines sazonais das series CloudWatch e deteccao de desvios
+
+Cada serie do series-cloudwatch.jsonl ganha um baseline por hora da semana
+(mediana e MAD dos datapoints daquela hora, em BRT). Com pouco historico para a
+hora da semana o baseline cai para a hora do dia. Dois sinais sao procurados:
+
+  desvio:            datapoints da janela recente (baseline.recent_hours) longe
+                     da mediana do seu horario, em MADs (z robusto)
+  mudanca de nivel:  ponto da serie em que o nivel dessazonalizado muda e se
+                     mantem (maior diferenca de medias entre os dois lados,
+                     confirmada pelas medianas)
+
+Os horarios sao calculados uma vez para a coluna de timestamps inteira da
+SeriesTable; cada serie e avaliada sobre as fatias da mesma tabela.
+"""
+
+import math
+from bisect import bisect_right
+from array import array
+from datetime import datetime, timezone, timedelta
+from statistics import median
+
+from tools.metric_series import TZ_OFFSET_S, SeriesTable
+
+TZ_BR = timezone(timedelta(hours=-3))
+
+# Escala do MAD para equivaler ao desvio padrao numa distribuicao normal
+MAD_SCALE = 1.4826
+
+# Piso relativo da dispersao: fracao da mediana abaixo da qual o MAD nao desce
+MIN_RELATIVE_SPREAD = 0.1
+
+# Series avaliadas: (tipo, metrica) -> (tipo exibido, nome, direcao, unidade, escala, casas, piso)
+# direcao: "up" (alta e ruim), "down" (queda e ruim) ou "both"
+# piso: menor dispersao considerada, na unidade da serie (evita alarmes em series quase constantes)
+BASELINE_METRICS = {
+    ("ec2", "cpu"): ("EC2", "CPUUtilization", "up", "%", 1.0, 1, 2.0),
+    ("ec2", "credit_balance"): ("EC2", "CPUCreditBalance", "down", "", 1.0, 0, 5.0),
+    ("ec2", "network_in_bytes"): ("EC2", "NetworkIn", "both", " MB", 1 / 1024 / 1024, 1, 1024 * 1024),
+    ("ec2", "network_out_bytes"): ("EC2", "NetworkOut", "both", " MB", 1 / 1024 / 1024, 1, 1024 * 1024),
+    ("alb", "response_time_s"): ("ALB", "TargetResponseTime", "up", "s", 1.0, 3, 0.02),
+    ("alb", "request_count"): ("ALB", "RequestCount", "both", "/h", 1.0, 0, 10.0),
+    ("alb", "error_5xx"): ("ALB", "HTTPCode_ELB_5XX_Count", "up", "/h", 1.0, 0, 5.0),
+    ("alb", "error_4xx"): ("ALB", "HTTPCode_ELB_4XX_Count", "up", "/h", 1.0, 0, 20.0),
+    ("nlb", "active_flows"): ("NLB", "ActiveFlowCount", "up", "", 1.0, 0, 10.0),
+    ("nlb", "target_resets"): ("NLB", "TCP_Target_Reset_Count", "up", "/h", 1.0, 0, 5.0),
+    ("ebs", "queue_length"): ("EBS", "VolumeQueueLength", "up", "", 1.0, 3, 0.05),
+    ("ebs", "read_latency_s"): ("EBS", "VolumeReadLatency", "up", "s", 1.0, 4, 0.001),
+    ("ebs", "write_latency_s"): ("EBS", "VolumeWriteLatency", "up", "s", 1.0, 4, 0.001),
+    ("ebs", "burst_balance"): ("EBS", "BurstBalance", "down", "%", 1.0, 1, 2.0),
+    ("rds", "cpu"): ("RDS", "CPUUtilization", "up", "%", 1.0, 1, 2.0),
+    ("rds", "freeable_memory_bytes"): ("RDS", "FreeableMemory", "down", " MB", 1 / 1024 / 1024, 0, 32 * 1024 * 1024),
+    ("rds", "read_latency_s"): ("RDS", "ReadLatency", "up", "ms", 1000.0, 2, 0.0005),
+    ("rds", "write_latency_s"): ("RDS", "WriteLatency", "up", "ms", 1000.0, 2, 0.0005),
+    ("rds", "connections"): ("RDS", "DatabaseConnections", "up", "", 1.0, 0, 5.0),
+}
+
+# Defaults da secao baseline do thresholds.yaml
+DEFAULTS = {
+    "recent_hours": 24,
+    "deviation_z": 4.0,
+    "min_deviations": 3,
+    "step_z": 4.0,
+    "step_min_change": 0.5,
+    "min_segment_hours": 24,
+    "min_slot_points": 2,
+}
+
+# Baseline usado na comparacao (campo "baseline" da anomalia) e como aparece no texto
+BASELINE_LABELS = {"week": "hora da semana", "day": "hora do dia", "overall": "serie inteira"}
+
+
+def _slot_columns(table: SeriesTable) -> tuple[array, array]:
+    """Hora da semana (0 = segunda 00h BRT) e hora do dia de todos os datapoints."""
+    hours = [(ts + TZ_OFFSET_S) // 3600 for ts in table.timestamps]
+    # 1970-01-01 foi quinta-feira: +72h alinha o slot 0 na segunda
+    return array("h", ((h + 72) % 168 for h in hours)), array("b", (h % 24 for h in hours))
+
+
+def _median_mad(values: list[float]) -> tuple[float, float]:
+    mid = median(values)
+    return mid, median(abs(v - mid) for v in values)
+
+
+def _seasonal_baseline(values, week_slots, day_slots, min_points: int):
+    """
+    Funcao slot -> (mediana, MAD, baseline) para os datapoints informados: hora da
+    semana quando ha min_points datapoints naquele horario, senao hora do dia e,
+    sem historico na hora do dia, a serie inteira. baseline: chave de BASELINE_LABELS.
+    """
+    by_week: dict[int, list[float]] = {}
+    by_day: dict[int, list[float]] = {}
+    for v, w, d in zip(values, week_slots, day_slots):
+        by_week.setdefault(w, []).append(v)
+        by_day.setdefault(d, []).append(v)
+    day = {d: (*_median_mad(vs), "day") for d, vs in by_day.items()}
+    week = {}
+    for w, vs in by_week.items():
+        if len(vs) >= min_points:
+            mid, mad = _median_mad(vs)
+            # Um unico ponto nao tem dispersao: usa a da mesma hora do dia (slot 0 = 00h)
+            week[w] = (mid, mad if len(vs) > 1 else day[w % 24][1], "week")
+    overall = (*_median_mad(list(values)), "overall") if values else (0.0, 0.0, "overall")
+
+    def lookup(w: int, d: int) -> tuple[float, float, str]:
+        return week.get(w) or day.get(d) or overall
+
+    return lookup
+
+
+def _spread(mad: float, level: float, floor: float) -> float:
+    return max(MAD_SCALE * mad, MIN_RELATIVE_SPREAD * abs(level), floor)
+
+
+def _worse(z: float, direction: str) -> bool:
+    return direction == "both" or (z > 0) == (direction == "up")
+
+
+def _best_split(residuals: list[float], min_segment: int) -> int | None:
+    """Indice que maximiza a diferenca de medias entre os lados (prefixos acumulados)."""
+    n = len(residuals)
+    if n < 2 * min_segment:
+        return None
+    prefix = [0.0]
+    for r in residuals:
+        prefix.append(prefix[-1] + r)
+    total = prefix[-1]
+    best, best_k = 0.0, None
+    for k in range(min_segment, n - min_segment + 1):
+        left, right = prefix[k] / k, (total - prefix[k]) / (n - k)
+        score = abs(left - right) * math.sqrt(k * (n - k) / n)
+        if score > best:
+            best, best_k = score, k
+    return best_k
+
+
+def _fmt(value: float, spec: tuple) -> str:
+    _, _, _, unit, scale, decimals, _ = spec
+    return f"{value * scale:.{decimals}f}{unit}"
+
+
+def _resource_label(kind: str, resource_id: str) -> str:
+    # Load balancers: nome do LB no lugar do ARN (mesmo criterio do relatorio CloudWatch)
+    if kind in ("alb", "nlb") and "loadbalancer/" in resource_id:
+        parts = resource_id.split("loadbalancer/")[-1].split("/")
+        return parts[1] if len(parts) > 1 else parts[0]
+    return resource_id
+
+
+def _when(ts: int) -> str:
+    return datetime.fromtimestamp(ts, TZ_BR).strftime("%Y-%m-%d %Hh")
+
+
+def detect_baseline_anomalies(table: SeriesTable, thresholds: dict) -> list[dict]:
+    """
+    Desvios e mudancas de nivel de todas as series da tabela, no formato de
+    anomalia do analyzer. Uma serie com mudanca de nivel nao repete os desvios
+    da janela recente (sao o mesmo fenomeno). O campo baseline diz contra qual
+    baseline a anomalia foi medida (week, day ou overall; mudanca de nivel: day).
+    """
+    cfg = {**DEFAULTS, **(thresholds.get("baseline") or {})}
+    if not len(table):
+        return []
+    week_col, day_col = _slot_columns(table)
+    period_h = max(1, table.period_seconds // 3600)
+    min_points = int(cfg["min_slot_points"])
+    min_segment = max(2, int(cfg["min_segment_hours"]) // period_h)
+
+    anomalies = []
+    for i, (kind, resource_id, metric) in enumerate(table.keys):
+        spec = BASELINE_METRICS.get((kind, metric))
+        lo, hi = table.offsets[i], table.offsets[i + 1]
+        if spec is None or hi - lo < 2 * min_segment:
+            continue
+        rtype, name, direction, floor = spec[0], spec[1], spec[2], spec[6]
+        resource = _resource_label(kind, resource_id)
+        timestamps, values = table.timestamps, table.values
+        found = _step_change(table, lo, hi, day_col, min_segment, cfg, spec)
+        if found:
+            ts, before, after = found
+            pct = f"{(after - before) / abs(before):+.0%}" if before else "antes zerado"
+            anomalies.append({
+                "resource": resource,
+                "resource_type": rtype,
+                "metric": f"{name} (mudanca de nivel)",
+                "value": f"{_fmt(before, spec)} -> {_fmt(after, spec)} ({pct}) desde {_when(ts)}",
+                "threshold": f">= {cfg['step_min_change']:.0%} e {cfg['step_z']:g} MADs",
+                "severity": "high",
+                "baseline": "day",
+                "description": (
+                    f"{name} mudou de patamar em {resource} desde {_when(ts)} (BRT): "
+                    f"{_fmt(before, spec)} -> {_fmt(after, spec)} ({pct})"
+                ),
+            })
+            continue
+
+        # Desvios: janela recente contra o baseline do historico anterior
+        cut = bisect_right(timestamps, timestamps[hi - 1] - int(cfg["recent_hours"]) * 3600, lo, hi)
+        if cut - lo < min_segment or cut == hi:
+            continue
+        # Pontos por hora da semana que o historico comporta: semanas completas, ate min_slot_points
+        weeks = (timestamps[cut - 1] - timestamps[lo] + table.period_seconds) // (168 * 3600)
+        slot_points = max(1, min(min_points, weeks))
+        baseline = _seasonal_baseline(values[lo:cut], week_col[lo:cut], day_col[lo:cut], slot_points)
+        hits = []
+        for j in range(cut, hi):
+            level, mad, source = baseline(week_col[j], day_col[j])
+            z = (values[j] - level) / _spread(mad, level, floor)
+            if abs(z) >= cfg["deviation_z"] and _worse(z, direction):
+                hits.append((abs(z), j, level, source))
+        if len(hits) < cfg["min_deviations"]:
+            continue
+        z, j, level, source = max(hits)
+        anomalies.append({
+            "resource": resource,
+            "resource_type": rtype,
+            "metric": f"{name} (desvio do baseline)",
+            "value": f"{_fmt(values[j], spec)} vs {_fmt(level, spec)} ({len(hits)} pontos, z {z:.1f})",
+            "threshold": f">= {cfg['min_deviations']} pontos a {cfg['deviation_z']:g} MADs",
+            "severity": "medium",
+            "baseline": source,
+            "description": (
+                f"{name} fora do padrao em {resource}: {len(hits)} pontos nas ultimas "
+                f"{cfg['recent_hours']}h, pior em {_when(timestamps[j])} ({_fmt(values[j], spec)} "
+                f"vs mediana da {BASELINE_LABELS[source]} {_fmt(level, spec)})"
+            ),
+        })
+    return anomalies
+
+
+def _step_change(table, lo, hi, day_col, min_segment, cfg, spec):
+    """(timestamp da mudanca, nivel antes, nivel depois) ou None."""
+    direction, floor = spec[2], spec[6]
+    values, days = table.values[lo:hi], day_col[lo:hi]
+    # Dessazonaliza pela mediana da hora do dia na serie inteira (robusta a um degrau no fim da janela)
+    by_day: dict[int, list[float]] = {}
+    for v, d in zip(values, days):
+        by_day.setdefault(d, []).append(v)
+    day_level = {d: median(vs) for d, vs in by_day.items()}
+    residuals = [v - day_level[d] for v, d in zip(values, days)]
+    k = _best_split(residuals, min_segment)
+    if k is None:
+        return None
+
+    before, before_mad = _median_mad(residuals[:k])
+    after = median(residuals[k:])
+    level_before = median(values[:k])
+    level_after = median(values[k:])
+    shift = after - before
+    z = shift / _spread(before_mad, level_before, floor)
+    if not _worse(z, direction) or abs(z) < cfg["step_z"]:
+        return None
+    if abs(level_after - level_before) < cfg["step_min_change"] * max(abs(level_before), floor):
+        return None
+    return table.timestamps[lo + k], level_before, level_after
+
+
+def run_baselines(series_path: str, thresholds: dict) -> list[dict]:
+    """Le o series-cloudwatch.jsonl e retorna as anomalias de baseline."""
+    return detect_baseline_anomalies(SeriesTable.load(series_path), thresholds)
@@ -1,6 +1,23 @@
 """
 cloudwatch.py — Coleta de metricas CloudWatch via boto3
 
+Coleta em lote via GetMetricData: as consultas de todos os recursos sao
+agrupadas em chamadas de ate 500 MetricDataQuery (paginadas por NextToken).
+O periodo (resolucao) e escolhido pelo tamanho da janela e janelas longas sao
+divididas em sub-janelas paralelas, juntadas sem duplicatas.
+Os lotes sao executados em paralelo (pool limitado) com um token bucket
+compartilhado e backoff adaptativo quando a API responde com throttling.
+Datapoints ficam em cache local (metric_cache.py): reexecucoes buscam so a
+cauda da janela que ainda nao foi coletada.
+Uma etapa de descoberta (ListMetrics, uma vez por namespace/metrica, filtrada
+pela dimensao de id do recurso) evita consultar metricas que nao existem para o
+recurso (ex.: BurstBalance em gp3). Janelas acima de 14 dias consultam tudo
+direto: ListMetrics so enxerga metricas com dados nas ultimas 2 semanas.
+As series completas da estatistica principal sao mantidas em formato colunar
+(metric_series.py) para percentis p50/p95/p99 e perfil por hora do dia.
+iter_metrics entrega cada recurso assim que seu lote termina; no modo stream o
+relatorio (CloudWatchReportWriter) e gravado linha a linha.
+
 Metricas coletadas:
 - EC2: CPUUtilization, CPUCreditBalance, NetworkIn, NetworkOut
 - ALB: TargetResponseTime, RequestCount, HTTPCode_ELB_5XX_Count, HTTPCode_ELB_4XX_Count
@@ -8,142 +25,724 @@ Metricas coletadas:
 - RDS: CPUUtilization, FreeableMemory, ReadLatency, WriteLatency, DatabaseConnections
 """
 
+import io
+import json
 import os
-import boto3
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
+
+from tools.aws_clients import get_client
+from tools.metric_cache import MetricCache, default_cache_path
+from tools.metric_series import SERIES_FILENAME, SeriesTable
 
 TZ_BR = timezone(timedelta(hours=-3))
 
 
-def _cw_client(session):
-    return session.client("cloudwatch")
+# Registros por recurso gravados no modo stream (um JSON por linha)
+RECORDS_FILENAME = "metricas-cloudwatch.jsonl"
+
+# Limites por chamada GetMetricData
+MAX_QUERIES_PER_REQUEST = 500
+MAX_DATAPOINTS_PER_REQUEST = 100_800
+
+# Periodos candidatos (s) e teto de datapoints por serie usado para escolher o periodo
+PERIOD_CHOICES = (3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400)
+MAX_POINTS_PER_SERIES = 1440
+
+# ListMetrics so retorna metricas com datapoints nas ultimas 2 semanas
+LIST_METRICS_MAX_DAYS = 14
+
+# Metricas por tipo de recurso: (chave no resultado, MetricName, estatistica principal)
+METRIC_SPECS = {
+    "ec2": {
+        "namespace": "AWS/EC2",
+        "dimension": "InstanceId",
+        "metrics": [
+            ("cpu", "CPUUtilization", "Average"),
+            ("credit_balance", "CPUCreditBalance", "Average"),
+            ("network_in_bytes", "NetworkIn", "Average"),
+            ("network_out_bytes", "NetworkOut", "Average"),
+        ],
+    },
+    "alb": {
+        "namespace": "AWS/ApplicationELB",
+        "dimension": "LoadBalancer",
+        "metrics": [
+            ("response_time_s", "TargetResponseTime", "Average"),
+            ("request_count", "RequestCount", "Sum"),
+            ("error_5xx", "HTTPCode_ELB_5XX_Count", "Sum"),
+            ("error_4xx", "HTTPCode_ELB_4XX_Count", "Sum"),
+        ],
+    },
+    # UnHealthyHostCount do NLB so existe por target group, fora do alcance da dimensao LoadBalancer;
+    # a saude dos targets vem do inventario (analyzer._with_target_health)
+    "nlb": {
+        "namespace": "AWS/NetworkELB",
+        "dimension": "LoadBalancer",
+        "metrics": [
+            ("active_flows", "ActiveFlowCount", "Average"),
+            ("new_flows", "NewFlowCount", "Sum"),
+            ("processed_bytes", "ProcessedBytes", "Sum"),
+            ("target_resets", "TCP_Target_Reset_Count", "Sum"),
+        ],
+    },
+    "ebs": {
+        "namespace": "AWS/EBS",
+        "dimension": "VolumeId",
+        "metrics": [
+            ("queue_length", "VolumeQueueLength", "Average"),
+            ("read_latency_s", "VolumeTotalReadTime", "Average"),
+            ("write_latency_s", "VolumeTotalWriteTime", "Average"),
+            ("read_ops", "VolumeReadOps", "Sum"),
+            ("write_ops", "VolumeWriteOps", "Sum"),
+            ("burst_balance", "BurstBalance", "Average"),
+        ],
+    },
+    "rds": {
+        "namespace": "AWS/RDS",
+        "dimension": "DBInstanceIdentifier",
+        "metrics": [
+            ("cpu", "CPUUtilization", "Average"),
+            ("freeable_memory_bytes", "FreeableMemory", "Average"),
+            ("read_latency_s", "ReadLatency", "Average"),
+            ("write_latency_s", "WriteLatency", "Average"),
+            ("connections", "DatabaseConnections", "Average"),
+        ],
+    },
+}
+
+# Estatisticas auxiliares coletadas junto da principal (mesmo formato de antes)
+_EXTRA_STATS = ("Maximum", "Minimum")
+
+# Concorrencia e cota de chamadas (GetMetricData: 50 TPS por conta/regiao)
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_REQUESTS_PER_SECOND = 20.0
+
+# Backoff em throttling
+THROTTLE_CODES = {"Throttling", "ThrottlingException", "RequestLimitExceeded", "TooManyRequestsException"}
+MAX_THROTTLE_RETRIES = 6
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 20.0
+
+
+class TokenBucket:
+    """
+    Rate limiter compartilhado entre as threads de coleta.
+    A taxa cai pela metade a cada throttling e se recupera aos poucos
+    a cada chamada bem-sucedida, ate voltar a taxa configurada.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None, min_rate: float = 1.0):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        """Bloqueia ate haver um token disponivel."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self) -> None:
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self) -> None:
+        with self._lock:
+            if self.rate < self.base_rate:
+                self._refill()
+                self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
+
+def _error_code(exc: Exception) -> str:
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code", "")
+    return ""
+
+
+def _call_with_backoff(limiter: TokenBucket, fn, **kwargs):
+    """Executa uma chamada AWS respeitando o limiter, com backoff exponencial em throttling."""
+    for attempt in range(MAX_THROTTLE_RETRIES + 1):
+        limiter.acquire()
+        try:
+            resp = fn(**kwargs)
+        except Exception as e:
+            if _error_code(e) not in THROTTLE_CODES or attempt == MAX_THROTTLE_RETRIES:
+                raise
+            limiter.penalize()
+            delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            continue
+        limiter.reward()
+        return resp
+
+
+def _cw_client(aws_profile: str, region: str, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+    # Cliente compartilhado do processo, com pool dimensionado para o numero de workers
+    return get_client(aws_profile, region, "cloudwatch", max_pool_connections=max(10, max_concurrency))
+
+
+def _alb_dimension(arn: str) -> str:
+    # ALB dimension usa o sufixo do ARN
+    return arn.split("loadbalancer/")[-1] if "loadbalancer/" in arn else arn
+
+
+def _is_nlb(arn: str) -> bool:
+    return _alb_dimension(arn).startswith("net/")
+
+
+def _resource_record(kind: str, resource_id: str) -> dict:
+    """Registro base de um recurso, antes das metricas."""
+    if kind == "ec2":
+        return {"instance_id": resource_id}
+    if kind in ("alb", "nlb"):
+        lb_dim = _alb_dimension(resource_id)
+        return {
+            "lb_arn": resource_id,
+            "lb_name": lb_dim.split("/")[1] if "/" in lb_dim else lb_dim,
+        }
+    if kind == "ebs":
+        return {"volume_id": resource_id}
+    return {"db_id": resource_id}
+
+
+def _resource_dimensions(kind: str, resource_id: str) -> list[dict]:
+    spec = METRIC_SPECS[kind]
+    value = _alb_dimension(resource_id) if kind in ("alb", "nlb") else resource_id
+    return [{"Name": spec["dimension"], "Value": value}]
+
+
+def _empty_stats(error: str = "") -> dict:
+    stats = {"avg": None, "max": None, "min": None, "count": 0}
+    if error:
+        stats["error"] = error
+    return stats
+
+
+def _summarize(stat_values: list, max_values: list, min_values: list) -> dict:
+    """Reduz as series de uma metrica ao formato {avg, max, min, count}."""
+    if not stat_values:
+        return _empty_stats()
+    return {
+        "avg": round(sum(stat_values) / len(stat_values), 4),
+        "max": round(max(max_values), 4) if max_values else None,
+        "min": round(min(min_values), 4) if min_values else None,
+        "count": len(stat_values),
+    }
+
+
+class MetricIndex:
+    """
+    Indice das metricas que existem de fato, montado via ListMetrics uma unica
+    vez por namespace, metrica e dimensao de id durante a execucao. Evita
+    consultar, por exemplo, CPUCreditBalance em instancias que nao sao burstable.
+    ListMetrics so retorna metricas com dados nas ultimas 2 semanas; janelas
+    maiores nao usam o indice (ver iter_metrics).
+    """
+
+    def __init__(self, cw, limiter: TokenBucket):
+        self.cw = cw
+        self.limiter = limiter
+        self._known: dict[tuple[str, str, str], set | None] = {}
+        self._lock = threading.Lock()
+
+    def _list(self, namespace: str, metric_name: str, dimension: str) -> set | None:
+        found = set()
+        # Filtro pela dimensao de id: deixa de fora as series agregadas (ex.: por
+        # AutoScalingGroupName ou TargetGroup) que so aumentariam a paginacao
+        kwargs = {"Namespace": namespace, "MetricName": metric_name, "Dimensions": [{"Name": dimension}]}
+        try:
+            while True:
+                resp = _call_with_backoff(self.limiter, self.cw.list_metrics, **kwargs)
+                for metric in resp.get("Metrics", []):
+                    found.add(frozenset((d["Name"], d["Value"]) for d in metric.get("Dimensions", [])))
+                token = resp.get("NextToken")
+                if not token:
+                    return found
+                kwargs["NextToken"] = token
+        except Exception:
+            # Sem permissao/erro na descoberta: consulta tudo, como antes
+            return None
+
+    def load(self, keys: set[tuple[str, str, str]], max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> None:
+        """Carrega em paralelo as chaves (namespace, metrica, dimensao) ainda nao indexadas."""
+        missing = [key for key in keys if key not in self._known]
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(missing)))) as pool:
+            for key, found in zip(missing, pool.map(lambda key: self._list(*key), missing)):
+                with self._lock:
+                    self._known[key] = found
+
+    def exists(self, namespace: str, metric_name: str, dimensions: list[dict]) -> bool:
+        found = self._known.get((namespace, metric_name, dimensions[0]["Name"]))
+        if found is None:
+            return True
+        return frozenset((d["Name"], d["Value"]) for d in dimensions) in found
+
+
+def _plan_entries(
+    targets: dict[str, list[str]],
+    index: MetricIndex | None = None,
+) -> list[list[dict]]:
+    """
+    Lista as consultas de cada recurso (uma entrada por metrica).
+    Com index, metricas inexistentes para o recurso sao descartadas.
+    """
+    resources: list[list[dict]] = []
+    for kind, resource_ids in targets.items():
+        spec = METRIC_SPECS[kind]
+        for index_pos, rid in enumerate(resource_ids):
+            dims = _resource_dimensions(kind, rid)
+            entries = []
+            for key, metric_name, stat in spec["metrics"]:
+                if index is not None and not index.exists(spec["namespace"], metric_name, dims):
+                    continue
+                entries.append({
+                    "kind": kind,
+                    "index": index_pos,
+                    "resource": rid,
+                    "key": key,
+                    "namespace": spec["namespace"],
+                    "metric": metric_name,
+                    "dimensions": dims,
+                    "stat": stat,
+                })
+            if entries:
+                resources.append(entries)
+    return resources
+
+
+def _batch_budget(resources: list[list[dict]], max_concurrency: int) -> int:
+    """
+    Numero de consultas por lote: reparte o total entre os workers para que
+    todos trabalhem, sem passar do limite da API. Dividir nao encarece a coleta
+    (GetMetricData e cobrado por metrica, nao por chamada).
+    """
+    per_metric = 1 + len(_EXTRA_STATS)
+    total = sum(len(entries) for entries in resources) * per_metric
+    share = -(-total // max(1, max_concurrency))
+    return max(1, min(MAX_QUERIES_PER_REQUEST, share))
+
+
+def _plan_batches(
+    resources: list[list[dict]],
+    max_queries: int = MAX_QUERIES_PER_REQUEST,
+) -> list[list[dict]]:
+    """
+    Monta os lotes de consultas GetMetricData a partir das entradas por recurso.
+    Um recurso nunca e dividido entre lotes, para que cada lote entregue
+    recursos completos.
+    """
+    batches: list[list[dict]] = []
+    current: list[dict] = []
+    current_queries = 0
+    per_metric = 1 + len(_EXTRA_STATS)
+
+    for entries in resources:
+        size = len(entries) * per_metric
+        if current and current_queries + size > max_queries:
+            batches.append(current)
+            current, current_queries = [], 0
+        current.extend(entries)
+        current_queries += size
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _batch_queries(batch: list[dict], period_seconds: int) -> list[dict]:
+    """Converte as entradas de um lote em MetricDataQueries (3 por metrica)."""
+    queries = []
+    for n, entry in enumerate(batch):
+        for s, stat in enumerate((entry["stat"],) + _EXTRA_STATS):
+            queries.append({
+                "Id": f"m{n}s{s}",
+                "MetricStat": {
+                    "Metric": {
+                        "Namespace": entry["namespace"],
+                        "MetricName": entry["metric"],
+                        "Dimensions": entry["dimensions"],
+                    },
+                    "Period": period_seconds,
+                    "Stat": stat,
+                },
+                "ReturnData": True,
+            })
+    return queries
+
+
+def _get_metric_data(
+    cw,
+    queries: list[dict],
+    start_ts: int,
+    end_ts: int,
+    limiter: TokenBucket,
+) -> tuple[dict, dict]:
+    """
+    Executa GetMetricData seguindo NextToken.
+    Retorna ({Id: (timestamps epoch, valores)}, {Id: erro}).
+    """
+    series: dict[str, tuple[list, list]] = {q["Id"]: ([], []) for q in queries}
+    errors: dict[str, str] = {}
+    kwargs = {
+        "MetricDataQueries": queries,
+        "StartTime": datetime.fromtimestamp(start_ts, timezone.utc),
+        "EndTime": datetime.fromtimestamp(end_ts, timezone.utc),
+        "ScanBy": "TimestampAscending",
+    }
+    while True:
+        resp = _call_with_backoff(limiter, cw.get_metric_data, **kwargs)
+        for result in resp.get("MetricDataResults", []):
+            qid = result["Id"]
+            timestamps, values = series[qid]
+            timestamps.extend(int(ts.timestamp()) for ts in result.get("Timestamps", []))
+            values.extend(result.get("Values", []))
+            if result.get("StatusCode") in ("InternalError", "Forbidden"):
+                msgs = [m.get("Value", "") for m in result.get("Messages", [])]
+                errors[qid] = result["StatusCode"] + (f": {'; '.join(msgs)}" if msgs else "")
+        token = resp.get("NextToken")
+        if not token:
+            break
+        kwargs["NextToken"] = token
+    return series, errors
+
+
+def _split_window(start_ts: int, end_ts: int, period_seconds: int, n_queries: int) -> list[tuple[int, int]]:
+    """
+    Divide [start, end) em sub-janelas alinhadas ao periodo para que cada chamada
+    caiba no limite de datapoints da API; as sub-janelas rodam em paralelo em vez
+    de serem paginadas em serie por NextToken.
+    """
+    points = -(-(end_ts - start_ts) // period_seconds)
+    per_chunk = max(1, MAX_DATAPOINTS_PER_REQUEST // max(1, n_queries))
+    if points <= per_chunk:
+        return [(start_ts, end_ts)]
+    step = per_chunk * period_seconds
+    return [(t, min(t + step, end_ts)) for t in range(start_ts, end_ts, step)]
+
+
+def _merge_parts(parts: list[tuple[list, list]]) -> tuple[list, list]:
+    """Junta as partes de uma serie vindas de sub-janelas, ordenando e sem timestamps repetidos."""
+    if len(parts) == 1:
+        return parts[0]
+    parts = sorted((part for part in parts if part[0]), key=lambda part: part[0][0])
+    if all(prev[0][-1] < cur[0][0] for prev, cur in zip(parts, parts[1:])):
+        # Caso comum: sub-janelas disjuntas, basta concatenar
+        return [ts for part in parts for ts in part[0]], [v for part in parts for v in part[1]]
+    merged = {}
+    for timestamps, values in parts:
+        merged.update(zip(timestamps, values))
+    ordered = sorted(merged)
+    return ordered, [merged[ts] for ts in ordered]
+
+
+class _BatchFetch:
+    """
+    Estado da coleta de um lote: as consultas sao agrupadas pelo inicio do trecho
+    a buscar (com cache, so a cauda faltante) e cada grupo e dividido em
+    sub-janelas. O lote e finalizado quando todas as sub-janelas terminam.
+    """
+
+    def __init__(
+        self,
+        batch: list[dict],
+        start_ts: int,
+        end_ts: int,
+        period_seconds: int,
+        cache: MetricCache | None = None,
+    ):
+        self.batch = batch
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.period_seconds = period_seconds
+        self.cache = cache
+        self.queries = _batch_queries(batch, period_seconds)
+        self.keys: dict[str, str] = {}
+        self.errors: dict[str, str] = {}
+        self.parts: dict[str, list] = {q["Id"]: [] for q in self.queries}
+
+        groups: dict[int, list[dict]] = {}
+        for q in self.queries:
+            fetch_from = start_ts
+            if cache is not None:
+                stat = q["MetricStat"]
+                metric = stat["Metric"]
+                key = cache.series_key(
+                    metric["Namespace"], metric["MetricName"], metric["Dimensions"],
+                    period_seconds, stat["Stat"],
+                )
+                self.keys[q["Id"]] = key
+                fetch_from = cache.fetch_start(key, start_ts, end_ts, period_seconds)
+            if fetch_from < end_ts:
+                groups.setdefault(fetch_from, []).append(q)
+        self.groups = list(groups.items())
+        self.tasks = [
+            (g, chunk_start, chunk_end)
+            for g, (fetch_from, group) in enumerate(self.groups)
+            for chunk_start, chunk_end in _split_window(fetch_from, end_ts, period_seconds, len(group))
+        ]
+        self.pending = len(self.tasks)
+
+    def fetch(self, cw, task: tuple, limiter: TokenBucket) -> tuple[dict, dict]:
+        g, chunk_start, chunk_end = task
+        return _get_metric_data(cw, self.groups[g][1], chunk_start, chunk_end, limiter)
+
+    def add_part(self, task: tuple, outcome) -> bool:
+        """Registra o resultado (ou excecao) de uma sub-janela. Retorna True quando o lote termina."""
+        group = self.groups[task[0]][1]
+        if isinstance(outcome, Exception):
+            self.errors.update({q["Id"]: str(outcome) for q in group})
+        else:
+            fetched, errors = outcome
+            self.errors.update(errors)
+            for qid, points in fetched.items():
+                self.parts[qid].append(points)
+        self.pending -= 1
+        return self.pending == 0
+
+    def finish(self) -> list[tuple]:
+        """
+        Consolida o lote e retorna [(entry, stats, serie)], onde serie e
+        (timestamps, valores) da estatistica principal, ou None em caso de erro.
+        """
+        series = {}
+        if self.cache is None:
+            for qid, parts in self.parts.items():
+                series[qid] = _merge_parts(parts) if parts else ([], [])
+        else:
+            for fetch_from, group in self.groups:
+                for q in group:
+                    qid = q["Id"]
+                    if qid not in self.errors:
+                        timestamps, values = _merge_parts(self.parts[qid]) if self.parts[qid] else ([], [])
+                        self.cache.store(self.keys[qid], timestamps, values, fetch_from, self.end_ts)
+            for qid, key in self.keys.items():
+                if qid not in self.errors:
+                    series[qid] = self.cache.read(key, self.start_ts, self.end_ts)
+
+        results = []
+        for n, entry in enumerate(self.batch):
+            ids = [f"m{n}s{s}" for s in range(1 + len(_EXTRA_STATS))]
+            error = next((self.errors[qid] for qid in ids if qid in self.errors), "")
+            if error:
+                results.append((entry, _empty_stats(error), None))
+                continue
+            principal = series[ids[0]]
+            if entry["stat"] == "Sum" and self.period_seconds != 3600:
+                # Somas normalizadas por hora: thresholds e relatorio seguem em "/h"
+                factor = 3600 / self.period_seconds
+                principal = (principal[0], [v * factor for v in principal[1]])
+            stats = _summarize(principal[1], *(series[qid][1] for qid in ids[1:]))
+            results.append((entry, stats, principal))
+        return results
 
 
-def _get_metric_stats(
+def select_period(period_days: int) -> int:
+    """Menor periodo que mantem cada serie abaixo de MAX_POINTS_PER_SERIES datapoints."""
+    for period in PERIOD_CHOICES:
+        if period_days * 86400 // period <= MAX_POINTS_PER_SERIES:
+            return period
+    return PERIOD_CHOICES[-1]
+
+
+def iter_metrics(
     cw,
-    namespace: str,
-    metric_name: str,
-    dimensions: list[dict],
+    targets: dict[str, list[str]],
     period_days: int,
-    stat: str = "Average",
-    period_seconds: int = 3600,
-) -> dict:
-    """Coleta estatisticas de uma metrica CloudWatch."""
-    end_time = datetime.now(timezone.utc)
-    start_time = end_time - timedelta(days=period_days)
+    period_seconds: int | None = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    limiter: TokenBucket | None = None,
+    cache: MetricCache | None = None,
+    series: SeriesTable | None = None,
+    index: MetricIndex | None = None,
+) -> Iterator[tuple[str, int, dict]]:
+    """
+    Coleta as metricas de todos os recursos em lotes GetMetricData e entrega
+    (tipo, posicao em targets[tipo], registro) a medida que cada recurso termina.
 
-    try:
-        resp = cw.get_metric_statistics(
-            Namespace=namespace,
-            MetricName=metric_name,
-            Dimensions=dimensions,
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=period_seconds,
-            Statistics=[stat, "Maximum", "Minimum"],
+    Cada lote e dividido em sub-janelas que rodam em paralelo por ate
+    max_concurrency workers e sao juntadas sem duplicatas ao final.
+    Os tipos saem na ordem de targets (registros de tipos seguintes ficam
+    retidos ate o anterior terminar); dentro de um tipo, na ordem de conclusao.
+    Somente registros ainda nao entregues ficam em memoria.
+
+    targets: {'ec2': [...], 'alb': [...], 'nlb': [...], 'ebs': [...], 'rds': [...]}
+    period_seconds: resolucao; default escolhido pelo tamanho da janela (select_period)
+    cache: se informado, datapoints ja coletados sao servidos do disco
+    series: tabela que recebe as series completas (criada internamente se omitida)
+    index: indice de descoberta (MetricIndex); metricas inexistentes nao sao consultadas.
+           Ignorado com period_days acima de LIST_METRICS_MAX_DAYS
+    Cada metrica traz p50/p95/p99 e perfil horario ('hourly', 24 medias em BRT).
+    Metricas descartadas pela descoberta aparecem com count 0 e 'skipped': True.
+    """
+    period_seconds = period_seconds or select_period(period_days)
+    if series is None:
+        series = SeriesTable(period_seconds)
+    series.period_seconds = period_seconds
+    limiter = limiter or TokenBucket(DEFAULT_REQUESTS_PER_SECOND)
+    # Janela alinhada ao periodo: datapoints caem sempre nos mesmos timestamps
+    now_ts = int(datetime.now(timezone.utc).timestamp())
+    end_ts = now_ts - now_ts % period_seconds
+    start_ts = end_ts - period_days * 86400
+    start_ts -= start_ts % period_seconds
+
+    def _new_record(kind: str, resource_id: str) -> dict:
+        record = _resource_record(kind, resource_id)
+        for key, _, _ in METRIC_SPECS[kind]["metrics"]:
+            record[key] = {**_empty_stats(), "skipped": True}
+        return record
+
+    if period_days > LIST_METRICS_MAX_DAYS:
+        # Recursos sem dados nas ultimas 2 semanas sumiriam da descoberta
+        index = None
+    if index is not None:
+        index.load(
+            {(METRIC_SPECS[kind]["namespace"], metric_name, METRIC_SPECS[kind]["dimension"])
+             for kind, resource_ids in targets.items() if resource_ids
+             for _, metric_name, _ in METRIC_SPECS[kind]["metrics"]},
+            max_concurrency,
         )
-        datapoints = resp.get("Datapoints", [])
-        if not datapoints:
-            return {"avg": None, "max": None, "min": None, "count": 0}
+    resources = _plan_entries(targets, index)
+    jobs = [
+        _BatchFetch(batch, start_ts, end_ts, period_seconds, cache)
+        for batch in _plan_batches(resources, _batch_budget(resources, max_concurrency))
+    ]
 
-        values = [dp[stat] for dp in datapoints]
-        maxes = [dp["Maximum"] for dp in datapoints]
-        mins = [dp["Minimum"] for dp in datapoints]
-        return {
-            "avg": round(sum(values) / len(values), 4),
-            "max": round(max(maxes), 4),
-            "min": round(min(mins), 4),
-            "count": len(datapoints),
-        }
-    except Exception as e:
-        return {"avg": None, "max": None, "min": None, "count": 0, "error": str(e)}
+    order = list(targets)
+    ready: dict[str, deque] = {kind: deque() for kind in order}
+    pending = {kind: len(resource_ids) for kind, resource_ids in targets.items()}
+    cursor = 0
+
+    # Recursos sem nenhuma metrica a consultar ja estao prontos
+    planned = {(entries[0]["kind"], entries[0]["index"]) for entries in resources}
+    for kind, resource_ids in targets.items():
+        for i, rid in enumerate(resource_ids):
+            if (kind, i) not in planned:
+                ready[kind].append((i, _new_record(kind, rid)))
+                pending[kind] -= 1
+
+    def _consume(job: _BatchFetch) -> None:
+        done = {}
+        collected = {}
+        first = len(series)
+        for entry, stats, points in job.finish():
+            pos = (entry["kind"], entry["index"])
+            if pos not in done:
+                done[pos] = _new_record(entry["kind"], entry["resource"])
+            done[pos][entry["key"]] = stats
+            if points is not None:
+                series_key = (entry["kind"], entry["resource"], entry["key"])
+                series.append(series_key, *points)
+                collected[series_key] = stats
+        # Percentis e perfis calculados de uma vez para todas as series do lote
+        for series_key, extra in series.summaries(start=first).items():
+            if series_key in collected:
+                collected[series_key].update(extra)
+        for (kind, i), record in done.items():
+            ready[kind].append((i, record))
+            pending[kind] -= 1
+
+    def _drain() -> Iterator[tuple[str, int, dict]]:
+        nonlocal cursor
+        while cursor < len(order):
+            kind = order[cursor]
+            while ready[kind]:
+                i, record = ready[kind].popleft()
+                yield kind, i, record
+            if pending[kind]:
+                return
+            cursor += 1
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+    try:
+        futures = {}
+        for job in jobs:
+            if not job.tasks:
+                # Tudo servido do cache
+                _consume(job)
+            for task in job.tasks:
+                futures[pool.submit(job.fetch, cw, task, limiter)] = (job, task)
+        yield from _drain()
+        for future in as_completed(futures):
+            job, task = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = e
+            if job.add_part(task, outcome):
+                _consume(job)
+                yield from _drain()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def collect_metrics(
+    cw,
+    targets: dict[str, list[str]],
+    period_days: int,
+    period_seconds: int | None = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    limiter: TokenBucket | None = None,
+    cache: MetricCache | None = None,
+    series: SeriesTable | None = None,
+    index: MetricIndex | None = None,
+) -> dict[str, list[dict]]:
+    """
+    Coleta completa em memoria (ver iter_metrics).
+    Retorna {tipo: [registro por recurso]} na ordem de targets, no mesmo
+    formato dos collect_*_metrics.
+    """
+    records: dict[str, list] = {kind: [None] * len(resource_ids) for kind, resource_ids in targets.items()}
+    for kind, i, record in iter_metrics(
+        cw, targets, period_days, period_seconds, max_concurrency, limiter, cache, series, index,
+    ):
+        records[kind][i] = record
+    return records
 
 
 def collect_ec2_metrics(cw, instance_ids: list[str], period_days: int) -> list[dict]:
-    results = []
-    for iid in instance_ids:
-        dims = [{"Name": "InstanceId", "Value": iid}]
-        cpu = _get_metric_stats(cw, "AWS/EC2", "CPUUtilization", dims, period_days)
-        credit = _get_metric_stats(cw, "AWS/EC2", "CPUCreditBalance", dims, period_days)
-        net_in = _get_metric_stats(cw, "AWS/EC2", "NetworkIn", dims, period_days)
-        net_out = _get_metric_stats(cw, "AWS/EC2", "NetworkOut", dims, period_days)
-        results.append({
-            "instance_id": iid,
-            "cpu": cpu,
-            "credit_balance": credit,
-            "network_in_bytes": net_in,
-            "network_out_bytes": net_out,
-        })
-    return results
+    return collect_metrics(cw, {"ec2": instance_ids}, period_days)["ec2"]
 
 
 def collect_alb_metrics(cw, lb_arns: list[str], period_days: int) -> list[dict]:
-    results = []
-    for arn in lb_arns:
-        # ALB dimension usa o sufixo do ARN
-        lb_dim = arn.split("loadbalancer/")[-1] if "loadbalancer/" in arn else arn
-        dims = [{"Name": "LoadBalancer", "Value": lb_dim}]
-
-        resp_time = _get_metric_stats(cw, "AWS/ApplicationELB", "TargetResponseTime", dims, period_days)
-        req_count = _get_metric_stats(cw, "AWS/ApplicationELB", "RequestCount", dims, period_days, stat="Sum")
-        err_5xx = _get_metric_stats(cw, "AWS/ApplicationELB", "HTTPCode_ELB_5XX_Count", dims, period_days, stat="Sum")
-        err_4xx = _get_metric_stats(cw, "AWS/ApplicationELB", "HTTPCode_ELB_4XX_Count", dims, period_days, stat="Sum")
-
-        results.append({
-            "lb_arn": arn,
-            "lb_name": lb_dim.split("/")[1] if "/" in lb_dim else lb_dim,
-            "response_time_s": resp_time,
-            "request_count": req_count,
-            "error_5xx": err_5xx,
-            "error_4xx": err_4xx,
-        })
-    return results
+    return collect_metrics(cw, {"alb": lb_arns}, period_days)["alb"]
+
+
+def collect_nlb_metrics(cw, lb_arns: list[str], period_days: int) -> list[dict]:
+    return collect_metrics(cw, {"nlb": lb_arns}, period_days)["nlb"]
 
 
 def collect_ebs_metrics(cw, volume_ids: list[str], period_days: int) -> list[dict]:
-    results = []
-    for vid in volume_ids:
-        dims = [{"Name": "VolumeId", "Value": vid}]
-        queue = _get_metric_stats(cw, "AWS/EBS", "VolumeQueueLength", dims, period_days)
-        read_time = _get_metric_stats(cw, "AWS/EBS", "VolumeTotalReadTime", dims, period_days)
-        write_time = _get_metric_stats(cw, "AWS/EBS", "VolumeTotalWriteTime", dims, period_days)
-        read_ops = _get_metric_stats(cw, "AWS/EBS", "VolumeReadOps", dims, period_days, stat="Sum")
-        write_ops = _get_metric_stats(cw, "AWS/EBS", "VolumeWriteOps", dims, period_days, stat="Sum")
-        burst = _get_metric_stats(cw, "AWS/EBS", "BurstBalance", dims, period_days)
-
-        results.append({
-            "volume_id": vid,
-            "queue_length": queue,
-            "read_latency_s": read_time,
-            "write_latency_s": write_time,
-            "read_ops": read_ops,
-            "write_ops": write_ops,
-            "burst_balance": burst,
-        })
-    return results
+    return collect_metrics(cw, {"ebs": volume_ids}, period_days)["ebs"]
 
 
 def collect_rds_metrics(cw, db_ids: list[str], period_days: int) -> list[dict]:
-    results = []
-    for dbid in db_ids:
-        dims = [{"Name": "DBInstanceIdentifier", "Value": dbid}]
-        cpu = _get_metric_stats(cw, "AWS/RDS", "CPUUtilization", dims, period_days)
-        mem = _get_metric_stats(cw, "AWS/RDS", "FreeableMemory", dims, period_days)
-        read_lat = _get_metric_stats(cw, "AWS/RDS", "ReadLatency", dims, period_days)
-        write_lat = _get_metric_stats(cw, "AWS/RDS", "WriteLatency", dims, period_days)
-        conns = _get_metric_stats(cw, "AWS/RDS", "DatabaseConnections", dims, period_days)
-
-        results.append({
-            "db_id": dbid,
-            "cpu": cpu,
-            "freeable_memory_bytes": mem,
-            "read_latency_s": read_lat,
-            "write_latency_s": write_lat,
-            "connections": conns,
-        })
-    return results
+    return collect_metrics(cw, {"rds": db_ids}, period_days)["rds"]
 
 
 def _fmt_val(val, unit: str = "", scale: float = 1.0, decimals: int = 2) -> str:
@@ -152,6 +751,216 @@ def _fmt_val(val, unit: str = "", scale: float = 1.0, decimals: int = 2) -> str:
     return f"{val * scale:.{decimals}f}{unit}"
 
 
+def _peak_hours(stats: dict) -> tuple[int, float, int, float] | None:
+    """(hora de pico, media no pico, hora de vale, media no vale) do perfil horario."""
+    hourly = [(h, v) for h, v in enumerate(stats.get("hourly") or []) if v is not None]
+    if not hourly:
+        return None
+    peak = max(hourly, key=lambda hv: hv[1])
+    low = min(hourly, key=lambda hv: hv[1])
+    return peak[0], peak[1], low[0], low[1]
+
+
+# Metricas exibidas no perfil horario: (chave do recurso, chave da metrica, rotulo, unidade, escala, casas)
+_PROFILE_ROWS = {
+    "ec2": ("instance_id", "cpu", "CPU", "%", 1.0, 1),
+    "alb": ("lb_name", "request_count", "Requests/h", "", 1.0, 0),
+    "nlb": ("lb_name", "active_flows", "Fluxos ativos", "", 1.0, 0),
+    "ebs": ("volume_id", "queue_length", "Queue Length", "", 1.0, 3),
+    "rds": ("db_id", "cpu", "CPU", "%", 1.0, 1),
+}
+
+
+def _ec2_row(m: dict) -> str:
+    cpu_avg = _fmt_val(m["cpu"]["avg"], "%")
+    cpu_p95 = _fmt_val(m["cpu"].get("p95"), "%")
+    cpu_max = _fmt_val(m["cpu"]["max"], "%")
+    credit = _fmt_val(m["credit_balance"]["avg"], " cred", decimals=0)
+    net_in = _fmt_val(m["network_in_bytes"]["avg"], " MB", scale=1/1024/1024)
+    net_out = _fmt_val(m["network_out_bytes"]["avg"], " MB", scale=1/1024/1024)
+    return f"| {m['instance_id']} | {cpu_avg} | {cpu_p95} | {cpu_max} | {credit} | {net_in} | {net_out} |"
+
+
+def _alb_row(m: dict) -> str:
+    rt_avg = _fmt_val(m["response_time_s"]["avg"], "s", decimals=3)
+    rt_p95 = _fmt_val(m["response_time_s"].get("p95"), "s", decimals=3)
+    rt_max = _fmt_val(m["response_time_s"]["max"], "s", decimals=3)
+    reqs = _fmt_val(m["request_count"]["avg"], "", decimals=0)
+    e5xx = _fmt_val(m["error_5xx"]["avg"], "", decimals=0)
+    e4xx = _fmt_val(m["error_4xx"]["avg"], "", decimals=0)
+    return f"| {m['lb_name']} | {rt_avg} | {rt_p95} | {rt_max} | {reqs} | {e5xx} | {e4xx} |"
+
+
+def _nlb_row(m: dict) -> str:
+    flows_avg = _fmt_val(m["active_flows"]["avg"], "", decimals=0)
+    flows_p95 = _fmt_val(m["active_flows"].get("p95"), "", decimals=0)
+    flows_max = _fmt_val(m["active_flows"]["max"], "", decimals=0)
+    new_flows = _fmt_val(m["new_flows"]["avg"], "", decimals=0)
+    processed = _fmt_val(m["processed_bytes"]["avg"], " MB", scale=1/1024/1024, decimals=1)
+    resets = _fmt_val(m["target_resets"]["avg"], "", decimals=0)
+    return f"| {m['lb_name']} | {flows_avg} | {flows_p95} | {flows_max} | {new_flows} | {processed} | {resets} |"
+
+
+def _ebs_row(m: dict) -> str:
+    ql_avg = _fmt_val(m["queue_length"]["avg"], "", decimals=3)
+    ql_p95 = _fmt_val(m["queue_length"].get("p95"), "", decimals=3)
+    ql_max = _fmt_val(m["queue_length"]["max"], "", decimals=3)
+    rl = _fmt_val(m["read_latency_s"]["avg"], "s", decimals=4)
+    wl = _fmt_val(m["write_latency_s"]["avg"], "s", decimals=4)
+    burst = _fmt_val(m["burst_balance"]["avg"], "%", decimals=1)
+    return f"| {m['volume_id']} | {ql_avg} | {ql_p95} | {ql_max} | {rl} | {wl} | {burst} |"
+
+
+def _rds_row(m: dict) -> str:
+    cpu_avg = _fmt_val(m["cpu"]["avg"], "%")
+    cpu_p95 = _fmt_val(m["cpu"].get("p95"), "%")
+    cpu_max = _fmt_val(m["cpu"]["max"], "%")
+    mem = _fmt_val(m["freeable_memory_bytes"]["avg"], " MB", scale=1/1024/1024, decimals=0)
+    rl = _fmt_val(m["read_latency_s"]["avg"], "ms", scale=1000, decimals=2)
+    wl = _fmt_val(m["write_latency_s"]["avg"], "ms", scale=1000, decimals=2)
+    conns = _fmt_val(m["connections"]["avg"], "", decimals=0)
+    return f"| {m['db_id']} | {cpu_avg} | {cpu_p95} | {cpu_max} | {mem} | {rl} | {wl} | {conns} |"
+
+
+# Secoes do relatorio, na ordem em que aparecem. empty=None: secao omitida sem recursos.
+_REPORT_SECTIONS = {
+    "ec2": {
+        "title": "Metricas EC2",
+        "columns": "| Instancia | CPU Avg | CPU P95 | CPU Max | Credit Balance (avg) | Net In (MB/h avg) | Net Out (MB/h avg) |",
+        "empty": "| — | Nenhuma metrica EC2 coletada | | | | | |",
+        "row": _ec2_row,
+    },
+    "alb": {
+        "title": "Metricas ALB",
+        "columns": "| Load Balancer | Resp Time Avg (s) | Resp Time P95 (s) | Resp Time Max (s) | Requests Total | Erros 5XX | Erros 4XX |",
+        "empty": "| — | Nenhuma metrica ALB coletada | | | | | |",
+        "row": _alb_row,
+    },
+    "nlb": {
+        "title": "Metricas NLB",
+        "columns": "| Load Balancer | Fluxos Ativos Avg | Fluxos Ativos P95 | Fluxos Ativos Max | Novos Fluxos/h | Processado (MB/h) | Resets do Target/h |",
+        "empty": None,
+        "row": _nlb_row,
+    },
+    "ebs": {
+        "title": "Metricas EBS",
+        "columns": "| Volume | Queue Length Avg | Queue Length P95 | Queue Length Max | Read Latency Avg | Write Latency Avg | Burst Balance |",
+        "empty": "| — | Nenhuma metrica EBS coletada | | | | | |",
+        "row": _ebs_row,
+    },
+    "rds": {
+        "title": "Metricas RDS",
+        "columns": "| Instancia | CPU Avg | CPU P95 | CPU Max | Memoria Livre Avg | Read Latency | Write Latency | Conexoes |",
+        "empty": None,
+        "row": _rds_row,
+    },
+}
+
+
+def _profile_row(kind: str, m: dict) -> str | None:
+    id_key, metric_key, label, unit, scale, decimals = _PROFILE_ROWS[kind]
+    peak = _peak_hours(m.get(metric_key, {}))
+    if peak is None:
+        return None
+    peak_h, peak_v, low_h, low_v = peak
+    p50 = _fmt_val(m[metric_key].get("p50"), unit, scale, decimals)
+    p99 = _fmt_val(m[metric_key].get("p99"), unit, scale, decimals)
+    return (
+        f"| {m[id_key]} | {label} | {p50} | {p99} | {peak_h:02d}h ({_fmt_val(peak_v, unit, scale, decimals)}) "
+        f"| {low_h:02d}h ({_fmt_val(low_v, unit, scale, decimals)}) |"
+    )
+
+
+class CloudWatchReportWriter:
+    """
+    Escreve metricas-cloudwatch.md de forma incremental: cabecalho na criacao,
+    uma linha de tabela por recurso (com flush) e o perfil horario no close().
+    Os registros devem chegar agrupados por tipo, na ordem das secoes.
+    As linhas do perfil horario ficam num arquivo temporario ate o fechamento.
+    """
+
+    def __init__(self, out, environment: str, period_days: int, period_seconds: int | None = None):
+        self.out = out
+        self._order = list(_REPORT_SECTIONS)
+        self._cursor = -1
+        self._rows_in_section = 0
+        self._profile = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self._profile_rows = 0
+
+        end_date = datetime.now(TZ_BR)
+        start_date = end_date - timedelta(days=period_days)
+        self._write([
+            f"# Coleta de Metricas CloudWatch",
+            f"",
+            f"**Ambiente:** {environment.upper()}  ",
+            f"**Periodo:** {start_date.strftime('%Y-%m-%d')} a {end_date.strftime('%Y-%m-%d')} ({period_days} dias)  ",
+            f"**Data da coleta:** {end_date.strftime('%Y-%m-%d %H:%M')} (BRT)  ",
+            f"**Resolucao:** {(period_seconds or select_period(period_days)) // 3600}h por datapoint  ",
+            f"",
+            f"---",
+            f"",
+        ])
+
+    def _write(self, lines: list[str]) -> None:
+        self.out.write("".join(line + "\n" for line in lines))
+        self.out.flush()
+
+    def _close_section(self) -> None:
+        if self._cursor < 0:
+            return
+        section = _REPORT_SECTIONS[self._order[self._cursor]]
+        if not self._rows_in_section and section["empty"]:
+            self._write([section["empty"]])
+
+    def _advance_to(self, kind: str) -> None:
+        """Fecha as secoes pendentes e abre as seguintes ate a secao de kind."""
+        target = self._order.index(kind)
+        if target < self._cursor:
+            raise ValueError(f"Registros de '{kind}' chegaram fora da ordem das secoes")
+        while self._cursor < target:
+            self._close_section()
+            self._cursor += 1
+            section = _REPORT_SECTIONS[self._order[self._cursor]]
+            self._rows_in_section = 0
+            if section["empty"] is None and self._cursor < target:
+                continue
+            lines = [] if self._cursor == 0 else [f"", f"---", f""]
+            n_cols = section["columns"].count("|") - 1
+            self._write(lines + [f"## {section['title']}", f"", section["columns"], "|" + "---|" * n_cols])
+
+    def add(self, kind: str, record: dict) -> None:
+        self._advance_to(kind)
+        self._write([_REPORT_SECTIONS[kind]["row"](record)])
+        self._rows_in_section += 1
+        row = _profile_row(kind, record)
+        if row:
+            self._profile.write(row + "\n")
+            self._profile_rows += 1
+
+    def close(self) -> None:
+        # Secoes obrigatorias ainda nao abertas saem com a linha de "nenhuma metrica"
+        last_required = max(i for i, k in enumerate(self._order) if _REPORT_SECTIONS[k]["empty"])
+        if self._cursor < last_required:
+            self._advance_to(self._order[last_required])
+        self._close_section()
+
+        if self._profile_rows:
+            self._write([
+                f"",
+                f"---",
+                f"",
+                f"## Percentis e Perfil Horario (BRT)",
+                f"",
+                f"| Recurso | Metrica | P50 | P99 | Hora de Pico (media) | Hora de Vale (media) |",
+                f"|---|---|---|---|---|---|",
+            ])
+            self._profile.seek(0)
+            for line in self._profile:
+                self.out.write(line)
+            self.out.flush()
+        self._profile.close()
+
+
 def build_cloudwatch_report(
     ec2_metrics: list,
     alb_metrics: list,
@@ -159,99 +968,24 @@ def build_cloudwatch_report(
     rds_metrics: list,
     environment: str,
     period_days: int,
+    period_seconds: int | None = None,
+    nlb_metrics: list | None = None,
 ) -> str:
-    end_date = datetime.now(TZ_BR)
-    start_date = end_date - timedelta(days=period_days)
-
-    lines = [
-        f"# Coleta de Metricas CloudWatch",
-        f"",
-        f"**Ambiente:** {environment.upper()}  ",
-        f"**Periodo:** {start_date.strftime('%Y-%m-%d')} a {end_date.strftime('%Y-%m-%d')} ({period_days} dias)  ",
-        f"**Data da coleta:** {end_date.strftime('%Y-%m-%d %H:%M')} (BRT)  ",
-        f"",
-        f"---",
-        f"",
-        f"## Metricas EC2",
-        f"",
-        f"| Instancia | CPU Avg | CPU Max | Credit Balance (avg) | Net In (MB/h avg) | Net Out (MB/h avg) |",
-        f"|---|---|---|---|---|---|",
-    ]
-
-    for m in ec2_metrics:
-        cpu_avg = _fmt_val(m["cpu"]["avg"], "%")
-        cpu_max = _fmt_val(m["cpu"]["max"], "%")
-        credit = _fmt_val(m["credit_balance"]["avg"], " cred", decimals=0)
-        net_in = _fmt_val(m["network_in_bytes"]["avg"], " MB", scale=1/1024/1024)
-        net_out = _fmt_val(m["network_out_bytes"]["avg"], " MB", scale=1/1024/1024)
-        lines.append(f"| {m['instance_id']} | {cpu_avg} | {cpu_max} | {credit} | {net_in} | {net_out} |")
-
-    if not ec2_metrics:
-        lines.append("| — | Nenhuma metrica EC2 coletada | | | | |")
-
-    lines += [
-        f"",
-        f"---",
-        f"",
-        f"## Metricas ALB/NLB",
-        f"",
-        f"| Load Balancer | Resp Time Avg (s) | Resp Time Max (s) | Requests Total | Erros 5XX | Erros 4XX |",
-        f"|---|---|---|---|---|---|",
-    ]
-
-    for m in alb_metrics:
-        rt_avg = _fmt_val(m["response_time_s"]["avg"], "s", decimals=3)
-        rt_max = _fmt_val(m["response_time_s"]["max"], "s", decimals=3)
-        reqs = _fmt_val(m["request_count"]["avg"], "", decimals=0)
-        e5xx = _fmt_val(m["error_5xx"]["avg"], "", decimals=0)
-        e4xx = _fmt_val(m["error_4xx"]["avg"], "", decimals=0)
-        lines.append(f"| {m['lb_name']} | {rt_avg} | {rt_max} | {reqs} | {e5xx} | {e4xx} |")
-
-    if not alb_metrics:
-        lines.append("| — | Nenhuma metrica ALB coletada | | | | |")
-
-    lines += [
-        f"",
-        f"---",
-        f"",
-        f"## Metricas EBS",
-        f"",
-        f"| Volume | Queue Length Avg | Queue Length Max | Read Latency Avg | Write Latency Avg | Burst Balance |",
-        f"|---|---|---|---|---|---|",
-    ]
+    out = io.StringIO()
+    writer = CloudWatchReportWriter(out, environment, period_days, period_seconds)
+    sections = (
+        ("ec2", ec2_metrics), ("alb", alb_metrics), ("nlb", nlb_metrics or []),
+        ("ebs", ebs_metrics), ("rds", rds_metrics),
+    )
+    for kind, metrics in sections:
+        for m in metrics:
+            writer.add(kind, m)
+    writer.close()
+    return out.getvalue()
 
-    for m in ebs_metrics:
-        ql_avg = _fmt_val(m["queue_length"]["avg"], "", decimals=3)
-        ql_max = _fmt_val(m["queue_length"]["max"], "", decimals=3)
-        rl = _fmt_val(m["read_latency_s"]["avg"], "s", decimals=4)
-        wl = _fmt_val(m["write_latency_s"]["avg"], "s", decimals=4)
-        burst = _fmt_val(m["burst_balance"]["avg"], "%", decimals=1)
-        lines.append(f"| {m['volume_id']} | {ql_avg} | {ql_max} | {rl} | {wl} | {burst} |")
 
-    if not ebs_metrics:
-        lines.append("| — | Nenhuma metrica EBS coletada | | | | |")
-
-    if rds_metrics:
-        lines += [
-            f"",
-            f"---",
-            f"",
-            f"## Metricas RDS",
-            f"",
-            f"| Instancia | CPU Avg | CPU Max | Memoria Livre Avg | Read Latency | Write Latency | Conexoes |",
-            f"|---|---|---|---|---|---|---|",
-        ]
-        for m in rds_metrics:
-            cpu_avg = _fmt_val(m["cpu"]["avg"], "%")
-            cpu_max = _fmt_val(m["cpu"]["max"], "%")
-            mem = _fmt_val(m["freeable_memory_bytes"]["avg"], " MB", scale=1/1024/1024, decimals=0)
-            rl = _fmt_val(m["read_latency_s"]["avg"], "ms", scale=1000, decimals=2)
-            wl = _fmt_val(m["write_latency_s"]["avg"], "ms", scale=1000, decimals=2)
-            conns = _fmt_val(m["connections"]["avg"], "", decimals=0)
-            lines.append(f"| {m['db_id']} | {cpu_avg} | {cpu_max} | {mem} | {rl} | {wl} | {conns} |")
-
-    lines.append("")
-    return "\n".join(lines)
+def _count_skipped(record: dict) -> int:
+    return sum(1 for value in record.values() if isinstance(value, dict) and value.get("skipped"))
 
 
 def run_cloudwatch(
@@ -265,31 +999,110 @@ def run_cloudwatch(
     ebs_ids: list[str],
     rds_ids: list[str],
     period_days: int = 14,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    use_cache: bool = True,
+    cache_path: str = "",
+    discover: bool = True,
+    stream: bool = False,
 ) -> dict:
     """
     Coleta metricas CloudWatch e salva metricas-cloudwatch.md.
-    Retorna dict com caminho do arquivo e metricas brutas.
+    max_concurrency: numero de chamadas GetMetricData simultaneas
+    requests_per_second: teto de chamadas por segundo (compartilhado entre workers)
+    use_cache: reaproveita datapoints de execucoes anteriores
+    cache_path: caminho do SQLite (default: <docs do projeto>/.cache/cloudwatch.sqlite3)
+    discover: consulta so as metricas que existem para cada recurso (ListMetrics);
+              sem efeito com period_days acima de 14
+    stream: grava linhas do relatorio, registros (metricas-cloudwatch.jsonl) e series
+            a medida que os recursos terminam, sem manter as listas em memoria
+    Retorna dict com caminho do arquivo, metricas brutas (com p50/p95/p99 e
+    perfil horario) e series_path (series completas em JSONL). Em modo stream,
+    as listas de metricas sao substituidas por records_path e counts.
     """
-    session = boto3.Session(profile_name=aws_profile, region_name=region)
-    cw = _cw_client(session)
+    cw = _cw_client(aws_profile, region, max_concurrency)
+
+    period_seconds = select_period(period_days)
+    # alb_arns traz ALBs e NLBs do inventario; NLBs publicam em AWS/NetworkELB
+    lb_arns = alb_arns or []
+    targets = {
+        "ec2": ec2_ids or [],
+        "alb": [arn for arn in lb_arns if not _is_nlb(arn)],
+        "nlb": [arn for arn in lb_arns if _is_nlb(arn)],
+        "ebs": ebs_ids or [],
+        "rds": rds_ids or [],
+    }
+    series = SeriesTable(period_seconds)
+    limiter = TokenBucket(requests_per_second)
+    index = MetricIndex(cw, limiter) if discover and period_days <= LIST_METRICS_MAX_DAYS else None
+
+    os.makedirs(docs_dir, exist_ok=True)
+    output_path = os.path.join(docs_dir, "metricas-cloudwatch.md")
+    series_path = os.path.join(docs_dir, SERIES_FILENAME)
+
+    cache = None
+    if use_cache:
+        cache = MetricCache(cache_path or default_cache_path(docs_dir), scope=f"{aws_profile}/{region}")
+    try:
+        if stream:
+            records_path = os.path.join(docs_dir, RECORDS_FILENAME)
+            counts = {kind: 0 for kind in targets}
+            skipped = 0
+            with open(output_path, "w", encoding="utf-8") as md, \
+                    open(records_path, "w", encoding="utf-8") as records_file, \
+                    open(series_path, "w", encoding="utf-8") as series_file:
+                writer = CloudWatchReportWriter(md, environment, period_days, period_seconds)
+                series_file.write(series.header_line() + "\n")
+                for kind, _, record in iter_metrics(
+                    cw, targets, period_days, period_seconds, max_concurrency,
+                    limiter, cache, series, index,
+                ):
+                    writer.add(kind, record)
+                    records_file.write(json.dumps({"kind": kind, "record": record}) + "\n")
+                    records_file.flush()
+                    series.flush(series_file)
+                    counts[kind] += 1
+                    skipped += _count_skipped(record)
+                writer.close()
+            return {
+                "output_path": output_path,
+                "series_path": series_path,
+                "records_path": records_path,
+                "counts": counts,
+                "skipped_metrics": skipped,
+            }
 
-    ec2_metrics = collect_ec2_metrics(cw, ec2_ids, period_days) if ec2_ids else []
-    alb_metrics = collect_alb_metrics(cw, alb_arns, period_days) if alb_arns else []
-    ebs_metrics = collect_ebs_metrics(cw, ebs_ids, period_days) if ebs_ids else []
-    rds_metrics = collect_rds_metrics(cw, rds_ids, period_days) if rds_ids else []
+        metrics = collect_metrics(
+            cw, targets, period_days, period_seconds, max_concurrency, limiter, cache, series, index,
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+    ec2_metrics = metrics["ec2"]
+    alb_metrics = metrics["alb"]
+    nlb_metrics = metrics["nlb"]
+    ebs_metrics = metrics["ebs"]
+    rds_metrics = metrics["rds"]
 
     report_md = build_cloudwatch_report(
         ec2_metrics, alb_metrics, ebs_metrics, rds_metrics, environment, period_days,
+        series.period_seconds, nlb_metrics,
     )
-
-    os.makedirs(docs_dir, exist_ok=True)
-    output_path = os.path.join(docs_dir, "metricas-cloudwatch.md")
     Path(output_path).write_text(report_md, encoding="utf-8")
 
+    # Series completas para analises posteriores (percentis, baselines)
+    series.save(series_path)
+
+    skipped = sum(_count_skipped(record) for records in metrics.values() for record in records)
+
     return {
         "output_path": output_path,
+        "series_path": series_path,
+        "skipped_metrics": skipped,
         "ec2_metrics": ec2_metrics,
         "alb_metrics": alb_metrics,
+        "nlb_metrics": nlb_metrics,
         "ebs_metrics": ebs_metrics,
         "rds_metrics": rds_metrics,
     }
+
@@ -0,0 +1,206 @@
+"""
+docker_diagnostics.py — Estatisticas de containers Docker estruturadas via SSM
+
+A checagem amostra `docker stats --format '{{json .}}'` algumas vezes numa
+janela curta, le o cpu.stat do cgroup de cada container no inicio e no fim da
+janela (throttling do CFS) e os limites do `docker inspect`. Tudo sai em linhas
+marcadas (S, J, T0/T1, I) e vira ContainerStats com valores numericos: CPU %,
+memoria usada/limite, taxas de rede e disco e % de periodos com throttling.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+
+DOCKER_SAMPLES = 3
+DOCKER_SAMPLE_INTERVAL_S = 5
+
+# cpu.stat do container: cgroup v2 (systemd), v1 e v1 com cpu/cpuacct separados
+_THROTTLE_SCRIPT = r"""
+kb_throttle() {
+  for id in $(docker ps -q --no-trunc); do
+    name=$(docker inspect --format '{{.Name}}' "$id" | sed 's#^/##')
+    for f in /sys/fs/cgroup/system.slice/docker-$id.scope/cpu.stat \
+             /sys/fs/cgroup/cpu,cpuacct/docker/$id/cpu.stat \
+             /sys/fs/cgroup/cpu/docker/$id/cpu.stat; do
+      [ -f "$f" ] || continue
+      awk -v tag="$1" -v n="$name" '
+        $1 == "nr_periods" {p = $2}
+        $1 == "nr_throttled" {t = $2}
+        $1 == "throttled_usec" {u = $2}
+        $1 == "throttled_time" {u = $2 / 1000}
+        END {print tag, n, p + 0, t + 0, u + 0}' "$f"
+      break
+    done
+  done
+}
+"""
+
+
+def docker_check_command(samples: int = DOCKER_SAMPLES, interval_s: int = DOCKER_SAMPLE_INTERVAL_S) -> str:
+    """
+    Comando da checagem. Linhas de saida:
+      T0/T1 <nome> <nr_periods> <nr_throttled> <throttled_usec>  (inicio/fim da janela)
+      S <epoch ms>                                             (inicio de cada amostra)
+      J <json do docker stats>                                 (um por container)
+      I <nome> <oom_killed> <limite memoria bytes> <nano cpus>  (docker inspect)
+    """
+    return (
+        "command -v docker >/dev/null 2>&1 || { echo 'docker nao disponivel'; exit 0; }\n"
+        f"{_THROTTLE_SCRIPT.strip()}\n"
+        "kb_throttle T0\n"
+        f"for i in $(seq {samples}); do\n"
+        '  echo "S $(( $(date +%s%N) / 1000000 ))"\n'
+        "  docker stats --no-stream --format '{{json .}}' | sed 's/^/J /'\n"
+        f'  [ "$i" -lt {samples} ] && sleep {interval_s}\n'
+        "done\n"
+        "kb_throttle T1\n"
+        "docker ps -q | xargs -r docker inspect "
+        "--format 'I {{.Name}} {{.State.OOMKilled}} {{.HostConfig.Memory}} {{.HostConfig.NanoCpus}}' "
+        "| sed 's#^I /#I #'"
+    )
+
+
+@dataclass(slots=True)
+class ContainerStats:
+    name: str
+    cpu_pct_avg: float = 0.0
+    cpu_pct_max: float = 0.0
+    mem_used_bytes: float = 0.0
+    mem_limit_bytes: float = 0.0
+    mem_pct_max: float = 0.0
+    mem_limit_set: bool | None = None
+    cpu_limit: float | None = None
+    oom_killed: bool = False
+    net_rx_bytes_s: float | None = None
+    net_tx_bytes_s: float | None = None
+    block_read_bytes_s: float | None = None
+    block_write_bytes_s: float | None = None
+    pids: int = 0
+    throttled_pct: float | None = None
+    throttled_s: float | None = None
+    samples: int = 0
+
+    @property
+    def block_io_mb_s(self) -> float | None:
+        if self.block_read_bytes_s is None:
+            return None
+        return (self.block_read_bytes_s + self.block_write_bytes_s) / 1e6
+
+    @property
+    def net_io_mb_s(self) -> float | None:
+        if self.net_rx_bytes_s is None:
+            return None
+        return (self.net_rx_bytes_s + self.net_tx_bytes_s) / 1e6
+
+
+# Unidades do docker stats: decimais em rede/disco (kB, MB), binarias em memoria (KiB, MiB)
+_UNITS = {
+    "B": 1, "kB": 1e3, "KB": 1e3, "MB": 1e6, "GB": 1e9, "TB": 1e12,
+    "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4,
+}
+
+
+def _bytes(text: str) -> float:
+    match = re.fullmatch(r"\s*([\d.]+)\s*([kKMGT]?i?B)\s*", text)
+    if not match:
+        return 0.0
+    return float(match.group(1)) * _UNITS.get(match.group(2), 1)
+
+
+def _pair(text: str) -> tuple[float, float]:
+    """'1.2MB / 3.4GB' -> (bytes, bytes)."""
+    left, _, right = (text or "").partition("/")
+    return _bytes(left), _bytes(right)
+
+
+def _pct(text: str) -> float:
+    try:
+        return float((text or "0").rstrip("%"))
+    except ValueError:
+        return 0.0
+
+
+def parse_docker_stats(output: str) -> list[ContainerStats] | None:
+    """Containers com metricas numericas; None se a saida nao for da checagem estruturada."""
+    samples: list[tuple[int, dict[str, dict]]] = []
+    throttle: dict[str, dict[str, tuple[int, int, float]]] = {"T0": {}, "T1": {}}
+    inspect: dict[str, tuple[bool, int, int]] = {}
+    for line in output.splitlines():
+        tag, _, rest = line.partition(" ")
+        try:
+            if tag == "S":
+                samples.append((int(rest), {}))
+            elif tag == "J" and samples:
+                row = json.loads(rest)
+                samples[-1][1][row.get("Name") or row.get("Container", "")] = row
+            elif tag in throttle:
+                name, periods, throttled, usec = rest.split()
+                throttle[tag][name] = (int(periods), int(throttled), float(usec))
+            elif tag == "I":
+                name, oom, memory, nano_cpus = rest.split()
+                inspect[name] = (oom == "true", int(memory), int(nano_cpus))
+        except ValueError:
+            continue
+    if not samples:
+        return None
+
+    names = list(dict.fromkeys(name for _, rows in samples for name in rows))
+    containers = []
+    for name in names:
+        rows = [(ts, rs[name]) for ts, rs in samples if name in rs]
+        c = ContainerStats(name=name, samples=len(rows))
+        cpus = [_pct(r.get("CPUPerc")) for _, r in rows]
+        c.cpu_pct_avg = round(sum(cpus) / len(cpus), 2)
+        c.cpu_pct_max = max(cpus)
+        c.mem_pct_max = max(_pct(r.get("MemPerc")) for _, r in rows)
+        c.mem_used_bytes, c.mem_limit_bytes = _pair(rows[-1][1].get("MemUsage"))
+        try:
+            c.pids = int(rows[-1][1].get("PIDs") or 0)
+        except ValueError:
+            c.pids = 0
+
+        # Rede e disco sao contadores acumulados: taxa entre a primeira e a ultima amostra
+        (t0, first), (t1, last) = rows[0], rows[-1]
+        elapsed = (t1 - t0) / 1000
+        if elapsed > 0:
+            (rx0, tx0), (rx1, tx1) = _pair(first.get("NetIO")), _pair(last.get("NetIO"))
+            (rd0, wr0), (rd1, wr1) = _pair(first.get("BlockIO")), _pair(last.get("BlockIO"))
+            c.net_rx_bytes_s = max(0.0, rx1 - rx0) / elapsed
+            c.net_tx_bytes_s = max(0.0, tx1 - tx0) / elapsed
+            c.block_read_bytes_s = max(0.0, rd1 - rd0) / elapsed
+            c.block_write_bytes_s = max(0.0, wr1 - wr0) / elapsed
+
+        start, end = throttle["T0"].get(name), throttle["T1"].get(name)
+        if start and end and end[0] > start[0]:
+            c.throttled_pct = round((end[1] - start[1]) / (end[0] - start[0]) * 100, 1)
+            c.throttled_s = round((end[2] - start[2]) / 1e6, 2)
+
+        if name in inspect:
+            c.oom_killed, memory, nano_cpus = inspect[name]
+            c.mem_limit_set = memory > 0
+            c.cpu_limit = nano_cpus / 1e9 if nano_cpus else None
+        containers.append(c)
+    return containers
+
+
+def docker_report_lines(containers: list[ContainerStats]) -> list[str]:
+    """Tabela markdown por container (substitui as linhas brutas no relatorio SSM)."""
+    if not containers:
+        return ["Nenhum container em execucao.", ""]
+    lines = [
+        f"| Container | CPU % (media / max) | Memoria (uso / limite) | Mem % max | Throttling % "
+        f"| Rede MB/s | Disco MB/s | PIDs | OOM |",
+        f"|---|---|---|---|---|---|---|---|---|",
+    ]
+    for c in containers:
+        limit = f"{c.mem_limit_bytes / 1024 ** 3:.2f}GiB" if c.mem_limit_set is not False else "sem limite"
+        throttled = "—" if c.throttled_pct is None else f"{c.throttled_pct:g}"
+        net = "—" if c.net_io_mb_s is None else f"{c.net_io_mb_s:.2f}"
+        block = "—" if c.block_io_mb_s is None else f"{c.block_io_mb_s:.2f}"
+        lines.append(
+            f"| `{c.name}` | {c.cpu_pct_avg:g} / {c.cpu_pct_max:g} | {c.mem_used_bytes / 1024 ** 2:.0f}MiB / {limit} "
+            f"| {c.mem_pct_max:g} | {throttled} | {net} | {block} | {c.pids} | {'sim' if c.oom_killed else 'nao'} |"
+        )
+    lines.append("")
+    return lines
@@ -0,0 +1,90 @@
+"""
+host_sampling.py — Amostragem por segundo do host via SSM
+
+O coletor roda vmstat e iostat a cada segundo durante uma janela e resume tudo
+no proprio host em linhas curtas (N, V, D). Aqui ficam o comando, o parser
+dessas linhas e os percentis de cada serie; sem boto3, para o analyzer e os
+thresholds poderem usar sem carregar o cliente SSM.
+"""
+
+# Amostragem do host: vmstat/iostat a cada segundo durante a janela, resumidos
+# no proprio host em uma linha por segundo (serie numerica compacta)
+SAMPLING_CATEGORY = "amostragem"
+SAMPLING_LABEL = "host_samples"
+DEFAULT_SAMPLE_SECONDS = 60
+MAX_SAMPLE_SECONDS = 600
+
+# Series da amostragem e percentis calculados em cada uma (host.percentile escolhe um)
+SAMPLE_SERIES = ("cpu_busy", "iowait", "run_queue", "disk_util")
+SAMPLE_PERCENTILES = (50, 90, 99)
+
+
+def sampling_command(seconds: int) -> str:
+    """
+    Coletor leve para a janela: linhas 'N <vcpus>', 'V <run queue> <cpu %> <iowait %>'
+    (vmstat, por segundo) e 'D <maior %util entre os discos>' (iostat, por segundo).
+    """
+    vmstat = (
+        f"vmstat -n 1 {seconds + 1} | awk 'NR==2{{for(i=1;i<=NF;i++)c[$i]=i; next}} "
+        "NR>3{print \"V\", $c[\"r\"], 100-$c[\"id\"], $c[\"wa\"]}'"
+    )
+    iostat = (
+        f"iostat -dxy 1 {seconds} 2>/dev/null | awk '/^Device/{{if(n)print \"D\", m+0; n=1; m=0; next}} "
+        "n && NF>1 && $1 !~ /^(loop|ram|zram)/{if($NF+0>m)m=$NF+0} END{if(n)print \"D\", m+0}'"
+    )
+    return (
+        'echo "N $(nproc 2>/dev/null || echo 1)"; '
+        f'KB_IO="$(mktemp)"; ({iostat}) > "$KB_IO" & {vmstat}; wait; cat "$KB_IO"; rm -f "$KB_IO"'
+    )
+
+
+def parse_host_samples(output: str) -> dict:
+    """Series por segundo da amostragem: {'vcpus', 'cpu_busy', 'iowait', 'run_queue', 'disk_util'}."""
+    samples = {"vcpus": 1, **{name: [] for name in SAMPLE_SERIES}}
+    for line in output.splitlines():
+        fields = line.split()
+        try:
+            if fields[:1] == ["N"] and len(fields) == 2:
+                samples["vcpus"] = max(1, int(fields[1]))
+            elif fields[:1] == ["V"] and len(fields) == 4:
+                samples["run_queue"].append(float(fields[1]))
+                samples["cpu_busy"].append(float(fields[2]))
+                samples["iowait"].append(float(fields[3]))
+            elif fields[:1] == ["D"] and len(fields) == 2:
+                samples["disk_util"].append(float(fields[1]))
+        except ValueError:
+            continue
+    return samples
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    """Percentil por nearest-rank de uma lista ordenada."""
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def sample_percentiles(samples: dict) -> dict[str, dict]:
+    """
+    Percentis de cada serie: {serie: {'p50', 'p90', 'p99', 'max', 'samples'}}.
+    A fila de execucao tambem sai normalizada por vCPU (run_queue_per_cpu).
+    """
+    series = {name: samples.get(name, []) for name in SAMPLE_SERIES}
+    series["run_queue_per_cpu"] = [r / samples.get("vcpus", 1) for r in series["run_queue"]]
+    stats = {}
+    for name, values in series.items():
+        if not values:
+            continue
+        ordered = sorted(values)
+        stats[name] = {f"p{q}": round(_percentile(ordered, q), 2) for q in SAMPLE_PERCENTILES}
+        stats[name]["max"] = round(ordered[-1], 2)
+        stats[name]["samples"] = len(ordered)
+    return stats
+
+
+def host_samples(results: dict[str, dict[str, str]]) -> dict | None:
+    """Series e percentis da amostragem de uma instancia; None se nao foi coletada."""
+    output = results.get(SAMPLING_CATEGORY, {}).get(SAMPLING_LABEL, "")
+    if not output or output.startswith("["):
+        return None
+    samples = parse_host_samples(output)
+    return {"series": samples, "percentiles": sample_percentiles(samples)}
@@ -0,0 +1,160 @@
+"""
+inventory_records.py — Registros compactos de recursos do inventario e indices
+
+Cada recurso coletado vira uma dataclass com __slots__ (sem __dict__ por
+instancia) e os campos categoricos repetidos (tipo, estado, AZ...) sao
+internados, de modo que contas com dezenas de milhares de volumes cabem em
+uma fracao da memoria de uma lista de dicts.
+
+ResourceIndex percorre a lista uma unica vez e guarda os indices usados pelo
+relatorio e pelo comparativo Terraform (por ID, por estado e, para EBS, por
+instancia anexada), evitando novas passadas sobre os registros.
+"""
+
+import sys
+from dataclasses import dataclass, fields
+
+
+def _intern(value) -> str:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(slots=True)
+class Ec2Instance:
+    id: str
+    name: str
+    type: str
+    state: str
+    az: str
+    private_ip: str
+    public_ip: str
+    launch_time: str
+
+    def __post_init__(self):
+        self.type, self.state, self.az = _intern(self.type), _intern(self.state), _intern(self.az)
+
+    def to_dict(self) -> dict:
+        return _to_dict(self)
+
+
+@dataclass(slots=True)
+class LoadBalancer:
+    name: str
+    type: str
+    scheme: str
+    state: str
+    arn: str
+    dns: str
+    target_groups: tuple
+    targets_total: int = 0
+    targets_healthy: int = 0
+    targets_unhealthy: int = 0
+
+    def __post_init__(self):
+        self.type, self.scheme, self.state = _intern(self.type), _intern(self.scheme), _intern(self.state)
+
+    @property
+    def id(self) -> str:
+        return self.arn
+
+    def to_dict(self) -> dict:
+        d = _to_dict(self)
+        d["target_groups"] = list(self.target_groups)
+        return d
+
+
+@dataclass(slots=True)
+class EbsVolume:
+    id: str
+    name: str
+    type: str
+    size_gb: int
+    state: str
+    iops: int | str
+    throughput: int | str
+    attached_to: str
+    az: str
+
+    def __post_init__(self):
+        self.type, self.state, self.az = _intern(self.type), _intern(self.state), _intern(self.az)
+
+    def to_dict(self) -> dict:
+        return _to_dict(self)
+
+
+@dataclass(slots=True)
+class RdsInstance:
+    id: str
+    engine: str
+    db_class: str
+    status: str
+    storage_gb: int
+    storage_type: str
+    multi_az: bool
+    endpoint: str
+
+    def __post_init__(self):
+        self.engine, self.db_class = _intern(self.engine), _intern(self.db_class)
+        self.status, self.storage_type = _intern(self.status), _intern(self.storage_type)
+
+    @property
+    def state(self) -> str:
+        return self.status
+
+    def to_dict(self) -> dict:
+        d = _to_dict(self)
+        # Nome publico do campo (class e palavra reservada)
+        d["class"] = d.pop("db_class")
+        return d
+
+
+def _to_dict(record) -> dict:
+    return {f.name: getattr(record, f.name) for f in fields(record)}
+
+
+UNATTACHED = "unattached"
+
+
+class ResourceIndex:
+    """Indices de uma lista de registros, montados em uma unica passada."""
+
+    __slots__ = ("records", "by_id", "by_state", "by_attachment", "unhealthy_targets")
+
+    def __init__(self, records: list):
+        self.records = records
+        self.by_id: dict[str, object] = {}
+        self.by_state: dict[str, int] = {}
+        self.by_attachment: dict[str, list[str]] = {}
+        self.unhealthy_targets = 0
+        for r in records:
+            self.by_id[r.id] = r
+            self.by_state[r.state] = self.by_state.get(r.state, 0) + 1
+            attached_to = getattr(r, "attached_to", None)
+            if attached_to is not None:
+                self.by_attachment.setdefault(attached_to, []).append(r.id)
+            self.unhealthy_targets += getattr(r, "targets_unhealthy", 0)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def ids(self):
+        """IDs (ARN para load balancers) na ordem de coleta; view sem copia."""
+        return self.by_id.keys()
+
+    @property
+    def unattached(self) -> list[str]:
+        return self.by_attachment.get(UNATTACHED, [])
+
+    def state_summary(self) -> str:
+        return ", ".join(f"{state}: {n}" for state, n in sorted(self.by_state.items()))
+
+
+def build_indexes(collected: dict) -> dict[str, ResourceIndex]:
+    """{'ec2': ResourceIndex, 'alb': ..., 'ebs': ..., 'rds': ...} a partir das listas coletadas."""
+    return {kind: ResourceIndex(collected.get(kind, [])) for kind in ("ec2", "alb", "ebs", "rds")}
+
+
+def as_dicts(records: list) -> list[dict]:
+    """Registros como dicts (retorno das tools MCP e snapshots)."""
+    return [r.to_dict() for r in records]
@@ -0,0 +1,201 @@
+"""
+inventory_snapshot.py — Snapshots do inventario AWS e diff entre execucoes
+
+Cada execucao grava um snapshot JSONL compacto (uma linha por recurso, com
+hash do conteudo) em <docs>/.cache/. A execucao seguinte compara os hashes
+para listar recursos adicionados, removidos e alterados, e reaproveita o
+markdown das secoes cujo conteudo nao mudou.
+
+Os recursos sao identificados por escopo (profile/regiao) + tipo + ID; o diff
+so considera os escopos coletados na execucao atual.
+"""
+
+import hashlib
+import json
+import os
+
+from tools.metric_cache import default_cache_path
+
+SNAPSHOT_FILENAME = "inventory-{environment}.jsonl"
+SECTIONS_FILENAME = "inventory-sections-{environment}.json"
+
+# Campo que identifica cada tipo de recurso
+ID_KEYS = {"ec2": "id", "alb": "arn", "ebs": "id", "rds": "id"}
+
+KIND_LABELS = {"ec2": "EC2", "alb": "Load Balancer", "ebs": "EBS", "rds": "RDS"}
+
+
+def snapshot_paths(docs_dir: str, environment: str) -> tuple[str, str]:
+    """Caminhos do snapshot e do cache de secoes, ao lado do cache de metricas."""
+    cache_dir = os.path.dirname(default_cache_path(docs_dir))
+    return (
+        os.path.join(cache_dir, SNAPSHOT_FILENAME.format(environment=environment)),
+        os.path.join(cache_dir, SECTIONS_FILENAME.format(environment=environment)),
+    )
+
+
+def record_hash(data: dict) -> str:
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def _as_data(item) -> dict:
+    """Registros compactos (inventory_records) viram dict so quando necessario."""
+    return item.to_dict() if hasattr(item, "to_dict") else item
+
+
+def build_snapshot(scope: str, collected: dict) -> dict[tuple[str, str, str], dict]:
+    """
+    {(escopo, tipo, id): {'hash', 'data'}} a partir das listas coletadas.
+    data guarda o proprio registro coletado (sem copia em dict).
+    """
+    records = {}
+    for kind, id_key in ID_KEYS.items():
+        for item in collected.get(kind, []):
+            data = _as_data(item)
+            records[(scope, kind, data[id_key])] = {"hash": record_hash(data), "data": item}
+    return records
+
+
+def load_snapshot(path: str) -> tuple[str, dict]:
+    """Retorna (data do snapshot, registros); ('', {}) se nao houver snapshot."""
+    if not os.path.exists(path):
+        return "", {}
+    records = {}
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            records[(row["scope"], row["kind"], row["id"])] = {"hash": row["hash"], "data": row["data"]}
+    return header.get("taken_at", ""), records
+
+
+def save_snapshot(path: str, current: dict, previous: dict, scopes: set[str], taken_at: str) -> None:
+    """Grava o snapshot atual, preservando recursos de escopos nao coletados nesta execucao."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    merged = {k: v for k, v in previous.items() if k[0] not in scopes}
+    merged.update(current)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"taken_at": taken_at}) + "\n")
+        for (scope, kind, rid), rec in merged.items():
+            f.write(json.dumps({
+                "scope": scope, "kind": kind, "id": rid, "hash": rec["hash"], "data": _as_data(rec["data"]),
+            }, default=str) + "\n")
+    os.replace(tmp_path, path)
+
+
+def diff_snapshots(previous: dict, current: dict, scopes: set[str]) -> dict[str, list[dict]]:
+    """Recursos adicionados, removidos e alterados (com os campos alterados)."""
+    previous = {k: v for k, v in previous.items() if k[0] in scopes}
+    added, removed, changed = [], [], []
+    for key, rec in current.items():
+        old = previous.get(key)
+        if old is None:
+            added.append(_change(key))
+        elif old["hash"] != rec["hash"]:
+            old_data, new_data = _as_data(old["data"]), _as_data(rec["data"])
+            fields = sorted(
+                f for f in set(old_data) | set(new_data)
+                if old_data.get(f) != new_data.get(f)
+            )
+            changed.append({**_change(key), "fields": fields})
+    for key in previous:
+        if key not in current:
+            removed.append(_change(key))
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def _change(key: tuple[str, str, str]) -> dict:
+    scope, kind, rid = key
+    return {"scope": scope, "kind": kind, "id": rid}
+
+
+def build_diff_section(diff: dict, previous_taken_at: str, show_scope: bool = False) -> list[str]:
+    """Secao markdown com as mudancas desde o ultimo inventario."""
+    total = sum(len(v) for v in diff.values())
+    lines = [
+        f"---",
+        f"",
+        f"## Mudancas desde o ultimo inventario",
+        f"",
+        f"**Inventario anterior:** {previous_taken_at or '—'} (BRT)  ",
+        f"**Adicionados:** {len(diff['added'])} | **Removidos:** {len(diff['removed'])} "
+        f"| **Alterados:** {len(diff['changed'])}",
+        f"",
+    ]
+    if not total:
+        lines += ["Nenhuma mudanca detectada.", ""]
+        return lines
+
+    scope_col = "Conta/Regiao | " if show_scope else ""
+    lines += [
+        f"| {scope_col}Tipo | Recurso | Mudanca | Campos |",
+        f"|{'---|' if show_scope else ''}---|---|---|---|",
+    ]
+    labels = {"added": "adicionado", "removed": "removido", "changed": "alterado"}
+    for status in ("added", "removed", "changed"):
+        for c in diff[status]:
+            scope = f"{c['scope']} | " if show_scope else ""
+            fields = ", ".join(c.get("fields", [])) or "—"
+            lines.append(f"| {scope}{KIND_LABELS[c['kind']]} | `{c['id']}` | {labels[status]} | {fields} |")
+    lines.append("")
+    return lines
+
+
+def section_digests(records: dict, scope: str, heading: str) -> dict[str, str]:
+    """Digest do conteudo de cada secao (tipo) de um escopo, na ordem dos recursos."""
+    parts: dict[str, list[str]] = {kind: [heading] for kind in ID_KEYS}
+    for (rec_scope, kind, _), rec in records.items():
+        if rec_scope == scope:
+            parts[kind].append(rec["hash"])
+    return {kind: hashlib.sha1("|".join(p).encode()).hexdigest() for kind, p in parts.items()}
+
+
+def code_digest(*paths: str) -> str:
+    """Digest do codigo-fonte dos modulos que renderizam as secoes."""
+    h = hashlib.sha1()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+class SectionCache:
+    """
+    Markdown renderizado por secao, indexado pelo digest do conteudo e pela versao
+    do renderizador (renderer): mudar o codigo de uma secao invalida o que foi
+    gravado pela versao anterior, mesmo com os dados iguais.
+    """
+
+    def __init__(self, path: str, renderer: str = ""):
+        self.path = path
+        self.renderer = renderer
+        self._entries: dict[str, list[str]] = {}
+        self._used: dict[str, list[str]] = {}
+        self.hits = 0
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def render(self, digest: str, build) -> list[str]:
+        """Retorna as linhas em cache para o digest ou renderiza com build()."""
+        key = f"{self.renderer}:{digest}"
+        lines = self._entries.get(key)
+        if lines is None:
+            lines = build()
+        else:
+            self.hits += 1
+        self._used[key] = lines
+        return lines
+
+    def save(self) -> None:
+        """Grava so as secoes usadas nesta execucao (cache nao cresce sem limite)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self._used, f)
@@ -0,0 +1,170 @@
+"""
+metric_cache.py — Cache local (SQLite) de datapoints CloudWatch
+
+Guarda os datapoints brutos por serie, com a serie identificada por
+escopo (profile/regiao) + namespace + metrica + dimensoes + periodo + estatistica.
+Cada serie registra o intervalo continuo ja coberto, de modo que uma nova
+execucao so precisa buscar na API o trecho final que ainda falta.
+
+Eviction por tamanho: ao fechar, se o banco passar de max_bytes, as series
+acessadas ha mais tempo sao removidas ate voltar abaixo do limite.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+CACHE_FILENAME = "cloudwatch.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    covered_from INTEGER NOT NULL,
+    covered_until INTEGER NOT NULL,
+    last_access INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS datapoints (
+    series_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (series_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_series_access ON series (last_access);
+"""
+
+
+def default_cache_path(docs_dir: str) -> str:
+    """Cache compartilhado entre as analises do projeto: <docs>/.cache/."""
+    docs_root = os.path.dirname(os.path.abspath(docs_dir))
+    return os.path.join(docs_root, ".cache", CACHE_FILENAME)
+
+
+class MetricCache:
+    """Cache de datapoints thread-safe (uma conexao protegida por lock)."""
+
+    def __init__(self, path: str, scope: str = "", max_bytes: int = DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.scope = scope
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def series_key(
+        self,
+        namespace: str,
+        metric_name: str,
+        dimensions: list[dict],
+        period_seconds: int,
+        stat: str,
+    ) -> str:
+        dims = sorted((d["Name"], d["Value"]) for d in dimensions)
+        return json.dumps([self.scope, namespace, metric_name, dims, period_seconds, stat])
+
+    def _series_row(self, key: str):
+        return self._conn.execute(
+            "SELECT id, covered_from, covered_until FROM series WHERE key = ?", (key,),
+        ).fetchone()
+
+    def fetch_start(self, key: str, start: int, end: int, period_seconds: int) -> int:
+        """
+        Inicio do trecho que ainda precisa ser buscado na API para cobrir [start, end).
+        O ultimo periodo coberto e sempre rebuscado (pode ter chegado incompleto).
+        """
+        with self._lock:
+            row = self._series_row(key)
+        if row is None:
+            return start
+        _, covered_from, covered_until = row
+        if covered_from > start or covered_until < start:
+            return start
+        return min(end, max(start, covered_until - period_seconds))
+
+    def store(
+        self,
+        key: str,
+        timestamps: list[int],
+        values: list[float],
+        fetched_from: int,
+        fetched_until: int,
+    ) -> None:
+        """Grava os datapoints buscados e estende o intervalo coberto da serie."""
+        now = int(time.time())
+        with self._lock, self._conn:
+            row = self._series_row(key)
+            if row is None:
+                cur = self._conn.execute(
+                    "INSERT INTO series (key, covered_from, covered_until, last_access) VALUES (?, ?, ?, ?)",
+                    (key, fetched_from, fetched_until, now),
+                )
+                series_id = cur.lastrowid
+            else:
+                series_id, covered_from, covered_until = row
+                # Mantem o inicio antigo so se o novo trecho for continuo a ele
+                if covered_from <= fetched_from <= covered_until:
+                    fetched_from = covered_from
+                self._conn.execute(
+                    "UPDATE series SET covered_from = ?, covered_until = ?, last_access = ? WHERE id = ?",
+                    (fetched_from, max(fetched_until, covered_until), now, series_id),
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO datapoints (series_id, ts, value) VALUES (?, ?, ?)",
+                ((series_id, ts, v) for ts, v in zip(timestamps, values)),
+            )
+
+    def read(self, key: str, start: int, end: int) -> tuple[list[int], list[float]]:
+        """Retorna (timestamps, valores) da serie em [start, end), em ordem."""
+        with self._lock:
+            row = self._series_row(key)
+            if row is None:
+                return [], []
+            series_id = row[0]
+            # Commit do acesso: a eviction ordena por last_access
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE series SET last_access = ? WHERE id = ?", (int(time.time()), series_id),
+                )
+            rows = self._conn.execute(
+                "SELECT ts, value FROM datapoints WHERE series_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (series_id, start, end),
+            ).fetchall()
+        return [r[0] for r in rows], [r[1] for r in rows]
+
+    def _used_bytes(self) -> int:
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist) * page_size
+
+    def evict(self) -> int:
+        """Remove as series menos acessadas ate o banco caber em max_bytes. Retorna quantas."""
+        removed = 0
+        with self._lock:
+            if self._used_bytes() <= self.max_bytes:
+                return 0
+            target = int(self.max_bytes * 0.9)
+            while self._used_bytes() > target:
+                ids = [r[0] for r in self._conn.execute(
+                    "SELECT id FROM series ORDER BY last_access LIMIT 50"
+                ).fetchall()]
+                if not ids:
+                    break
+                marks = ",".join("?" * len(ids))
+                with self._conn:
+                    self._conn.execute(f"DELETE FROM datapoints WHERE series_id IN ({marks})", ids)
+                    self._conn.execute(f"DELETE FROM series WHERE id IN ({marks})", ids)
+                removed += len(ids)
+            self._conn.execute("VACUUM")
+        return removed
+
+    def close(self) -> None:
+        self.evict()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,149 @@
+"""
+metric_series.py — Series temporais de metricas em formato colunar compacto
+
+Todas as series (recurso x metrica) ficam em tres colunas contiguas
+(array 'q' de timestamps, array 'd' de valores e offsets por serie), sem um
+objeto Python por datapoint. Percentis e perfis por hora do dia sao
+calculados numa unica passada sobre a tabela inteira.
+
+Persistencia em JSONL: uma linha de cabecalho seguida de uma linha por serie,
+o que permite gravar as series a medida que sao coletadas.
+"""
+
+import json
+from array import array
+
+# Percentis expostos nos resumos de metricas
+PERCENTILES = (50, 95, 99)
+
+# Perfis por hora do dia no horario de Brasilia (UTC-3)
+TZ_OFFSET_S = -3 * 3600
+
+SERIES_FILENAME = "series-cloudwatch.jsonl"
+
+
+def percentile(sorted_values, q: float) -> float | None:
+    """Percentil com interpolacao linear (mesmo criterio do numpy.percentile)."""
+    n = len(sorted_values)
+    if n == 0:
+        return None
+    pos = (n - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, n - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+class SeriesTable:
+    """Series de varios recursos/metricas em colunas contiguas."""
+
+    def __init__(self, period_seconds: int = 3600):
+        self.period_seconds = period_seconds
+        self.keys: list[tuple[str, str, str]] = []      # (kind, resource_id, metric)
+        self.offsets = array("q", [0])
+        self.timestamps = array("q")
+        self.values = array("d")
+        self._index: dict[tuple[str, str, str], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def append(self, key: tuple[str, str, str], timestamps, values) -> None:
+        self._index[key] = len(self.keys)
+        self.keys.append(key)
+        self.timestamps.extend(timestamps)
+        self.values.extend(values)
+        self.offsets.append(len(self.values))
+
+    def get(self, key: tuple[str, str, str]) -> tuple[memoryview, memoryview] | None:
+        """Retorna (timestamps, valores) da serie, sem copia."""
+        i = self._index.get(key)
+        if i is None:
+            return None
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return memoryview(self.timestamps)[lo:hi], memoryview(self.values)[lo:hi]
+
+    def percentiles(self, qs: tuple = PERCENTILES, start: int = 0) -> list[dict]:
+        """Percentis das series a partir da posicao start, na ordem de self.keys."""
+        out = []
+        for i in range(start, len(self.keys)):
+            seg = sorted(self.values[self.offsets[i]:self.offsets[i + 1]])
+            out.append({f"p{q}": _round(percentile(seg, q)) for q in qs})
+        return out
+
+    def hourly_profiles(self, tz_offset_s: int = TZ_OFFSET_S, start: int = 0) -> list[list[float | None]]:
+        """Media por hora do dia (0-23) das series a partir de start, na ordem de self.keys."""
+        # Hora do dia de cada datapoint, calculada uma vez para a coluna inteira
+        base = self.offsets[start]
+        hours = array("b", (((ts + tz_offset_s) // 3600) % 24 for ts in self.timestamps[base:]))
+        out = []
+        for i in range(start, len(self.keys)):
+            sums = [0.0] * 24
+            counts = [0] * 24
+            for j in range(self.offsets[i], self.offsets[i + 1]):
+                h = hours[j - base]
+                sums[h] += self.values[j]
+                counts[h] += 1
+            out.append([_round(sums[h] / counts[h]) if counts[h] else None for h in range(24)])
+        return out
+
+    def summaries(self, start: int = 0) -> dict[tuple[str, str, str], dict]:
+        """
+        Percentis e perfil horario por serie: {key: {'p50', 'p95', 'p99', 'hourly'}}.
+        start limita o calculo as series adicionadas a partir daquela posicao.
+        """
+        result = {}
+        pcts_all = self.percentiles(start=start)
+        hourly_all = self.hourly_profiles(start=start)
+        for key, pcts, hourly in zip(self.keys[start:], pcts_all, hourly_all):
+            result[key] = {**pcts, "hourly": hourly}
+        return result
+
+    def clear(self) -> None:
+        self.keys = []
+        self.offsets = array("q", [0])
+        self.timestamps = array("q")
+        self.values = array("d")
+        self._index = {}
+
+    def header_line(self) -> str:
+        return json.dumps({"period_seconds": self.period_seconds, "tz_offset_s": TZ_OFFSET_S})
+
+    def series_line(self, i: int) -> str:
+        kind, resource_id, metric = self.keys[i]
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return json.dumps({
+            "kind": kind,
+            "resource": resource_id,
+            "metric": metric,
+            "t": self.timestamps[lo:hi].tolist(),
+            "v": self.values[lo:hi].tolist(),
+        })
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.header_line() + "\n")
+            for i in range(len(self.keys)):
+                f.write(self.series_line(i) + "\n")
+
+    def flush(self, f) -> None:
+        """Grava as series em memoria num arquivo ja aberto e esvazia a tabela (modo streaming)."""
+        for i in range(len(self.keys)):
+            f.write(self.series_line(i) + "\n")
+        f.flush()
+        self.clear()
+
+    @classmethod
+    def load(cls, path: str) -> "SeriesTable":
+        with open(path, encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            table = cls(header.get("period_seconds", 3600))
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                table.append((row["kind"], row["resource"], row["metric"]), row["t"], row["v"])
+        return table
+
+
+def _round(value: float | None) -> float | None:
+    return None if value is None else round(value, 4)
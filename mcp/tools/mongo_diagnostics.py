@@ -0,0 +1,313 @@
+"""
+mongo_diagnostics.py — Diagnostico MongoDB estruturado via SSM
+
+Um unico script mongosh coleta subconjuntos do serverStatus (duas leituras
+com intervalo, para taxas como page faults por minuto), lag de replicacao do
+rs.status(), tamanho e indices das maiores colecoes e as operacoes ativas mais
+lentas do currentOp, e imprime um documento JSON numa linha marcada.
+
+parse_mongo_diagnostics converte esse JSON em MongoMetrics (campos tipados),
+usado pelo analyzer contra os thresholds de mongodb e pelo relatorio SSM.
+"""
+
+import json
+from dataclasses import dataclass, field
+
+# Prefixo da linha com o JSON (o shell pode imprimir avisos antes)
+JSON_MARKER = "KANBANIA_MONGO_JSON "
+
+# Intervalo entre as duas leituras do serverStatus
+SAMPLE_MS = 10000
+
+TOP_COLLECTIONS = 20
+TOP_SLOW_OPS = 5
+
+# Operacoes ativas ha pelo menos isso entram na lista de lentas
+SLOW_OP_MIN_S = 1
+
+MONGO_SCRIPT = f"""
+function num(x) {{
+  if (x === null || x === undefined) return null;
+  if (typeof x === "number") return x;
+  if (x.toNumber) return x.toNumber();
+  return Number(x);
+}}
+function safe(f) {{
+  try {{ return f(); }} catch (e) {{ return {{error: String(e.message || e)}}; }}
+}}
+var admin = db.getSiblingDB("admin");
+var s1 = admin.serverStatus();
+sleep({SAMPLE_MS});
+var s2 = admin.serverStatus();
+var wt = (s2.wiredTiger || {{}}).cache || {{}};
+var ops = {{}};
+["insert", "query", "update", "delete", "getmore", "command"].forEach(function (k) {{
+  ops[k] = num((s2.opcounters || {{}})[k]) - num((s1.opcounters || {{}})[k]);
+}});
+var queue = (s2.globalLock || {{}}).currentQueue || {{}};
+var out = {{
+  version: s2.version,
+  uptime_s: num(s2.uptime),
+  sample_s: {SAMPLE_MS / 1000},
+  connections: {{
+    current: num((s2.connections || {{}}).current),
+    available: num((s2.connections || {{}}).available),
+    active: num((s2.connections || {{}}).active),
+  }},
+  mem_mb: {{resident: num((s2.mem || {{}}).resident), virtual: num((s2.mem || {{}}).virtual)}},
+  page_faults_delta: num((s2.extra_info || {{}}).page_faults) - num((s1.extra_info || {{}}).page_faults),
+  opcounters_delta: ops,
+  queue: {{readers: num(queue.readers), writers: num(queue.writers)}},
+  cache: {{
+    bytes: num(wt["bytes currently in the cache"]),
+    max_bytes: num(wt["maximum bytes configured"]),
+    dirty_bytes: num(wt["tracked dirty bytes in the cache"]),
+  }},
+}};
+out.replication = safe(function () {{
+  var st = admin.runCommand({{replSetGetStatus: 1}});
+  if (!st.ok) return {{enabled: false}};
+  var primary = st.members.filter(function (m) {{ return m.stateStr === "PRIMARY"; }})[0];
+  var lags = st.members.filter(function (m) {{ return m.stateStr === "SECONDARY"; }}).map(function (m) {{
+    return {{name: m.name, lag_s: primary ? (primary.optimeDate - m.optimeDate) / 1000 : null}};
+  }});
+  return {{enabled: true, set: st.set, members: st.members.length, secondaries: lags}};
+}});
+out.collections = safe(function () {{
+  var colls = [];
+  admin.adminCommand({{listDatabases: 1, nameOnly: true}}).databases.forEach(function (d) {{
+    if (["admin", "local", "config"].indexOf(d.name) >= 0) return;
+    var sdb = db.getSiblingDB(d.name);
+    sdb.getCollectionNames().forEach(function (c) {{
+      if (c.indexOf("system.") === 0) return;
+      var s = safe(function () {{ return sdb.getCollection(c).stats(); }});
+      if (s.error) return;
+      colls.push({{
+        ns: d.name + "." + c,
+        count: num(s.count),
+        size_bytes: num(s.size),
+        storage_bytes: num(s.storageSize),
+        index_bytes: num(s.totalIndexSize),
+        indexes: num(s.nindexes),
+      }});
+    }});
+  }});
+  colls.sort(function (a, b) {{ return b.size_bytes - a.size_bytes; }});
+  return {{total: colls.length, top: colls.slice(0, {TOP_COLLECTIONS})}};
+}});
+out.slow_ops = safe(function () {{
+  var inprog = admin.currentOp({{active: true, secs_running: {{$gte: {SLOW_OP_MIN_S}}}}}).inprog || [];
+  inprog.sort(function (a, b) {{ return num(b.secs_running) - num(a.secs_running); }});
+  return inprog.slice(0, {TOP_SLOW_OPS}).map(function (o) {{
+    return {{
+      opid: String(o.opid),
+      op: o.op,
+      ns: o.ns,
+      secs_running: num(o.secs_running),
+      plan: o.planSummary || "",
+      command: JSON.stringify(o.command || {{}}).slice(0, 200),
+    }};
+  }});
+}});
+print("{JSON_MARKER}" + JSON.stringify(out));
+"""
+
+
+def mongo_check_command() -> str:
+    """Comando da checagem: grava o script num arquivo temporario e roda com mongosh (ou mongo)."""
+    return (
+        'KB_JS="$(mktemp --suffix=.js)"\n'
+        "cat > \"$KB_JS\" <<'KBJS'\n"
+        f"{MONGO_SCRIPT.strip()}\n"
+        "KBJS\n"
+        'mongosh --quiet "$KB_JS" 2>/dev/null || mongo --quiet "$KB_JS" 2>/dev/null '
+        "|| echo 'mongosh nao disponivel'\n"
+        'rm -f "$KB_JS"'
+    )
+
+
+@dataclass(slots=True)
+class MongoCollection:
+    ns: str
+    count: int
+    size_bytes: int
+    storage_bytes: int
+    index_bytes: int
+    indexes: int
+
+
+@dataclass(slots=True)
+class MongoSlowOp:
+    opid: str
+    op: str
+    ns: str
+    secs_running: float
+    plan: str
+    command: str
+
+
+@dataclass(slots=True)
+class MongoMetrics:
+    version: str = ""
+    uptime_s: float | None = None
+    connections_current: int | None = None
+    connections_available: int | None = None
+    connections_active: int | None = None
+    resident_mb: int | None = None
+    cache_bytes: int | None = None
+    cache_max_bytes: int | None = None
+    cache_dirty_bytes: int | None = None
+    page_faults_per_min: float | None = None
+    ops_per_s: float | None = None
+    queued_readers: int | None = None
+    queued_writers: int | None = None
+    replica_set: str = ""
+    replication_lag_s: float | None = None
+    collections_total: int | None = None
+    collections: list[MongoCollection] = field(default_factory=list)
+    slow_ops: list[MongoSlowOp] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def cache_ratio(self) -> float | None:
+        if self.cache_bytes is None or not self.cache_max_bytes:
+            return None
+        return self.cache_bytes / self.cache_max_bytes
+
+
+def _int(value) -> int | None:
+    return None if value is None else int(value)
+
+
+def _section(doc: dict, key: str, errors: list[str]):
+    """Secao do JSON; secoes que falharam no host ({'error'}) vao para errors."""
+    value = doc.get(key)
+    if isinstance(value, dict) and "error" in value:
+        errors.append(f"{key}: {value['error']}")
+        return None
+    return value
+
+
+def parse_mongo_diagnostics(output: str) -> MongoMetrics | None:
+    """MongoMetrics a partir da saida da checagem; None se nao houver JSON (ex: sem mongosh)."""
+    doc = None
+    for line in output.splitlines():
+        if line.startswith(JSON_MARKER):
+            try:
+                doc = json.loads(line[len(JSON_MARKER):])
+            except ValueError:
+                return None
+    if doc is None:
+        return None
+
+    m = MongoMetrics(version=doc.get("version") or "", uptime_s=doc.get("uptime_s"))
+    conns = doc.get("connections") or {}
+    m.connections_current = _int(conns.get("current"))
+    m.connections_available = _int(conns.get("available"))
+    m.connections_active = _int(conns.get("active"))
+    m.resident_mb = _int((doc.get("mem_mb") or {}).get("resident"))
+
+    cache = doc.get("cache") or {}
+    m.cache_bytes = _int(cache.get("bytes"))
+    m.cache_max_bytes = _int(cache.get("max_bytes"))
+    m.cache_dirty_bytes = _int(cache.get("dirty_bytes"))
+
+    sample_s = doc.get("sample_s") or 0
+    if sample_s and doc.get("page_faults_delta") is not None:
+        m.page_faults_per_min = round(doc["page_faults_delta"] * 60 / sample_s, 1)
+    ops = [v for v in (doc.get("opcounters_delta") or {}).values() if v is not None]
+    if sample_s and ops:
+        m.ops_per_s = round(sum(ops) / sample_s, 1)
+    queue = doc.get("queue") or {}
+    m.queued_readers, m.queued_writers = _int(queue.get("readers")), _int(queue.get("writers"))
+
+    replication = _section(doc, "replication", m.errors) or {}
+    if replication.get("enabled"):
+        m.replica_set = replication.get("set") or ""
+        lags = [s["lag_s"] for s in replication.get("secondaries", []) if s.get("lag_s") is not None]
+        m.replication_lag_s = max(lags) if lags else None
+
+    collections = _section(doc, "collections", m.errors) or {}
+    m.collections_total = _int(collections.get("total"))
+    m.collections = [
+        MongoCollection(
+            ns=c["ns"],
+            count=_int(c.get("count")) or 0,
+            size_bytes=_int(c.get("size_bytes")) or 0,
+            storage_bytes=_int(c.get("storage_bytes")) or 0,
+            index_bytes=_int(c.get("index_bytes")) or 0,
+            indexes=_int(c.get("indexes")) or 0,
+        )
+        for c in collections.get("top", [])
+    ]
+
+    m.slow_ops = [
+        MongoSlowOp(
+            opid=o.get("opid", ""),
+            op=o.get("op") or "",
+            ns=o.get("ns") or "",
+            secs_running=o.get("secs_running") or 0,
+            plan=o.get("plan") or "",
+            command=o.get("command") or "",
+        )
+        for o in (_section(doc, "slow_ops", m.errors) or [])
+    ]
+    return m
+
+
+def _gb(n: int | None) -> str:
+    return "—" if n is None else f"{n / 1024 ** 3:.2f}GB"
+
+
+def _value(v) -> str:
+    return "—" if v is None else f"{v:g}" if isinstance(v, float) else str(v)
+
+
+def mongo_report_lines(m: MongoMetrics) -> list[str]:
+    """Resumo markdown das metricas MongoDB (substitui o JSON bruto no relatorio SSM)."""
+    ratio = m.cache_ratio
+    lines = [
+        f"| Metrica | Valor |",
+        f"|---|---|",
+        f"| Versao | {m.version or '—'} |",
+        f"| Conexoes (atuais / disponiveis / ativas) | {_value(m.connections_current)} / "
+        f"{_value(m.connections_available)} / {_value(m.connections_active)} |",
+        f"| Cache WiredTiger | {_gb(m.cache_bytes)} / {_gb(m.cache_max_bytes)}"
+        f"{f' ({ratio:.1%})' if ratio is not None else ''} |",
+        f"| Cache sujo | {_gb(m.cache_dirty_bytes)} |",
+        f"| Page faults / min | {_value(m.page_faults_per_min)} |",
+        f"| Operacoes / s | {_value(m.ops_per_s)} |",
+        f"| Fila (leitura / escrita) | {_value(m.queued_readers)} / {_value(m.queued_writers)} |",
+        f"| Replica set | {m.replica_set or 'nao'} |",
+        f"| Lag de replicacao max (s) | {_value(m.replication_lag_s)} |",
+        f"",
+    ]
+    if m.collections:
+        lines += [
+            f"**Maiores colecoes** ({len(m.collections)} de {_value(m.collections_total)}):",
+            f"",
+            f"| Colecao | Documentos | Dados | Storage | Indices | Qtd. indices |",
+            f"|---|---|---|---|---|---|",
+        ]
+        lines += [
+            f"| `{c.ns}` | {c.count} | {_gb(c.size_bytes)} | {_gb(c.storage_bytes)} "
+            f"| {_gb(c.index_bytes)} | {c.indexes} |"
+            for c in m.collections
+        ]
+        lines.append("")
+    if m.slow_ops:
+        lines += [
+            f"**Operacoes mais lentas em execucao:**",
+            f"",
+            f"| opid | Tipo | Namespace | Tempo (s) | Plano | Comando |",
+            f"|---|---|---|---|---|---|",
+        ]
+        lines += [
+            f"| {o.opid} | {o.op} | `{o.ns}` | {o.secs_running:g} | {o.plan or '—'} "
+            f"| `{o.command.replace('|', '/')}` |"
+            for o in m.slow_ops
+        ]
+        lines.append("")
+    if m.errors:
+        lines += [f"Falhas parciais: {'; '.join(m.errors)}", f""]
+    return lines
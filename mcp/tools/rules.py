@@ -0,0 +1,207 @@
+"""
+rules.py — Regras de anomalia declaradas em YAML e avaliadas por coluna
+
+As regras de config/rules.yaml (tipo de recurso, caminho da metrica, comparador,
+severidade, escala) sao compiladas uma vez num plano: limites resolvidos contra o
+thresholds.yaml, comparadores do modulo operator e caminhos agrupados em colunas.
+A avaliacao extrai cada coluna uma unica vez para todos os registros do tipo e
+aplica as regras coluna a coluna; valores ausentes viram NaN e nunca disparam.
+"""
+
+import math
+import operator
+import os
+import threading
+from dataclasses import dataclass
+from itertools import compress, repeat
+from typing import Callable
+
+import yaml
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), "..", "config")
+RULES_PATH = os.path.join(CONFIG_DIR, "rules.yaml")
+
+COMPARATORS: dict[str, Callable[[float, float], bool]] = {
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+}
+SEVERITIES = ("critical", "high", "medium", "low")
+
+
+@dataclass(slots=True)
+class Rule:
+    metric: str
+    column: int
+    op: str
+    compare: Callable[[float, float], bool]
+    limit: float
+    severity: str
+    unit: str
+    suffix: str
+    decimals: int
+    group: str
+    description: str
+
+
+@dataclass(slots=True)
+class RulePlan:
+    """Plano compilado de um tipo de recurso: colunas (caminho, escala) e regras."""
+    kind: str
+    label: str
+    id_keys: tuple[str, ...]
+    columns: list[tuple[tuple[str, ...], float]]
+    rules: list[Rule]
+
+
+def compile_rules(rules_config: dict, thresholds: dict) -> dict[str, RulePlan]:
+    """
+    Compila as regras de todos os tipos. Erros de configuracao (comparador ou
+    severidade invalidos, threshold inexistente sem default) levantam ValueError
+    com a localizacao da regra.
+    """
+    plans = {}
+    for kind, spec in (rules_config or {}).items():
+        t = thresholds.get(kind, {}) or {}
+        columns: dict[tuple[tuple[str, ...], float], int] = {}
+        rules = []
+        for i, raw in enumerate(spec.get("rules", [])):
+            where = f"rules.yaml: {kind}.rules[{i}] ({raw.get('metric', '?')})"
+            op = raw.get("op", ">=")
+            if op not in COMPARATORS:
+                raise ValueError(f"{where}: comparador invalido '{op}'")
+            severity = raw.get("severity", "")
+            if severity not in SEVERITIES:
+                raise ValueError(f"{where}: severidade invalida '{severity}'")
+            limit = t.get(raw["threshold"], raw.get("default"))
+            if not isinstance(limit, (int, float)) or isinstance(limit, bool):
+                raise ValueError(f"{where}: threshold '{kind}.{raw['threshold']}' ausente ou nao numerico")
+            column = (tuple(raw["path"].split(".")), float(raw.get("scale", 1)))
+            rules.append(Rule(
+                metric=raw["metric"],
+                column=columns.setdefault(column, len(columns)),
+                op=op,
+                compare=COMPARATORS[op],
+                limit=limit,
+                severity=severity,
+                unit=str(raw.get("unit", "")),
+                suffix=str(raw.get("suffix", "")),
+                decimals=int(raw.get("decimals", 1)),
+                group=raw.get("group") or f"#{i}",
+                description=raw.get("description", "{metric} em {resource}: {value}"),
+            ))
+        plans[kind] = RulePlan(
+            kind=kind,
+            label=spec.get("label", kind.upper()),
+            id_keys=tuple(spec.get("id", [])),
+            columns=list(columns),
+            rules=rules,
+        )
+    return plans
+
+
+# Planos compilados por (rules.yaml, chave de mtime das camadas de thresholds):
+# (mtime do rules.yaml, thresholds, planos). Uma entrada por projeto/ambiente em
+# uso; acima de PLAN_CACHE_SIZE a mais antiga sai.
+PLAN_CACHE_SIZE = 32
+_plan_cache: dict[tuple[str, tuple], tuple[int, dict, dict[str, RulePlan]]] = {}
+_plan_lock = threading.Lock()
+
+
+def _cached_key(thresholds: dict, path: str) -> tuple | None:
+    """
+    Chave da entrada compilada para este mesmo dict de thresholds (o do cache do
+    thresholds.py). Chamada com _plan_lock.
+    """
+    for (cached_path, key), (_, cached, _) in _plan_cache.items():
+        if cached is thresholds and cached_path == path:
+            return key
+    return None
+
+
+def load_rule_plans(thresholds: dict, path: str = RULES_PATH, key: tuple | None = None) -> dict[str, RulePlan]:
+    """
+    Planos compilados; so recompila se o rules.yaml ou as camadas de thresholds
+    mudarem. key: chave de mtime das camadas (tools.thresholds). Sem key, vale a
+    entrada ja compilada para o mesmo dict; thresholds fora do cache (montados a
+    mao) sao compilados sem guardar.
+    """
+    mtime = os.stat(path).st_mtime_ns
+    with _plan_lock:
+        if key is None:
+            key = _cached_key(thresholds, path)
+        cached = _plan_cache.get((path, key)) if key is not None else None
+        if cached and cached[0] == mtime:
+            return cached[2]
+        with open(path, encoding="utf-8") as f:
+            plans = compile_rules(yaml.safe_load(f), thresholds)
+        if key is not None:
+            _plan_cache.pop((path, key), None)
+            while len(_plan_cache) >= PLAN_CACHE_SIZE:
+                _plan_cache.pop(next(iter(_plan_cache)))
+            _plan_cache[(path, key)] = (mtime, thresholds, plans)
+    return plans
+
+
+def _column(records: list[dict], path: tuple[str, ...], scale: float) -> list[float]:
+    """Valores numericos de path em cada registro, ja escalados (NaN se ausente)."""
+    values = []
+    for record in records:
+        value = record
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values.append(value * scale)
+        else:
+            values.append(math.nan)
+    return values
+
+
+def _resource_name(record: dict, id_keys: tuple[str, ...]) -> str:
+    for key in id_keys:
+        if record.get(key):
+            return record[key]
+    return "unknown"
+
+
+def evaluate_plan(plan: RulePlan, records: list[dict]) -> list[dict]:
+    """Anomalias dos registros de um tipo, por recurso e na ordem das regras."""
+    if not records or not plan.rules:
+        return []
+    columns = [_column(records, path, scale) for path, scale in plan.columns]
+    indexes = range(len(records))
+
+    # Cada regra e aplicada a coluna inteira; o grupo guarda os recursos ja sinalizados
+    hits: list[tuple[int, int]] = []
+    fired: dict[str, set[int]] = {}
+    for r, rule in enumerate(plan.rules):
+        matched = compress(indexes, map(rule.compare, columns[rule.column], repeat(rule.limit)))
+        taken = fired.setdefault(rule.group, set())
+        for i in matched:
+            if i not in taken:
+                taken.add(i)
+                hits.append((i, r))
+    hits.sort()
+
+    anomalies = []
+    for i, r in hits:
+        rule = plan.rules[r]
+        resource = _resource_name(records[i], plan.id_keys)
+        value = f"{columns[rule.column][i]:.{rule.decimals}f}{rule.unit}"
+        anomalies.append({
+            "resource": resource,
+            "resource_type": plan.label,
+            "metric": rule.metric,
+            "value": value + rule.suffix,
+            "threshold": f"{rule.op} {rule.limit}{rule.unit}",
+            "severity": rule.severity,
+            "description": rule.description.format(resource=resource, value=value, metric=rule.metric),
+        })
+    return anomalies
+
+
+def evaluate_rules(kind: str, records: list[dict], thresholds: dict) -> list[dict]:
+    """Avalia os registros de um tipo de recurso contra as regras compiladas."""
+    plan = load_rule_plans(thresholds).get(kind)
+    return evaluate_plan(plan, records) if plan else []
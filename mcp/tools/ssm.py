@@ -2,19 +2,44 @@
 ssm.py — Execucao de comandos via AWS SSM Session Manager
 
 Executa comandos remotos em instancias EC2 via SSM SendCommand.
+As checagens de cada categoria vao num unico script (uma invocacao), com a
+saida de cada uma delimitada por marcadores e separada localmente; categorias
+rodam em paralelo e o polling usa backoff exponencial. A saida volta em
+gzip+base64, em blocos quando passa do limite de 24KB do SSM.
 Comandos configuráveis por tipo de diagnostico:
   - sistema: top, df, free, iostat
-  - mongodb: db.stats(), serverStatus, collections, indexes
-  - docker: docker stats, docker ps
+  - mongodb: serverStatus, replicacao, colecoes/indices e operacoes lentas (JSON)
+  - docker: docker ps, docker stats amostrado (JSON), throttling de CPU e limites
+  - amostragem (opcional): vmstat/iostat por segundo numa janela, com percentis
 """
 
+import base64
+import gzip
 import os
+import re
+import shlex
+import statistics
 import time
-import boto3
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from typing import Optional
 
+from tools.aws_clients import get_client
+from tools.docker_diagnostics import docker_check_command, docker_report_lines, parse_docker_stats
+from tools.host_sampling import (
+    DEFAULT_SAMPLE_SECONDS,
+    MAX_SAMPLE_SECONDS,
+    SAMPLING_CATEGORY,
+    SAMPLING_LABEL,
+    host_samples,
+    parse_host_samples,
+    sample_percentiles,
+    sampling_command,
+)
+from tools.mongo_diagnostics import mongo_check_command, mongo_report_lines, parse_mongo_diagnostics
+
 TZ_BR = timezone(timedelta(hours=-3))
 
 
@@ -28,56 +53,585 @@ DEFAULT_CHECKS = {
         ("iostat", "iostat -x 1 3 2>/dev/null || echo 'iostat nao disponivel'"),
         ("processos_top10", "ps aux --sort=-%cpu | head -15"),
     ],
+    # Um script mongosh com serverStatus, replicacao, colecoes e operacoes lentas em JSON
     "mongodb": [
-        ("mongo_stats", "mongosh --quiet --eval 'JSON.stringify(db.stats())' 2>/dev/null || mongo --quiet --eval 'JSON.stringify(db.stats())' 2>/dev/null || echo 'mongosh nao disponivel'"),
-        ("mongo_server_status", "mongosh --quiet --eval 'JSON.stringify(db.serverStatus().mem)' 2>/dev/null || mongo --quiet --eval 'JSON.stringify(db.serverStatus().mem)' 2>/dev/null || echo 'nao disponivel'"),
-        ("mongo_connections", "mongosh --quiet --eval 'JSON.stringify(db.serverStatus().connections)' 2>/dev/null || echo 'nao disponivel'"),
-        ("mongo_collections", "mongosh --quiet --eval 'db.getCollectionNames().forEach(function(c){var s=db.getCollection(c).stats();print(c+\": \"+s.size+\" bytes, \"+s.count+\" docs\")})' 2>/dev/null || echo 'nao disponivel'"),
-        ("mongo_wiredtiger", "mongosh --quiet --eval 'var s=db.serverStatus().wiredTiger.cache; print(\"cache bytes: \"+s[\"bytes currently in the cache\"]+\" / \"+s[\"maximum bytes configured\"])' 2>/dev/null || echo 'nao disponivel'"),
+        ("mongo_diagnostics", mongo_check_command()),
     ],
     "docker": [
         ("docker_ps", "docker ps --format 'table {{.Names}}\\t{{.Image}}\\t{{.Status}}\\t{{.Ports}}' 2>/dev/null || echo 'docker nao disponivel'"),
-        ("docker_stats", "docker stats --no-stream --format 'table {{.Name}}\\t{{.CPUPerc}}\\t{{.MemUsage}}\\t{{.NetIO}}\\t{{.BlockIO}}' 2>/dev/null || echo 'docker nao disponivel'"),
+        # docker stats em JSON amostrado na janela + throttling do cgroup + limites do inspect
+        ("docker_stats", docker_check_command()),
     ],
 }
 
 
-def run_ssm_command(
+# Prefixo das linhas que delimitam a saida de cada checagem no script unico
+CHECK_MARKER = "@@kanbania-check"
+
+# Timeout (s) de cada checagem no host; o script da categoria soma os timeouts
+DEFAULT_CHECK_TIMEOUT_S = 30
+CHECK_TIMEOUTS = {
+    "cpu_top": 15,
+    "iostat": 15,
+    "mongo_diagnostics": 120,
+    "docker_stats": 60,
+}
+# Apos o timeout, a checagem recebe SIGTERM e so e morta (SIGKILL) depois deste prazo
+CHECK_KILL_GRACE_S = 5
+# Folga do script alem das checagens (mktemp, compressao da saida, encerramento)
+SCRIPT_TIMEOUT_MARGIN_S = 10
+
+# Polling de get_command_invocation: backoff exponencial a partir de sub-segundo
+POLL_INITIAL_S = 0.25
+POLL_FACTOR = 1.6
+POLL_MAX_S = 5.0
+
+# Tempo alem do TimeoutSeconds para entrega ao agente SSM e publicacao do resultado
+DELIVERY_GRACE_S = 30
+
+# Invocacoes SSM acompanhadas em paralelo
+DEFAULT_MAX_WORKERS = 8
+
+TERMINAL_STATUSES = ("Success", "Failed", "TimedOut", "Cancelled")
+
+# Modo frota: SendCommand com Targets aceita ate 50 IDs por envio
+FLEET_TARGET_IDS_LIMIT = 50
+FLEET_MAX_CONCURRENCY = "10"
+FLEET_MAX_ERRORS = "25%"
+
+# Status do comando (ListCommands) em que todas as invocacoes ja terminaram
+COMMAND_DONE_STATUSES = ("Success", "Failed", "TimedOut", "Cancelled")
+
+# Transporte comprimido: StandardOutputContent e truncado em 24000 caracteres;
+# a saida vai como gzip+base64 e o que passar de um bloco e lido em outras invocacoes
+TRANSPORT_DIR = "/tmp"
+TRANSPORT_PREFIX = "kanbania-ssm-"
+TRANSPORT_CHUNK_CHARS = 23000
+TRANSPORT_CHUNK_TIMEOUT_S = 30
+
+
+def _error_code(exc: Exception) -> str:
+    return getattr(exc, "response", {}).get("Error", {}).get("Code", "")
+
+
+def _poll_backoff(deadline: float):
+    """Espera entre consultas com backoff exponencial, ate o prazo (monotonic)."""
+    delay = POLL_INITIAL_S
+    while time.monotonic() < deadline:
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(POLL_MAX_S, delay * POLL_FACTOR)
+        yield
+
+
+def execute_command(
     ssm_client,
     instance_id: str,
-    command: str,
+    commands: list[str],
     timeout_seconds: int = 60,
-) -> str:
+) -> dict:
     """
-    Executa um comando via SSM SendCommand e retorna a saida.
+    Executa via SendCommand e acompanha a invocacao com backoff exponencial.
+    Retorna {'status', 'stdout', 'stderr', 'latency_s', 'command_id', 'instance_id'}.
+    status: status SSM, 'Timeout' (prazo local esgotado) ou 'Exception'.
     """
+    t0 = time.monotonic()
+    result = {"instance_id": instance_id, "command_id": "", "stdout": "", "stderr": ""}
     try:
         resp = ssm_client.send_command(
             InstanceIds=[instance_id],
             DocumentName="AWS-RunShellScript",
-            Parameters={"commands": [command]},
+            Parameters={"commands": commands},
             TimeoutSeconds=timeout_seconds,
         )
-        command_id = resp["Command"]["CommandId"]
-
-        # Aguarda conclusao
-        for _ in range(30):
-            time.sleep(2)
-            invocation = ssm_client.get_command_invocation(
-                CommandId=command_id,
-                InstanceId=instance_id,
+        result["command_id"] = command_id = resp["Command"]["CommandId"]
+
+        status = "Timeout"
+        for _ in _poll_backoff(t0 + timeout_seconds + DELIVERY_GRACE_S):
+            try:
+                invocation = ssm_client.get_command_invocation(CommandId=command_id, InstanceId=instance_id)
+            except Exception as e:
+                # Logo apos o SendCommand a invocacao pode ainda nao existir
+                if _error_code(e) == "InvocationDoesNotExist":
+                    continue
+                raise
+            if invocation["Status"] in TERMINAL_STATUSES:
+                status = invocation["Status"]
+                result["stdout"] = invocation.get("StandardOutputContent", "")
+                result["stderr"] = invocation.get("StandardErrorContent", "")
+                break
+        else:
+            result["stderr"] = f"Comando nao concluido em {timeout_seconds}s"
+    except Exception as e:
+        status = "Exception"
+        result["stderr"] = str(e)
+    result["status"] = status
+    result["latency_s"] = round(time.monotonic() - t0, 3)
+    return result
+
+
+def _elapsed_seconds(text: str) -> float | None:
+    """ExecutionElapsedTime do SSM (duracao ISO 8601, ex: 'PT1M2.5S') em segundos."""
+    match = re.fullmatch(r"PT(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?", text or "")
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0)
+
+
+def _invocation_result(ssm_client, command_id: str, instance_id: str) -> dict:
+    """Saida completa de uma instancia de um comando de frota."""
+    result = {"instance_id": instance_id, "command_id": command_id, "stdout": "", "stderr": "", "latency_s": 0.0}
+    try:
+        invocation = ssm_client.get_command_invocation(CommandId=command_id, InstanceId=instance_id)
+    except Exception as e:
+        result.update(status="Exception", stderr=str(e))
+        return result
+    status = invocation["Status"]
+    result["status"] = status if status in TERMINAL_STATUSES else "Timeout"
+    result["stdout"] = invocation.get("StandardOutputContent", "")
+    result["stderr"] = invocation.get("StandardErrorContent", "") or (
+        "" if status in TERMINAL_STATUSES else f"Invocacao ainda em {status}"
+    )
+    result["latency_s"] = _elapsed_seconds(invocation.get("ExecutionElapsedTime", "")) or 0.0
+    return result
+
+
+def _command_invocation_ids(ssm_client, command_id: str) -> list[str]:
+    """Instancias alcancadas por um comando (resolvidas pelo SSM no caso de tags)."""
+    instance_ids = []
+    kwargs = {"CommandId": command_id}
+    while True:
+        resp = ssm_client.list_command_invocations(**kwargs)
+        instance_ids += [inv["InstanceId"] for inv in resp.get("CommandInvocations", [])]
+        if not resp.get("NextToken"):
+            return instance_ids
+        kwargs["NextToken"] = resp["NextToken"]
+
+
+def execute_fleet_command(
+    ssm_client,
+    targets: list[dict],
+    commands: list[str],
+    timeout_seconds: int = 60,
+    max_concurrency: str = FLEET_MAX_CONCURRENCY,
+    max_errors: str = FLEET_MAX_ERRORS,
+    fetch_pool: ThreadPoolExecutor | None = None,
+) -> dict[str, dict]:
+    """
+    Um SendCommand para varios alvos (Targets + MaxConcurrency/MaxErrors).
+    Acompanha o comando com backoff e busca a saida de cada instancia em paralelo.
+    Retorna {instance_id: resultado no formato de execute_command}.
+    """
+    resp = ssm_client.send_command(
+        Targets=targets,
+        DocumentName="AWS-RunShellScript",
+        Parameters={"commands": commands},
+        TimeoutSeconds=timeout_seconds,
+        MaxConcurrency=max_concurrency,
+        MaxErrors=max_errors,
+    )
+    command_id = resp["Command"]["CommandId"]
+
+    # Com MaxConcurrency as instancias rodam em ondas: o prazo avanca enquanto ha progresso
+    deadline = time.monotonic() + timeout_seconds + DELIVERY_GRACE_S
+    completed = -1
+    for _ in _poll_backoff(float("inf")):
+        command = ssm_client.list_commands(CommandId=command_id)["Commands"][0]
+        if command["Status"] in COMMAND_DONE_STATUSES:
+            break
+        if command.get("CompletedCount", 0) > completed:
+            completed = command.get("CompletedCount", 0)
+            deadline = time.monotonic() + timeout_seconds + DELIVERY_GRACE_S
+        elif time.monotonic() >= deadline:
+            break
+
+    instance_ids = _command_invocation_ids(ssm_client, command_id)
+    if fetch_pool is None:
+        results = [_invocation_result(ssm_client, command_id, iid) for iid in instance_ids]
+    else:
+        results = list(fetch_pool.map(lambda iid: _invocation_result(ssm_client, command_id, iid), instance_ids))
+    return dict(zip(instance_ids, results))
+
+
+class SsmEngine:
+    """
+    Despacha comandos SSM independentes em paralelo (thread pool) e acompanha
+    cada invocacao com backoff; cada resultado traz a latencia do comando.
+    Comandos de frota usam um pool separado para buscar a saida das instancias.
+    """
+
+    def __init__(self, ssm_client, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.ssm = ssm_client
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._fetch_pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self) -> "SsmEngine":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def submit(self, instance_id: str, commands: list[str], timeout_seconds: int = 60) -> Future:
+        return self._pool.submit(execute_command, self.ssm, instance_id, commands, timeout_seconds)
+
+    def run(self, instance_id: str, commands: list[str], timeout_seconds: int = 60) -> dict:
+        return self.submit(instance_id, commands, timeout_seconds).result()
+
+    def submit_fleet(
+        self,
+        targets: list[dict],
+        commands: list[str],
+        timeout_seconds: int = 60,
+        max_concurrency: str = FLEET_MAX_CONCURRENCY,
+        max_errors: str = FLEET_MAX_ERRORS,
+    ) -> Future:
+        return self._pool.submit(
+            execute_fleet_command, self.ssm, targets, commands, timeout_seconds,
+            max_concurrency, max_errors, self._fetch_pool,
+        )
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        self._fetch_pool.shutdown(wait=True)
+
+
+def run_ssm_command(
+    ssm_client,
+    instance_id: str,
+    command: str,
+    timeout_seconds: int = 60,
+) -> str:
+    """
+    Executa um comando via SSM SendCommand e retorna a saida.
+    """
+    result = execute_command(ssm_client, instance_id, [command], timeout_seconds)
+    return _status_output(result)
+
+
+def _status_output(result: dict) -> str:
+    status = result["status"]
+    if status == "Success":
+        return result["stdout"].strip()
+    if status == "Exception":
+        return f"[EXCECAO] {result['stderr']}"
+    if status == "Timeout":
+        return f"[TIMEOUT] {result['stderr']}"
+    return f"[ERRO: {status}] {result['stderr']}"
+
+
+def _check_timeout(check: tuple) -> int:
+    """Timeout da checagem (categoria, label, comando[, timeout])."""
+    if len(check) > 3:
+        return check[3]
+    return CHECK_TIMEOUTS.get(check[1], DEFAULT_CHECK_TIMEOUT_S)
+
+
+def build_check_script(checks: list[tuple[str, str, str]], nonce: str, transport_path: str = "") -> list[str]:
+    """
+    Script unico com as checagens [(categoria, label, comando[, timeout])].
+    Cada checagem roda com timeout proprio; o stdout fica entre BEGIN e RC e o
+    stderr (so quando o exit code e diferente de zero) entre RC e END.
+    A linha RC traz exit code e duracao da checagem em ms.
+    Com transport_path, a saida e gravada no host e devolvida comprimida
+    (ver _transport_lines). Os arquivos temporarios sao criados so para o dono
+    (umask 077) e removidos pelo trap de EXIT, inclusive em erro ou sinal.
+    """
+    marker = f"{CHECK_MARKER}:{nonce}"
+    lines = ["umask 077", 'KB_ERR="$(mktemp)"', "kb_ms() { echo $(( $(date +%s%N) / 1000000 )); }"]
+    if transport_path:
+        # O .b64 so sobrevive quando maior que um bloco (KB_KEEP, ver _transport_lines)
+        lines += [
+            f"KB_OUT='{transport_path}'",
+            "KB_KEEP=''",
+            """trap 'rm -f "$KB_ERR" "$KB_OUT"; [ -n "$KB_KEEP" ] || rm -f "$KB_OUT.b64"' EXIT""",
+        ]
+    else:
+        lines.append("""trap 'rm -f "$KB_ERR"' EXIT""")
+    # Sem isso, HUP/INT/TERM encerram o bash sem executar o trap de EXIT
+    lines.append("trap 'exit 143' HUP INT TERM")
+    if transport_path:
+        lines.append('exec 3>&1 1>"$KB_OUT"')
+    for check in checks:
+        category, label, cmd = check[:3]
+        lines += [
+            f"echo '{marker}:BEGIN:{category}:{label}'",
+            "kb_t0=$(kb_ms)",
+            f'timeout -k {CHECK_KILL_GRACE_S} {_check_timeout(check)} bash -c {shlex.quote(cmd)} 2>"$KB_ERR"',
+            "kb_rc=$?",
+            f'echo; echo "{marker}:RC:$kb_rc:$(( $(kb_ms) - kb_t0 ))"',
+            '[ "$kb_rc" -ne 0 ] && cat "$KB_ERR"',
+            f"echo '{marker}:END'",
+        ]
+    if transport_path:
+        lines += _transport_lines(marker)
+    lines.append("exit 0")
+    return lines
+
+
+def _transport_lines(marker: str) -> list[str]:
+    """
+    Fim do script no transporte comprimido: gzip+base64 da saida, primeiro bloco
+    entre GZ:<tamanho> e GZEND. Se couber num bloco o trap de EXIT remove o
+    arquivo; senao KB_KEEP o deixa no host para fetch_transport_chunks. Sem
+    gzip/base64, a saida vai em texto.
+    """
+    return [
+        "exec 1>&3 3>&-",
+        f"find {TRANSPORT_DIR} -maxdepth 1 -name '{TRANSPORT_PREFIX}*' -mmin +60 -delete 2>/dev/null",
+        "if command -v gzip >/dev/null 2>&1 && command -v base64 >/dev/null 2>&1; then",
+        '  gzip -c "$KB_OUT" | base64 -w0 > "$KB_OUT.b64"',
+        '  kb_size=$(wc -c < "$KB_OUT.b64")',
+        f'  echo "{marker}:GZ:$kb_size"',
+        f'  head -c {TRANSPORT_CHUNK_CHARS} "$KB_OUT.b64"; echo',
+        f"  echo '{marker}:GZEND'",
+        f'  [ "$kb_size" -gt {TRANSPORT_CHUNK_CHARS} ] && KB_KEEP=1',
+        "else",
+        '  cat "$KB_OUT"',
+        "fi",
+    ]
+
+
+def _transport_path(nonce: str, category: str) -> str:
+    return f"{TRANSPORT_DIR}/{TRANSPORT_PREFIX}{nonce}-{category}"
+
+
+def parse_transport_header(output: str, nonce: str) -> tuple[int, str] | None:
+    """(tamanho total do base64, primeiro bloco) ou None se a saida veio em texto."""
+    marker = f"{CHECK_MARKER}:{nonce}:"
+    lines = output.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith(marker + "GZ:"):
+            total = int(line[len(marker) + 3:].strip())
+            if i + 2 < len(lines) and lines[i + 2] == marker + "GZEND":
+                return total, lines[i + 1].strip()
+            # Bloco sem GZEND: o proprio primeiro bloco foi truncado
+            return total, ""
+    return None
+
+
+def decode_transport(encoded: str) -> str:
+    return gzip.decompress(base64.b64decode(encoded)).decode("utf-8", errors="replace")
+
+
+def fetch_transport_chunks(engine: "SsmEngine", instance_id: str, path: str, first: str, total: int) -> str:
+    """
+    Le do host, em invocacoes paralelas, o restante do base64 a partir do fim
+    do primeiro bloco e remove o arquivo. Retorna o base64 completo.
+    """
+    offsets = range(len(first), total, TRANSPORT_CHUNK_CHARS)
+    futures = [
+        engine.submit(
+            instance_id,
+            [f"tail -c +{offset + 1} '{path}.b64' | head -c {TRANSPORT_CHUNK_CHARS}"],
+            TRANSPORT_CHUNK_TIMEOUT_S,
+        )
+        for offset in offsets
+    ]
+    chunks = [f.result() for f in futures]
+    engine.submit(instance_id, [f"rm -f '{path}.b64'"], TRANSPORT_CHUNK_TIMEOUT_S)
+    failed = [c for c in chunks if c["status"] != "Success"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} bloco(s) da saida comprimida falharam: {_status_output(failed[0])}")
+    encoded = first + "".join(c["stdout"].strip() for c in chunks)
+    if len(encoded) != total:
+        raise RuntimeError(f"saida comprimida incompleta: {len(encoded)} de {total} caracteres")
+    return encoded
+
+
+def _receive_output(
+    engine: "SsmEngine",
+    result: dict,
+    nonce: str,
+    category: str,
+    transport: dict,
+    checks: list[tuple] | None = None,
+) -> None:
+    """
+    Troca o stdout comprimido de uma invocacao pela saida original, buscando os
+    blocos restantes se preciso. Registra tamanhos em transport[categoria].
+    Falhas de transporte viram status 'TransportError'.
+    checks: checagens da categoria, quando a invocacao usou o transporte comprimido
+    (ver _rerun_uncompressed).
+    """
+    header = parse_transport_header(result["stdout"], nonce)
+    if header is None:
+        if checks and result["status"] == "TimedOut":
+            _rerun_uncompressed(engine, result, checks, nonce, category, transport)
+        return
+    total, first = header
+    try:
+        if not first:
+            raise RuntimeError("primeiro bloco da saida comprimida ausente")
+        encoded = first
+        if total > len(first):
+            encoded = fetch_transport_chunks(
+                engine, result["instance_id"], _transport_path(nonce, category), first, total,
             )
-            status = invocation["Status"]
-            if status in ("Success", "Failed", "TimedOut", "Cancelled"):
-                if status == "Success":
-                    return invocation.get("StandardOutputContent", "").strip()
+        result["stdout"] = decode_transport(encoded)
+    except Exception as e:
+        result.update(status="TransportError", stdout="", stderr=str(e))
+        return
+    transport[category] = {
+        "encoded_chars": total,
+        "raw_chars": len(result["stdout"]),
+        "chunks": 1 + len(range(len(first), total, TRANSPORT_CHUNK_CHARS)),
+    }
+
+
+def _rerun_uncompressed(
+    engine: "SsmEngine", result: dict, checks: list[tuple], nonce: str, category: str, transport: dict,
+) -> None:
+    """
+    No modo comprimido a saida so e enviada no fim do script: uma invocacao que
+    estoura o TimeoutSeconds volta vazia, inclusive para as checagens concluidas.
+    A categoria roda de novo sem compressao, que entrega o que terminar antes do
+    novo timeout; result passa a ser o da nova invocacao (latencias somadas).
+    """
+    retry = engine.submit(result["instance_id"], build_check_script(checks, nonce), _script_timeout(checks)).result()
+    retry["latency_s"] = round(result["latency_s"] + retry["latency_s"], 3)
+    result.update(retry)
+    transport[category] = {"retried_uncompressed": True}
+
+
+def split_check_output(
+    output: str,
+    checks: list[tuple[str, str, str]],
+    nonce: str,
+) -> tuple[dict[str, dict[str, str]], dict[str, dict[str, int]]]:
+    """
+    Separa a saida do script unico em {categoria: {label: saida}}.
+    Retorna tambem a duracao de cada checagem no host: {categoria: {label: ms}}.
+    """
+    marker = f"{CHECK_MARKER}:{nonce}:"
+    timeouts = {(check[0], check[1]): _check_timeout(check) for check in checks}
+    parsed: dict[tuple[str, str], str] = {}
+    durations: dict[str, dict[str, int]] = {}
+    current = None
+    stdout: list[str] = []
+    stderr: list[str] = []
+    rc = None
+    for line in output.splitlines():
+        if line.startswith(marker):
+            tag = line[len(marker):]
+            if tag.startswith("BEGIN:"):
+                category, _, label = tag[len("BEGIN:"):].partition(":")
+                current, stdout, stderr, rc = (category, label), [], [], None
+            elif tag.startswith("RC:") and current:
+                rc_text, _, ms = tag[len("RC:"):].partition(":")
+                rc = int(rc_text or 0)
+                if ms.lstrip("-").isdigit():
+                    durations.setdefault(current[0], {})[current[1]] = int(ms)
+            elif tag == "END" and current:
+                text = "\n".join(stdout).strip()
+                if rc == 0:
+                    parsed[current] = text
+                elif rc in (124, 137):
+                    # Exit code do timeout (124) ou do kill apos o prazo (137)
+                    partial = f"\n{text}" if text else ""
+                    parsed[current] = f"[TIMEOUT] checagem excedeu {timeouts.get(current)}s{partial}"
                 else:
-                    err = invocation.get("StandardErrorContent", "")
-                    return f"[ERRO: {status}] {err}"
+                    parsed[current] = f"[ERRO: exit {rc}] " + "\n".join(stderr).strip()
+                current = None
+            continue
+        if current:
+            (stdout if rc is None else stderr).append(line)
+
+    results: dict[str, dict[str, str]] = {}
+    for category, label, *_ in checks:
+        # Checagem sem END: a saida foi cortada (limite do SSM) ou o script parou antes
+        results.setdefault(category, {})[label] = parsed.get(
+            (category, label), "[INCOMPLETO] saida ausente ou truncada pelo SSM",
+        )
+    return results, durations
+
+
+def _selected_checks(checks: list[str] | None, sample_seconds: int = 0) -> dict[str, list[tuple]]:
+    """
+    Checagens por categoria: {categoria: [(categoria, label, comando[, timeout])]}.
+    sample_seconds > 0 (ou 'amostragem' em checks) inclui a amostragem do host.
+    """
+    if checks is None:
+        checks = list(DEFAULT_CHECKS.keys())
+    selected = {
+        category: [(category, label, cmd) for label, cmd in DEFAULT_CHECKS[category]]
+        for category in checks if category in DEFAULT_CHECKS
+    }
+    if sample_seconds > 0 or SAMPLING_CATEGORY in checks:
+        seconds = min(sample_seconds or DEFAULT_SAMPLE_SECONDS, MAX_SAMPLE_SECONDS)
+        selected[SAMPLING_CATEGORY] = [
+            (SAMPLING_CATEGORY, SAMPLING_LABEL, sampling_command(seconds), seconds + 20),
+        ]
+    return selected
+
+
+def _category_results(selected: list[tuple[str, str, str]], result: dict, nonce: str) -> tuple[dict, dict]:
+    """Resultados de uma invocacao de categoria; falhas da invocacao marcam as checagens sem saida."""
+    results, durations = split_check_output(result["stdout"], selected, nonce)
+    if result["status"] != "Success":
+        failure = _status_output(result)
+        for outputs in results.values():
+            for label, output in outputs.items():
+                if output.startswith("[INCOMPLETO]"):
+                    outputs[label] = failure
+    return results, durations
 
-        return "[TIMEOUT] Comando nao concluido em 60s"
-    except Exception as e:
-        return f"[EXCECAO] {str(e)}"
+
+def _script_timeout(selected: list[tuple[str, str, str]]) -> int:
+    """
+    TimeoutSeconds do script da categoria: pior caso de cada checagem (timeout mais
+    o prazo ate o SIGKILL) somado a folga do script.
+    """
+    return sum(_check_timeout(check) + CHECK_KILL_GRACE_S for check in selected) + SCRIPT_TIMEOUT_MARGIN_S
+
+
+def run_diagnostics_detailed(
+    instance_id: str,
+    aws_profile: str,
+    region: str,
+    checks: list[str] | None = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    compress: bool = True,
+    sample_seconds: int = 0,
+) -> tuple[dict[str, dict[str, str]], dict]:
+    """
+    Executa diagnosticos SSM na instancia: uma invocacao por categoria (checagens
+    da categoria em sequencia no mesmo script), categorias em paralelo.
+    compress: saida em gzip+base64, sem o limite de 24KB do SSM.
+    sample_seconds: janela da amostragem do host (0 = sem amostragem).
+    Retorna ({categoria: {label: output}}, latencia), com latencia =
+    {'invocations': {categoria: s}, 'checks': {categoria: {label: ms}},
+     'transport': {categoria: {'encoded_chars', 'raw_chars', 'chunks'}}}.
+    Categoria comprimida que estoura o timeout e repetida sem compressao
+    (transport: {'retried_uncompressed': True}).
+    """
+    by_category = _selected_checks(checks, sample_seconds)
+    results: dict[str, dict[str, str]] = {}
+    latency = {"invocations": {}, "checks": {}, "transport": {}}
+    if not by_category:
+        return results, latency
+
+    ssm = get_client(aws_profile, region, "ssm")
+    nonce = uuid.uuid4().hex[:12]
+    with SsmEngine(ssm, max_workers=max_workers) as engine:
+        futures = {
+            category: engine.submit(
+                instance_id,
+                build_check_script(selected, nonce, _transport_path(nonce, category) if compress else ""),
+                _script_timeout(selected),
+            )
+            for category, selected in by_category.items()
+        }
+        # Mantem a ordem das categorias pedidas
+        for category, future in futures.items():
+            result = future.result()
+            _receive_output(
+                engine, result, nonce, category, latency["transport"], by_category[category] if compress else None,
+            )
+            category_results, durations = _category_results(by_category[category], result, nonce)
+            results.update(category_results)
+            latency["invocations"][category] = result["latency_s"]
+            latency["checks"].update(durations)
+    return results, latency
 
 
 def run_diagnostics(
@@ -91,69 +645,198 @@ def run_diagnostics(
     checks: lista de categorias ['sistema', 'mongodb', 'docker'] — default: todas
     Retorna dict: {categoria: {label: output}}
     """
-    if checks is None:
-        checks = list(DEFAULT_CHECKS.keys())
+    return run_diagnostics_detailed(instance_id, aws_profile, region, checks)[0]
 
-    session = boto3.Session(profile_name=aws_profile, region_name=region)
-    ssm = session.client("ssm")
 
-    results = {}
-    for category in checks:
-        if category not in DEFAULT_CHECKS:
-            continue
-        results[category] = {}
-        for label, cmd in DEFAULT_CHECKS[category]:
-            output = run_ssm_command(ssm, instance_id, cmd)
-            results[category][label] = output
+def _fleet_targets(instance_ids: list[str] | None, target_tags: dict | None) -> list[list[dict]]:
+    """Targets de cada SendCommand: IDs em lotes de 50 ou um unico envio por tags."""
+    if instance_ids:
+        return [
+            [{"Key": "InstanceIds", "Values": instance_ids[i:i + FLEET_TARGET_IDS_LIMIT]}]
+            for i in range(0, len(instance_ids), FLEET_TARGET_IDS_LIMIT)
+        ]
+    if target_tags:
+        return [[
+            {"Key": f"tag:{key}", "Values": [values] if isinstance(values, str) else list(values)}
+            for key, values in target_tags.items()
+        ]]
+    raise ValueError("Informe instance_ids ou target_tags para o diagnostico de frota")
 
-    return results
 
+def run_fleet_diagnostics(
+    aws_profile: str,
+    region: str,
+    instance_ids: list[str] | None = None,
+    target_tags: dict | None = None,
+    checks: list[str] | None = None,
+    max_concurrency: str = FLEET_MAX_CONCURRENCY,
+    max_errors: str = FLEET_MAX_ERRORS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    compress: bool = True,
+    sample_seconds: int = 0,
+) -> tuple[dict[str, dict], dict[str, dict], list[dict]]:
+    """
+    Diagnostico de varias instancias: um SendCommand por categoria (e lote de
+    IDs) com Targets, categorias em paralelo e saidas buscadas em paralelo.
+    target_tags: {'Name': ['api-prd']} — alternativa a instance_ids.
+    compress: saida em gzip+base64; blocos excedentes lidos por instancia.
+    sample_seconds: janela da amostragem do host (0 = sem amostragem).
+    Retorna ({instance_id: {categoria: {label: output}}}, {instance_id: latencia}, erros).
+    """
+    by_category = _selected_checks(checks, sample_seconds)
+    results: dict[str, dict] = {iid: {} for iid in instance_ids or []}
+    latency: dict[str, dict] = {}
+    errors: list[dict] = []
+    if not by_category:
+        return results, latency, errors
 
-def build_ssm_report(
-    instance_id: str,
-    environment: str,
-    results: dict[str, dict[str, str]],
-) -> str:
-    """Constroi o markdown do diagnostico SSM."""
-    now = datetime.now(TZ_BR)
+    ssm = get_client(aws_profile, region, "ssm")
+    nonce = uuid.uuid4().hex[:12]
+    with SsmEngine(ssm, max_workers=max_workers) as engine:
+        futures = [
+            (category, engine.submit_fleet(
+                targets,
+                build_check_script(selected, nonce, _transport_path(nonce, category) if compress else ""),
+                _script_timeout(selected),
+                max_concurrency, max_errors,
+            ))
+            for category, selected in by_category.items()
+            for targets in _fleet_targets(instance_ids, target_tags)
+        ]
+        for category, future in futures:
+            try:
+                per_instance = future.result()
+            except Exception as e:
+                errors.append({"category": category, "error": str(e)})
+                continue
+            for iid, result in per_instance.items():
+                inst_latency = latency.setdefault(iid, {"invocations": {}, "checks": {}, "transport": {}})
+                _receive_output(
+                    engine, result, nonce, category, inst_latency["transport"],
+                    by_category[category] if compress else None,
+                )
+                category_results, durations = _category_results(by_category[category], result, nonce)
+                results.setdefault(iid, {}).update(category_results)
+                inst_latency["invocations"][category] = result["latency_s"]
+                inst_latency["checks"].update(durations)
+    return results, latency, errors
+
+
+SECTION_TITLES = {
+    "sistema": "Estado do Sistema",
+    "mongodb": "MongoDB",
+    "docker": "Docker",
+    SAMPLING_CATEGORY: "Amostragem do Host",
+}
+
+SAMPLE_LABELS = {
+    "cpu_busy": "CPU %",
+    "iowait": "iowait %",
+    "run_queue": "Fila de execucao",
+    "run_queue_per_cpu": "Fila por vCPU",
+    "disk_util": "Disco %util (max)",
+}
 
-    section_titles = {
-        "sistema": "Estado do Sistema",
-        "mongodb": "MongoDB",
-        "docker": "Docker",
-    }
 
+def _samples_lines(output: str) -> list[str]:
+    """Tabela de percentis da amostragem (a serie bruta fica no retorno da tool)."""
+    stats = sample_percentiles(parse_host_samples(output))
+    if not stats:
+        return [f"```", output or "(sem saida)", f"```", f""]
     lines = [
-        f"# Diagnostico via SSM",
-        f"",
-        f"**Instancia:** `{instance_id}`  ",
-        f"**Ambiente:** {environment.upper()}  ",
-        f"**Data:** {now.strftime('%Y-%m-%d %H:%M')} (BRT)  ",
-        f"",
-        f"---",
-        f"",
+        f"| Serie | p50 | p90 | p99 | Max | Amostras |",
+        f"|---|---|---|---|---|---|",
     ]
+    for name, st in stats.items():
+        lines.append(
+            f"| {SAMPLE_LABELS.get(name, name)} | {st['p50']:g} | {st['p90']:g} | {st['p99']:g} "
+            f"| {st['max']:g} | {st['samples']} |"
+        )
+    lines.append("")
+    return lines
+
 
+def _results_lines(results: dict[str, dict[str, str]], h: str = "##") -> list[str]:
+    """Secoes markdown com a saida de cada checagem, por categoria."""
+    lines = []
     for category, commands in results.items():
-        title = section_titles.get(category, category.title())
+        title = SECTION_TITLES.get(category, category.title())
         lines += [
-            f"## {title}",
+            f"{h} {title}",
             f"",
         ]
         for label, output in commands.items():
             display_label = label.replace("_", " ").title()
+            if category == SAMPLING_CATEGORY and not output.startswith("["):
+                lines += [f"{h}# {display_label}", f""] + _samples_lines(output)
+                continue
+            mongo = parse_mongo_diagnostics(output) if label == "mongo_diagnostics" else None
+            if mongo is not None:
+                lines += [f"{h}# {display_label}", f""] + mongo_report_lines(mongo)
+                continue
+            containers = parse_docker_stats(output) if label == "docker_stats" else None
+            if containers is not None:
+                lines += [f"{h}# {display_label}", f""] + docker_report_lines(containers)
+                continue
             lines += [
-                f"### {display_label}",
+                f"{h}# {display_label}",
                 f"",
                 f"```",
                 output if output else "(sem saida)",
                 f"```",
                 f"",
             ]
+    return lines
+
+
+def build_ssm_report(
+    instance_id: str,
+    environment: str,
+    results: dict[str, dict[str, str]],
+    latency: dict | None = None,
+) -> str:
+    """Constroi o markdown do diagnostico SSM (com latencias, se informadas)."""
+    now = datetime.now(TZ_BR)
+
+    lines = [
+        f"# Diagnostico via SSM",
+        f"",
+        f"**Instancia:** `{instance_id}`  ",
+        f"**Ambiente:** {environment.upper()}  ",
+        f"**Data:** {now.strftime('%Y-%m-%d %H:%M')} (BRT)  ",
+        f"",
+        f"---",
+        f"",
+    ]
+    lines += _results_lines(results)
+
+    if latency and latency.get("invocations"):
+        lines += _latency_section(latency)
 
     return "\n".join(lines)
 
 
+def _latency_section(latency: dict) -> list[str]:
+    """Tabela com a latencia de cada invocacao SSM e a duracao das checagens no host."""
+    lines = [
+        f"---",
+        f"",
+        f"## Latencia da Coleta",
+        f"",
+        f"| Categoria | Invocacao SSM (s) | Checagem mais lenta | Duracao no host (s) |",
+        f"|---|---|---|---|",
+    ]
+    for category, seconds in latency["invocations"].items():
+        durations = latency["checks"].get(category, {})
+        slowest = max(durations, key=durations.get) if durations else None
+        slowest_label = slowest.replace("_", " ").title() if slowest else "—"
+        slowest_s = f"{durations[slowest] / 1000:.2f}" if slowest else "—"
+        title = SECTION_TITLES.get(category, category.title())
+        lines.append(f"| {title} | {seconds:.2f} | {slowest_label} | {slowest_s} |")
+    lines.append("")
+    return lines
+
+
 def run_ssm_diagnose(
     project: str,
     aws_profile: str,
@@ -162,13 +845,17 @@ def run_ssm_diagnose(
     instance_id: str,
     docs_dir: str,
     checks: list[str] | None = None,
+    compress: bool = True,
+    sample_seconds: int = 0,
 ) -> dict:
     """
     Executa diagnostico SSM completo e salva diagnostico-ssm.md.
     Retorna dict com caminho do arquivo e resultados brutos.
     """
-    results = run_diagnostics(instance_id, aws_profile, region, checks)
-    report_md = build_ssm_report(instance_id, environment, results)
+    results, latency = run_diagnostics_detailed(
+        instance_id, aws_profile, region, checks, compress=compress, sample_seconds=sample_seconds,
+    )
+    report_md = build_ssm_report(instance_id, environment, results, latency)
 
     os.makedirs(docs_dir, exist_ok=True)
     output_path = os.path.join(docs_dir, "diagnostico-ssm.md")
@@ -178,4 +865,185 @@ def run_ssm_diagnose(
         "output_path": output_path,
         "instance_id": instance_id,
         "results": results,
+        "samples": host_samples(results),
+        "latency": latency,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Comparativo da frota
+# ---------------------------------------------------------------------------
+
+# Metricas do comparativo: (chave, titulo, delta minimo acima da mediana para destaque)
+HOST_METRICS = [
+    ("load_1m", "Load 1m", 1.0),
+    ("mem_pct", "Memoria %", 15.0),
+    ("disk_max_pct", "Disco max %", 15.0),
+]
+
+# Destaque: valor >= mediana da frota x fator e acima dela pelo delta da metrica
+OUTLIER_FACTOR = 1.5
+
+# Sistemas de arquivo fora do "maior uso de disco" (sempre 100% ou espelho da raiz)
+IGNORED_FILESYSTEMS = ("tmpfs", "devtmpfs", "overlay", "shm", "squashfs", "/dev/loop")
+
+_SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4, "P": 1024 ** 5}
+
+
+def _size_bytes(text: str) -> float | None:
+    """Tamanho do free -h ('7.6Gi', '512M', '0B') em bytes."""
+    match = re.fullmatch(r"([\d.,]+)([KMGTP]?)i?B?", text)
+    if not match:
+        return None
+    return float(match.group(1).replace(",", ".")) * _SIZE_UNITS[match.group(2)]
+
+
+def host_summary(results: dict[str, dict[str, str]]) -> dict[str, float | None]:
+    """Load 1m, memoria usada % e maior uso de disco % a partir das checagens de sistema."""
+    sistema = results.get("sistema", {})
+    summary = {key: None for key, _, _ in HOST_METRICS}
+
+    match = re.search(r"load averages?:\s*(\d+[.,]\d+)", sistema.get("uptime", ""))
+    if match:
+        summary["load_1m"] = float(match.group(1).replace(",", "."))
+
+    for line in sistema.get("memoria", "").splitlines():
+        fields = line.split()
+        if len(fields) >= 3 and fields[0] == "Mem:":
+            total, used = _size_bytes(fields[1]), _size_bytes(fields[2])
+            if total and used is not None:
+                summary["mem_pct"] = round(used / total * 100, 1)
+            break
+
+    usages = [
+        int(field[:-1])
+        for line in sistema.get("disco", "").splitlines()[1:]
+        if not line.startswith(IGNORED_FILESYSTEMS)
+        for field in line.split()
+        if field.endswith("%") and field[:-1].isdigit()
+    ]
+    if usages:
+        summary["disk_max_pct"] = float(max(usages))
+    return summary
+
+
+def _outliers(summaries: dict[str, dict]) -> set[tuple[str, str]]:
+    """(instance_id, metrica) com valor bem acima da mediana da frota."""
+    flagged = set()
+    for key, _, delta in HOST_METRICS:
+        values = {iid: s[key] for iid, s in summaries.items() if s[key] is not None}
+        if len(values) < 2:
+            continue
+        median = statistics.median(values.values())
+        for iid, value in values.items():
+            if value >= median * OUTLIER_FACTOR and value - median >= delta:
+                flagged.add((iid, key))
+    return flagged
+
+
+def _fleet_status(results: dict[str, dict[str, str]]) -> str:
+    outputs = [o for commands in results.values() for o in commands.values()]
+    if not outputs:
+        return "sem resposta"
+    failed = sum(1 for o in outputs if o.startswith(("[ERRO", "[TIMEOUT", "[EXCECAO", "[INCOMPLETO")))
+    return "ok" if not failed else f"{failed} falha(s)"
+
+
+def build_fleet_report(
+    environment: str,
+    results: dict[str, dict],
+    latency: dict[str, dict],
+    errors: list[dict] | None = None,
+    selector: str = "",
+) -> str:
+    """Markdown consolidado da frota: comparativo por instancia e saida de cada uma."""
+    now = datetime.now(TZ_BR)
+    summaries = {iid: host_summary(r) for iid, r in results.items()}
+    flagged = _outliers(summaries)
+
+    lines = [
+        f"# Diagnostico via SSM — Frota",
+        f"",
+        f"**Instancias:** {len(results)}  ",
+        f"**Selecao:** {selector or '—'}  ",
+        f"**Ambiente:** {environment.upper()}  ",
+        f"**Data:** {now.strftime('%Y-%m-%d %H:%M')} (BRT)  ",
+        f"",
+        f"---",
+        f"",
+        f"## Comparativo por Instancia",
+        f"",
+        f"Valores em **negrito** estao bem acima da mediana da frota "
+        f"(>= {OUTLIER_FACTOR}x a mediana).",
+        f"",
+        f"| Instancia | Status | {' | '.join(title for _, title, _ in HOST_METRICS)} | Invocacao max (s) |",
+        f"|---|---|{'---|' * len(HOST_METRICS)}---|",
+    ]
+    for iid, summary in summaries.items():
+        cells = []
+        for key, _, _ in HOST_METRICS:
+            value = summary[key]
+            cell = "—" if value is None else f"{value:g}"
+            cells.append(f"**{cell}**" if (iid, key) in flagged else cell)
+        invocations = latency.get(iid, {}).get("invocations", {})
+        slowest = f"{max(invocations.values()):.2f}" if invocations else "—"
+        lines.append(f"| `{iid}` | {_fleet_status(results[iid])} | {' | '.join(cells)} | {slowest} |")
+    lines.append("")
+
+    if errors:
+        lines += [f"**Falhas de envio:**", f""]
+        lines += [f"- {SECTION_TITLES.get(e['category'], e['category'])}: {e['error']}" for e in errors]
+        lines.append("")
+
+    for iid, instance_results in results.items():
+        lines += [
+            f"---",
+            f"",
+            f"## Instancia `{iid}`",
+            f"",
+        ]
+        lines += _results_lines(instance_results, h="###")
+    return "\n".join(lines)
+
+
+def run_ssm_fleet_diagnose(
+    project: str,
+    aws_profile: str,
+    region: str,
+    environment: str,
+    docs_dir: str,
+    instance_ids: list[str] | None = None,
+    target_tags: dict | None = None,
+    checks: list[str] | None = None,
+    max_concurrency: str = FLEET_MAX_CONCURRENCY,
+    max_errors: str = FLEET_MAX_ERRORS,
+    compress: bool = True,
+    sample_seconds: int = 0,
+) -> dict:
+    """
+    Executa diagnostico SSM em varias instancias e salva um diagnostico-ssm.md consolidado.
+    Retorna dict com caminho do arquivo, resultados por instancia e comparativo.
+    """
+    results, latency, errors = run_fleet_diagnostics(
+        aws_profile, region, instance_ids, target_tags, checks, max_concurrency, max_errors,
+        compress=compress, sample_seconds=sample_seconds,
+    )
+    if instance_ids:
+        selector = f"{len(instance_ids)} instancia(s) informada(s)"
+    else:
+        selector = ", ".join(f"tag:{k}={v if isinstance(v, str) else ','.join(v)}" for k, v in target_tags.items())
+    report_md = build_fleet_report(environment, results, latency, errors, selector)
+
+    os.makedirs(docs_dir, exist_ok=True)
+    output_path = os.path.join(docs_dir, "diagnostico-ssm.md")
+    Path(output_path).write_text(report_md, encoding="utf-8")
+
+    return {
+        "output_path": output_path,
+        "instance_ids": list(results),
+        "results": results,
+        "summary": {iid: host_summary(r) for iid, r in results.items()},
+        "samples": {iid: host_samples(r) for iid, r in results.items()},
+        "latency": latency,
+        "errors": errors,
     }
@@ -0,0 +1,208 @@
+"""
+terraform_state.py — Leitura rapida de IDs de recursos em states Terraform locais
+
+Percorre o repositorio com os.walk ignorando diretorios que nunca contem state
+do projeto (.terraform, node_modules, .git...), le cada .tfstate de forma
+incremental (o array "resources" e decodificado um recurso por vez, sem
+carregar o arquivo inteiro) e guarda os IDs extraidos em cache JSON indexado
+por caminho + mtime + tamanho: states inalterados nao sao relidos.
+"""
+
+import json
+import os
+
+# Diretorios ignorados na busca por .tfstate
+PRUNE_DIRS = {".terraform", ".terragrunt-cache", "node_modules", ".git", ".venv", "venv", "__pycache__"}
+
+# Tipo Terraform -> (tipo do inventario, atributo com o ID usado na AWS)
+RESOURCE_TYPES = {
+    "aws_instance": ("ec2", "id"),
+    "aws_ebs_volume": ("ebs", "id"),
+    "aws_lb": ("alb", "arn"),
+    "aws_alb": ("alb", "arn"),
+    "aws_db_instance": ("rds", "identifier"),
+}
+
+KINDS = ("ec2", "alb", "ebs", "rds")
+
+CHUNK_SIZE = 1024 * 1024
+
+_WS = " \t\n\r"
+
+
+def find_state_files(repo_path: str) -> list[str]:
+    """Caminhos dos .tfstate do repositorio, sem descer em diretorios ignorados."""
+    found = []
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = [d for d in dirs if d not in PRUNE_DIRS]
+        for name in files:
+            if name.endswith(".tfstate"):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+class _JsonStream:
+    """Leitor incremental de JSON: decodifica valores a partir de um buffer que cresce sob demanda."""
+
+    def __init__(self, f):
+        self._f = f
+        self._decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        # Leitura cresce com o buffer: valores grandes custam tempo linear
+        chunk = self._f.read(max(CHUNK_SIZE, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Proximo caractere nao branco (sem consumir); '' no fim do arquivo."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"esperado {char!r} na posicao {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decodifica o proximo valor JSON completo."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+                # Numero no fim do buffer pode estar truncado: so aceita com mais texto depois
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._fill():
+                obj, end = self._decoder.raw_decode(self.buf, self.pos)
+                self.pos = end
+                return obj
+
+    def skip_comma(self) -> bool:
+        """Consome ',' se houver; retorna False no fechamento do objeto/array."""
+        if self.peek() == ",":
+            self.pos += 1
+            return True
+        return False
+
+
+def _add_resource(ids: dict[str, set], res: dict) -> None:
+    mapping = RESOURCE_TYPES.get(res.get("type", ""))
+    if mapping is None or res.get("mode", "managed") != "managed":
+        return
+    kind, attr = mapping
+    for inst in res.get("instances", []):
+        value = inst.get("attributes", {}).get(attr)
+        if value:
+            ids[kind].add(value)
+
+
+def _add_legacy_modules(ids: dict[str, set], modules: list) -> None:
+    """State v3 (Terraform < 0.12): modules[].resources{nome: {type, primary}}."""
+    for module in modules or []:
+        for res in (module.get("resources") or {}).values():
+            mapping = RESOURCE_TYPES.get(res.get("type", ""))
+            if mapping is None:
+                continue
+            kind, attr = mapping
+            primary = res.get("primary", {})
+            value = primary.get("attributes", {}).get(attr) or (primary.get("id") if attr == "id" else None)
+            if value:
+                ids[kind].add(value)
+
+
+def parse_state_ids(path: str) -> dict[str, set]:
+    """IDs por tipo do inventario extraidos de um .tfstate, lendo o array de recursos em fluxo."""
+    ids = {kind: set() for kind in KINDS}
+    with open(path, encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return ids
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == "resources" and stream.peek() == "[":
+                stream.expect("[")
+                if stream.peek() != "]":
+                    while True:
+                        _add_resource(ids, stream.value())
+                        if not stream.skip_comma():
+                            break
+                stream.expect("]")
+            elif key == "modules":
+                _add_legacy_modules(ids, stream.value())
+            else:
+                stream.value()
+            if not stream.skip_comma():
+                break
+        stream.expect("}")
+    return ids
+
+
+def scan_terraform_ids(repo_path: str, cache_path: str = "") -> dict[str, set]:
+    """
+    IDs de todos os states do repositorio, por tipo: {'ec2', 'alb', 'ebs', 'rds'}.
+    Com cache_path, states com mesmo mtime e tamanho nao sao relidos.
+    """
+    ids = {kind: set() for kind in KINDS}
+    if not repo_path:
+        return ids
+
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+    entries = {}
+    for path in find_state_files(repo_path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        key = os.path.abspath(path)
+        entry = cache.get(key)
+        if not entry or entry.get("mtime_ns") != st.st_mtime_ns or entry.get("size") != st.st_size:
+            try:
+                parsed = parse_state_ids(path)
+            except (OSError, ValueError):
+                continue
+            entry = {
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
+                "ids": {kind: sorted(values) for kind, values in parsed.items()},
+            }
+        entries[key] = entry
+        for kind in KINDS:
+            ids[kind].update(entry["ids"].get(kind, []))
+
+    if cache_path:
+        # Entradas de outros repositorios continuam; as deste so se o arquivo ainda existe
+        root = os.path.abspath(repo_path) + os.sep
+        kept = {k: v for k, v in cache.items() if not k.startswith(root)}
+        kept.update(entries)
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(kept, f)
+    return ids
@@ -0,0 +1,148 @@
+"""
+thresholds.py — Thresholds de alerta com sobrescritas por projeto/ambiente
+
+Camadas, da menor para a maior precedencia (cada uma opcional, exceto a base):
+  config/thresholds.yaml
+  config/thresholds.d/environments/<ambiente>.yaml
+  config/thresholds.d/projects/<projeto>.yaml
+  config/thresholds.d/projects/<projeto>.<ambiente>.yaml
+
+As sobrescritas sao mescladas por secao (so as chaves informadas mudam). O
+resultado e validado na carga (tipos, chaves conhecidas, warning <= critical e
+compilacao das regras) e fica em cache ate algum dos arquivos mudar (mtime).
+"""
+
+import os
+import threading
+
+import yaml
+
+from tools.host_sampling import SAMPLE_PERCENTILES
+from tools.rules import load_rule_plans
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), "..", "config")
+DEFAULTS_PATH = os.path.join(CONFIG_DIR, "thresholds.yaml")
+OVERRIDES_DIR = os.path.join(CONFIG_DIR, "thresholds.d")
+
+# Chaves com valor textual; todas as demais sao numericas
+TEXT_KEYS = {("host", "percentile"): {f"p{q}" for q in SAMPLE_PERCENTILES}}
+
+_cache: dict[tuple[str, str], tuple[tuple, dict, list[str]]] = {}
+_lock = threading.Lock()
+
+
+def threshold_layers(project: str = "", environment: str = "") -> list[str]:
+    """Caminhos das camadas aplicaveis, na ordem de aplicacao (existentes ou nao)."""
+    layers = [DEFAULTS_PATH]
+    if environment:
+        layers.append(os.path.join(OVERRIDES_DIR, "environments", f"{environment}.yaml"))
+    if project:
+        layers.append(os.path.join(OVERRIDES_DIR, "projects", f"{project}.yaml"))
+        if environment:
+            layers.append(os.path.join(OVERRIDES_DIR, "projects", f"{project}.{environment}.yaml"))
+    return layers
+
+
+def _mtime(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _read_layer(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+    except yaml.YAMLError as e:
+        raise ValueError(f"{path}: YAML invalido: {e}") from e
+    if config is None:
+        return {}
+    if not isinstance(config, dict):
+        raise ValueError(f"{path}: esperado um mapeamento secao -> limites")
+    return config
+
+
+def _check_layer(config: dict, path: str, known: dict | None = None) -> None:
+    """Tipos de cada valor; em sobrescritas (known), so secoes e chaves da base."""
+    for section, values in config.items():
+        if not isinstance(values, dict):
+            raise ValueError(f"{path}: secao '{section}' deve ser um mapeamento")
+        if known is not None and section not in known:
+            raise ValueError(f"{path}: secao desconhecida '{section}'")
+        for key, value in values.items():
+            where = f"{path}: {section}.{key}"
+            if known is not None and key not in known[section]:
+                raise ValueError(f"{where}: chave desconhecida")
+            accepted = TEXT_KEYS.get((section, key))
+            if accepted is not None:
+                if value not in accepted:
+                    raise ValueError(f"{where}: valor '{value}' invalido (aceitos: {', '.join(sorted(accepted))})")
+            elif not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError(f"{where}: valor numerico esperado, recebido '{value}'")
+            elif value < 0:
+                raise ValueError(f"{where}: valor negativo ({value})")
+
+
+def _check_merged(thresholds: dict, sources: list[str], layers_key: tuple) -> None:
+    """
+    Coerencia do resultado final: warning <= critical e regras compilaveis. Os
+    planos compilados ficam no cache do rules.py sob a chave de mtime das camadas.
+    """
+    origin = " + ".join(os.path.basename(s) for s in sources)
+    for section, values in thresholds.items():
+        for key, warning in values.items():
+            if "_warning" not in key:
+                continue
+            critical = values.get(key.replace("_warning", "_critical"))
+            if isinstance(critical, (int, float)) and warning > critical:
+                raise ValueError(
+                    f"{origin}: {section}.{key} ({warning}) maior que "
+                    f"{section}.{key.replace('_warning', '_critical')} ({critical})"
+                )
+    rules_path = os.path.join(CONFIG_DIR, "rules.yaml")
+    if os.path.exists(rules_path):
+        try:
+            load_rule_plans(thresholds, rules_path, layers_key)
+        except ValueError as e:
+            raise ValueError(f"{origin}: {e}") from e
+
+
+def load_thresholds(project: str = "", environment: str = "") -> dict:
+    """
+    Thresholds efetivos de um projeto/ambiente. O dict retornado e compartilhado
+    pelo cache e nao deve ser alterado. Configuracao invalida levanta ValueError.
+    """
+    thresholds, _ = _load(project, environment)
+    return thresholds
+
+
+def threshold_sources(project: str = "", environment: str = "") -> list[str]:
+    """Arquivos que compuseram os thresholds efetivos (base + sobrescritas existentes)."""
+    _, sources = _load(project, environment)
+    return sources
+
+
+def _load(project: str, environment: str) -> tuple[dict, list[str]]:
+    layers = threshold_layers(project, environment)
+    key = tuple((path, _mtime(path)) for path in layers)
+    cached = _cache.get((project, environment))
+    if cached and cached[0] == key:
+        return cached[1], cached[2]
+
+    with _lock:
+        base = _read_layer(DEFAULTS_PATH)
+        _check_layer(base, DEFAULTS_PATH)
+        thresholds = {section: dict(values) for section, values in base.items()}
+        sources = [DEFAULTS_PATH]
+        for path, mtime in key[1:]:
+            if mtime is None:
+                continue
+            override = _read_layer(path)
+            _check_layer(override, path, known=base)
+            for section, values in override.items():
+                thresholds[section].update(values)
+            sources.append(path)
+        _check_merged(thresholds, sources, key)
+        _cache[(project, environment)] = (key, thresholds, sources)
+    return thresholds, sources